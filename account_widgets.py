@@ -5,6 +5,7 @@ import customtkinter as ctk
 from datetime import datetime, timedelta
 from . import utils
 from . import auth
+from . import license_monitor
 
 def _create_account_frame(app):
     """Khung Tài khoản - Hiển thị thông tin user"""
@@ -37,8 +38,36 @@ def _create_account_frame(app):
     button_container.grid(row=2, column=0, pady=(0, 30), sticky="s")
     
     # Hàm để cập nhật thông tin
-    def update_account_info():
-        """Cập nhật thông tin tài khoản - REAL-TIME CHECK với server"""
+    def update_account_info(force=False):
+        """
+        Cập nhật thông tin tài khoản từ trạng thái license dùng chung (license_monitor.state).
+        Kết quả còn mới thì hiển thị ngay; nếu không, làm mới ở luồng nền (force=True: luôn hỏi lại
+        server) và hiển thị khi có kết quả - không gọi API trên luồng GUI.
+        """
+        snapshot = license_monitor.state.get(max_age=0 if force else None)
+        if snapshot is not None:
+            render_account_info(snapshot)
+            return
+        
+        if not content_frame.winfo_children():
+            loading_label = ctk.CTkLabel(
+                content_frame,
+                text="⏳ Đang kiểm tra thông tin tài khoản với server...",
+                font=ctk.CTkFont(size=16),
+                text_color=utils.COLOR_GRAY_ACCENT
+            )
+            loading_label.pack(pady=20)
+        refresh_button.configure(state="disabled")
+        license_monitor.state.refresh_async(app.auth_manager, max_age=0 if force else None)
+    
+    def on_license_state(snapshot):
+        """Kết quả mới (từ khởi động, kiểm tra định kỳ hoặc nút Làm mới) - gọi từ luồng nền."""
+        if app.is_running:
+            app.after(0, lambda: render_account_info(snapshot))
+    
+    def render_account_info(snapshot):
+        """Hiển thị thông tin tài khoản với một kết quả kiểm tra (chạy trên luồng GUI)."""
+        refresh_button.configure(state="normal")
         # Xóa các widget cũ
         for widget in content_frame.winfo_children():
             widget.destroy()
@@ -56,23 +85,17 @@ def _create_account_frame(app):
             error_label.pack(pady=20)
             return
         
-        # REAL-TIME CHECK: Validate với server để đảm bảo user vẫn tồn tại
-        is_valid, validation_message = auth_manager.validate_session_with_server()
+        # REAL-TIME CHECK: kết quả validate với server để đảm bảo user vẫn tồn tại
+        # (user bị xóa/suspended: PackingApp.apply_license_state quay lại cửa sổ đăng nhập; KEY_EXPIRED: báo lỗi và đóng app)
+        is_valid, validation_message = snapshot.validation
         if not is_valid:
-            # User đã bị xóa hoặc suspended - tự động logout
-            import tkinter.messagebox as messagebox
-            try:
-                messagebox.showerror(
-                    "Tài khoản không hợp lệ",
-                    f"{validation_message}\n\nỨng dụng sẽ đóng để bảo mật."
-                )
-            except:
-                pass
-            
-            # Xóa session và đóng app
-            auth_manager.clear_session()
-            import sys
-            sys.exit(0)
+            error_label = ctk.CTkLabel(
+                content_frame,
+                text=f"Tài khoản không hợp lệ: {validation_message}",
+                font=ctk.CTkFont(size=16),
+                text_color=utils.COLOR_RED_EXIT
+            )
+            error_label.pack(pady=20)
             return
         
         # Thông tin cơ bản
@@ -116,25 +139,18 @@ def _create_account_frame(app):
         )
         account_type_value.pack(pady=(0, 15), padx=20, fill="x")
         
-        # Gọi API /license-info để lấy data real-time (gọi 1 lần cho cả key và expiration)
-        license_success, license_data, license_error = auth_manager.get_license_info()
+        # Data real-time từ API /license-info (1 lần gọi cho cả key và expiration)
+        license_success, license_data, license_error = snapshot.license_result
         
-        # ✅ Check KEY_EXPIRED và auto logout
+        # ✅ KEY_EXPIRED: PackingApp tự động đăng xuất, ở đây chỉ hiển thị
         if license_error == "KEY_EXPIRED":
-            # Key hết hạn → tự động đăng xuất
-            import tkinter.messagebox as messagebox
-            try:
-                messagebox.showerror(
-                    "Key đã hết hạn",
-                    "Key đã hết hạn hoặc bị xóa. Vui lòng liên hệ admin để gia hạn.\n\nỨng dụng sẽ đóng."
-                )
-            except:
-                pass
-            
-            # Clear session và đóng app
-            auth_manager.clear_session()
-            import sys
-            sys.exit(0)
+            expired_label = ctk.CTkLabel(
+                content_frame,
+                text="Key đã hết hạn hoặc bị xóa. Vui lòng liên hệ admin để gia hạn.",
+                font=ctk.CTkFont(size=16),
+                text_color=utils.COLOR_RED_EXIT
+            )
+            expired_label.pack(pady=20)
             return
         
         # Key (nếu có) - Hiển thị từ license_info API
@@ -386,7 +402,7 @@ def _create_account_frame(app):
     refresh_button = ctk.CTkButton(
         button_container,
         text="🔄 Làm mới",
-        command=update_account_info,
+        command=lambda: update_account_info(force=True),
         fg_color=utils.COLOR_BLUE_ACTION,
         width=200,
         height=50,
@@ -529,5 +545,7 @@ def _create_account_frame(app):
     )
     logout_button.pack(side="left")
     
-    # Cập nhật thông tin lần đầu
+    # Cập nhật thông tin lần đầu (dùng chung kết quả của bước xác thực lúc khởi động)
+    # và mỗi khi trạng thái license có kết quả mới
+    license_monitor.state.subscribe(on_license_state)
     update_account_info()
@@ -0,0 +1,137 @@
+# app_log.py
+# Ghi log có cấu trúc cho toàn ứng dụng (thay cho print ở các đường chạy liên tục).
+#
+# Trước đây vòng lặp camera, kiểm tra license... in thẳng ra console bằng print: mỗi lần camera
+# mất kết nối/đổi trạng thái là một dòng, lỗi lặp lại theo từng khung hình làm ngập console và
+# print ghi đồng bộ ngay trên luồng camera. Không có file log nên lỗi ở máy khách không truy lại được.
+#
+# Nay các module dùng logging.getLogger(__name__):
+# - Luồng gọi chỉ đưa bản ghi vào hàng đợi (QueueHandler); một luồng nền (QueueListener) ghi ra
+#   console và file xoay vòng Logs/packingapp.log (LOG_FILE_MAX_MB x LOG_FILE_BACKUPS).
+# - Mỗi dòng có thời gian, mức, module và luồng: "2024-05-01 08:00:00 WARNING camera_logic [CAM 1 Grabber] ..."
+# - Mức log chung (LOG_LEVEL) và riêng từng module (LOG_MODULE_LEVELS) trong config.
+# - Cùng một thông báo lặp lại trong LOG_RATE_LIMIT_SECONDS chỉ được ghi một lần; lần ghi kế tiếp
+#   kèm số lần đã bị ẩn.
+#
+# setup() được gọi một lần khi khởi động (main_app); trước đó (hoặc khi chạy các công cụ dòng lệnh)
+# logging mặc định của Python chỉ in WARNING trở lên ra stderr.
+
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from . import config
+
+PACKAGE = __package__ or "PackingApp"
+
+LOG_DIR = os.path.join(os.getcwd(), 'Logs')
+LOG_FILE = os.path.join(LOG_DIR, 'packingapp.log')
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(module_name)s [%(threadName)s] %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Giới hạn số thông báo khác nhau được theo dõi để chống lặp
+RATE_LIMIT_MAX_KEYS = 1000
+
+
+class RateLimitFilter(logging.Filter):
+    """Bỏ qua thông báo trùng (cùng module, mức và nội dung) trong interval giây."""
+
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.seen = {}      # key -> [thời điểm ghi gần nhất, số lần bị ẩn]
+
+    def filter(self, record):
+        if self.interval <= 0:
+            return True
+        key = (record.name, record.levelno, record.getMessage())
+        now = time.monotonic()
+        with self.lock:
+            entry = self.seen.get(key)
+            if entry is not None and now - entry[0] < self.interval:
+                entry[1] += 1
+                return False
+            suppressed = entry[1] if entry is not None else 0
+            self.seen[key] = [now, 0]
+            if len(self.seen) > RATE_LIMIT_MAX_KEYS:
+                self._prune(now)
+        if suppressed:
+            record.msg = f"{record.getMessage()} (lặp lại {suppressed} lần trong {self.interval:g}s trước đó)"
+            record.args = None
+        return True
+
+    def _prune(self, now):
+        for key in [key for key, (last, _) in self.seen.items() if now - last >= self.interval]:
+            del self.seen[key]
+
+
+class _ModuleNameFilter(logging.Filter):
+    """Tên module ngắn gọn (camera_logic thay vì PackingApp.camera_logic) cho định dạng log."""
+
+    def filter(self, record):
+        record.module_name = record.name.rpartition('.')[2] if record.name.startswith(PACKAGE + '.') else record.name
+        return True
+
+
+def _level(name):
+    return logging.getLevelName(str(name).upper()) if not isinstance(name, int) else name
+
+
+_lock = threading.Lock()
+_listener = None
+
+
+def setup():
+    """Cấu hình logging cho ứng dụng (chỉ lần gọi đầu có hiệu lực)."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+
+        formatter = logging.Formatter(LOG_FORMAT, DATE_FORMAT)
+        handlers = []
+        try:
+            os.makedirs(LOG_DIR, exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                LOG_FILE, maxBytes=int(config.LOG_FILE_MAX_MB * 1024 * 1024),
+                backupCount=config.LOG_FILE_BACKUPS, encoding='utf-8'
+            )
+            handlers.append(file_handler)
+        except OSError as e:
+            print(f"⚠️ Không thể mở file log {LOG_FILE}: {e}")
+        if config.LOG_CONSOLE or not handlers:
+            handlers.append(logging.StreamHandler())
+        for handler in handlers:
+            handler.setFormatter(formatter)
+            handler.addFilter(_ModuleNameFilter())
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(RateLimitFilter(config.LOG_RATE_LIMIT_SECONDS))
+
+        package_logger = logging.getLogger(PACKAGE)
+        package_logger.setLevel(_level(config.LOG_LEVEL))
+        package_logger.addHandler(queue_handler)
+        package_logger.propagate = False
+        for module, level in config.LOG_MODULE_LEVELS.items():
+            logging.getLogger(f"{PACKAGE}.{module}").setLevel(_level(level))
+
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown)
+
+
+def shutdown():
+    """Ghi nốt các bản ghi còn trong hàng đợi và dừng luồng ghi log."""
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
@@ -2,25 +2,46 @@
 # Module xử lý authentication với Web App
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import os
+import time
+import logging
+import atexit
+import threading
 from datetime import datetime, timedelta
 
+log = logging.getLogger(__name__)
+
 # Import config
 try:
     from . import config
     # Sử dụng FastAPI URL cho API calls (PostgreSQL backend)
     API_BASE_URL = getattr(config, 'FASTAPI_URL', 'http://localhost:8000')
     OFFLINE_MODE = config.OFFLINE_MODE
+    API_TIMEOUT = getattr(config, 'API_TIMEOUT', 10)
+    API_RETRY_ATTEMPTS = getattr(config, 'API_RETRY_ATTEMPTS', 3)
+    API_RETRY_BACKOFF = getattr(config, 'API_RETRY_BACKOFF', 0.5)
+    API_CIRCUIT_FAILURES = getattr(config, 'API_CIRCUIT_FAILURES', 3)
+    API_CIRCUIT_RESET_SECONDS = getattr(config, 'API_CIRCUIT_RESET_SECONDS', 30)
+    VALIDATION_CACHE_SECONDS = getattr(config, 'VALIDATION_CACHE_SECONDS', 15)
+    SESSION_SAVE_DELAY_SECONDS = getattr(config, 'SESSION_SAVE_DELAY_SECONDS', 2)
 except ImportError:
     # Fallback nếu không có config
     # Mặc định dùng FastAPI (localhost:8000) thay vì Next.js (localhost:3000)
     API_BASE_URL = os.getenv('FASTAPI_URL', 'http://localhost:8000')
     OFFLINE_MODE = os.getenv('OFFLINE_MODE', 'false').lower() == 'true'
+    API_TIMEOUT = 10
+    API_RETRY_ATTEMPTS = 3
+    API_RETRY_BACKOFF = 0.5
+    API_CIRCUIT_FAILURES = 3
+    API_CIRCUIT_RESET_SECONDS = 30
+    VALIDATION_CACHE_SECONDS = 15
+    SESSION_SAVE_DELAY_SECONDS = 2
 
 # ✅ [2] Debug: Log API_BASE_URL để kiểm tra
-print(f"🔍 [Auth] API_BASE_URL = {API_BASE_URL}")
-print(f"🔍 [Auth] OFFLINE_MODE = {OFFLINE_MODE}")
+log.info("API_BASE_URL = %s, OFFLINE_MODE = %s", API_BASE_URL, OFFLINE_MODE)
 
 # API Endpoints - Gọi trực tiếp đến FastAPI Backend (PostgreSQL)
 API_ENDPOINTS = {
@@ -33,7 +54,20 @@ API_ENDPOINTS = {
 }
 
 # Debug: Log license endpoint
-print(f"🔍 [Auth] License info endpoint: {API_ENDPOINTS['license_info']}")
+log.debug("License info endpoint: %s", API_ENDPOINTS['license_info'])
+
+# Timeout (kết nối, đọc) theo endpoint (giây).
+# Kết nối tới server nội bộ phải nhanh; các lệnh chạy nền (validate/license) chờ đọc ngắn hơn API_TIMEOUT
+# để server treo không giữ chân lần kiểm tra định kỳ, đăng nhập/kích hoạt được chờ đủ API_TIMEOUT.
+API_CONNECT_TIMEOUT = min(3.05, API_TIMEOUT)
+API_TIMEOUTS = {
+    'login': (API_CONNECT_TIMEOUT, API_TIMEOUT),
+    'activate_key': (API_CONNECT_TIMEOUT, API_TIMEOUT),
+    'verify_key': (API_CONNECT_TIMEOUT, API_TIMEOUT),
+    'check_auth': (API_CONNECT_TIMEOUT, API_TIMEOUT / 2),
+    'validate_user': (API_CONNECT_TIMEOUT, API_TIMEOUT / 2),
+    'license_info': (API_CONNECT_TIMEOUT, API_TIMEOUT / 2),
+}
 
 # Tài khoản admin mặc định (chỉ dùng khi OFFLINE_MODE = true)
 DEFAULT_ADMIN_ACCOUNTS = {
@@ -74,10 +108,231 @@ DEFAULT_KEYS = {
 # File lưu session
 SESSION_FILE = os.path.join(os.path.dirname(__file__), '.session.json')
 
+
+class SessionStore:
+    """
+    Ghi SESSION_FILE cho mọi AuthManager:
+    - Chỉ ghi khi nội dung thực sự thay đổi (kiểm tra license mỗi 30 giây thường không đổi gì).
+    - Các lần cập nhật liên tiếp được gộp lại, ghi một lần sau SESSION_SAVE_DELAY_SECONDS
+      (đăng nhập/kích hoạt/xóa session vẫn ghi ngay).
+    - Ghi ra file tạm rồi đổi tên (os.replace): crash giữa chừng không làm hỏng session.
+    """
+
+    def __init__(self, path=None, delay=SESSION_SAVE_DELAY_SECONDS):
+        self.path = path
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.pending = None   # nội dung đang chờ ghi
+        self.written = None   # nội dung hiện có trên đĩa (None = chưa biết)
+        self.timer = None
+
+    def _path(self):
+        return self.path or SESSION_FILE
+
+    @staticmethod
+    def _serialize(data):
+        return json.dumps(data, ensure_ascii=False, indent=2)
+
+    def load(self):
+        """Đọc session (kể cả thay đổi đang chờ ghi). Trả về dict hoặc None nếu chưa có file."""
+        self.flush()
+        path = self._path()
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        with self.lock:
+            self.written = self._serialize(data)
+        return data
+
+    def save(self, data, immediate=False):
+        """Lưu data (ghi ngay nếu immediate). Trả về False nếu nội dung không đổi."""
+        text = self._serialize(data)
+        with self.lock:
+            current = self.pending if self.pending is not None else self.written
+            if text == current:
+                return False
+            self.pending = text
+            if immediate:
+                self._flush_locked()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.delay, self._flush_in_background)
+                self.timer.daemon = True
+                self.timer.start()
+        return True
+
+    def flush(self):
+        """Ghi ngay thay đổi đang chờ (nếu có)."""
+        with self.lock:
+            self._flush_locked()
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        except Exception as e:
+            log.error("Lỗi khi lưu session: %s", e)
+
+    def _flush_locked(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.pending is None:
+            return
+        text, self.pending = self.pending, None
+        path = self._path()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self.written = text
+
+    def clear(self):
+        """Xóa session: bỏ thay đổi đang chờ (để không ghi lại session vừa xóa) và xóa file."""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self.pending = None
+            self.written = None
+            path = self._path()
+            if os.path.exists(path):
+                os.remove(path)
+
+
+session_store = SessionStore()
+# Thay đổi đang chờ được ghi trước khi thoát
+atexit.register(session_store._flush_in_background)
+
 class AuthError(Exception):
     """Custom exception cho authentication errors"""
     pass
 
+
+# ----------------------------------------------------
+# KẾT NỐI HTTP DÙNG CHUNG
+# ----------------------------------------------------
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    Server đang được coi là không khả dụng (cầu dao mở) - request bị từ chối ngay, không gửi đi.
+    Là ConnectionError nên các nhánh xử lý mất kết nối (chuyển offline, dùng session local) vẫn áp dụng.
+    """
+    pass
+
+
+class CircuitBreaker:
+    """
+    Cầu dao cho API: sau API_CIRCUIT_FAILURES lần lỗi kết nối/timeout/5xx liên tiếp thì mở trong
+    API_CIRCUIT_RESET_SECONDS giây - mọi request lỗi ngay thay vì chờ timeout. Hết thời gian, cho đúng
+    một request thử: thành công thì đóng lại, lỗi thì mở thêm một chu kỳ.
+    """
+
+    def __init__(self, failure_threshold=API_CIRCUIT_FAILURES, reset_seconds=API_CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None      # thời điểm mở (monotonic), None = đang đóng
+        self.probing = False       # đang có request thử sau khi hết thời gian mở
+
+    def before_request(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            remaining = self.reset_seconds - (time.monotonic() - self.opened_at)
+            if remaining > 0 or self.probing:
+                raise CircuitOpenError(f"Server không khả dụng - thử lại sau {max(remaining, 0):.0f}s")
+            self.probing = True
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                log.info("✅ Server đã hoạt động trở lại")
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+                if self.opened_at is None:
+                    log.warning("⚠️ Server lỗi %d lần liên tiếp - tạm ngưng gọi API %ss", self.failures, self.reset_seconds)
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+    def is_open(self):
+        with self.lock:
+            return self.opened_at is not None
+
+
+_http_lock = threading.Lock()
+_http_session = None
+circuit_breaker = CircuitBreaker()
+
+
+def get_http_session():
+    """
+    requests.Session dùng chung cho mọi AuthManager: giữ kết nối keep-alive (không bắt tay TCP/TLS lại
+    mỗi lần gọi) và tự thử lại API_RETRY_ATTEMPTS lần với thời gian chờ tăng dần.
+    Chỉ thử lại lỗi kết nối (request chưa tới server) và 502/503/504 của GET; POST như kích hoạt key
+    (key chỉ dùng 1 lần) không bao giờ bị gửi lại sau khi server đã nhận.
+    """
+    global _http_session
+    with _http_lock:
+        if _http_session is None:
+            retry = Retry(
+                total=API_RETRY_ATTEMPTS,
+                connect=API_RETRY_ATTEMPTS,
+                read=0,
+                status=API_RETRY_ATTEMPTS,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=frozenset({'GET'}),
+                backoff_factor=API_RETRY_BACKOFF,
+                raise_on_status=False
+            )
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=retry)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({'Content-Type': 'application/json'})
+            _http_session = session
+        return _http_session
+
+
+def api_request(method, endpoint, **kwargs):
+    """
+    Gọi API_ENDPOINTS[endpoint] qua session dùng chung, với timeout riêng của endpoint và cầu dao.
+    Ném requests.exceptions.ConnectionError (CircuitOpenError) ngay nếu server đang không khả dụng.
+    """
+    circuit_breaker.before_request()
+    kwargs.setdefault('timeout', API_TIMEOUTS.get(endpoint, (API_CONNECT_TIMEOUT, API_TIMEOUT)))
+    try:
+        response = get_http_session().request(method, API_ENDPOINTS[endpoint], **kwargs)
+    except requests.exceptions.RequestException:
+        circuit_breaker.record_failure()
+        raise
+    if response.status_code >= 500:
+        circuit_breaker.record_failure()
+    else:
+        circuit_breaker.record_success()
+    return response
+
+
+# Kết quả validate_session_with_server theo tài khoản, dùng lại trong VALIDATION_CACHE_SECONDS:
+# lúc khởi động check_license_status validate lại ngay sau bước kiểm tra session, và nhiều nơi
+# (khởi động, tab Tài khoản) tạo AuthManager riêng - chỉ một request tới server cho mỗi lần.
+_validation_lock = threading.Lock()
+_validation_cache = {}       # {(email_or_phone, user_id): (thời điểm monotonic, (is_valid, message))}
+_validation_inflight = {}    # {(email_or_phone, user_id): threading.Event} - request đang chạy
+
+
+def clear_validation_cache():
+    with _validation_lock:
+        _validation_cache.clear()
+
 class AuthManager:
     """Quản lý authentication với Web App"""
     
@@ -87,31 +342,33 @@ class AuthManager:
     
     def load_session(self):
         """Load session từ file"""
-        if os.path.exists(SESSION_FILE):
-            try:
-                with open(SESSION_FILE, 'r', encoding='utf-8') as f:
-                    self.session_data = json.load(f)
-            except Exception as e:
-                print(f"Lỗi khi đọc session: {e}")
-                self.session_data = None
+        try:
+            data = session_store.load()
+            if data is not None:
+                self.session_data = data
+        except Exception as e:
+            log.error("Lỗi khi đọc session: %s", e)
+            self.session_data = None
     
-    def save_session(self, data):
-        """Lưu session vào file"""
+    def save_session(self, data, immediate=True):
+        """
+        Lưu session vào file (chỉ khi nội dung thay đổi).
+        immediate=False: gộp với các cập nhật tiếp theo, ghi sau SESSION_SAVE_DELAY_SECONDS.
+        """
         try:
-            with open(SESSION_FILE, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            session_store.save(data, immediate=immediate)
             self.session_data = data
         except Exception as e:
-            print(f"Lỗi khi lưu session: {e}")
+            log.error("Lỗi khi lưu session: %s", e)
             raise AuthError(f"Không thể lưu session: {e}")
     
     def clear_session(self):
         """Xóa session"""
-        if os.path.exists(SESSION_FILE):
-            try:
-                os.remove(SESSION_FILE)
-            except Exception as e:
-                print(f"Lỗi khi xóa session: {e}")
+        clear_validation_cache()
+        try:
+            session_store.clear()
+        except Exception as e:
+            log.error("Lỗi khi xóa session: %s", e)
         self.session_data = None
     
     def login(self, email_or_phone, password):
@@ -136,15 +393,14 @@ class AuthManager:
         
         # Chế độ online - kết nối với server
         try:
-            response = requests.post(
-                API_ENDPOINTS['login'],
+            response = api_request(
+                'POST',
+                'login',
                 json={
                     'email_or_phone': email_or_phone,
                     'password': password,
                     'source': 'app'  # Mark as desktop app login (check is_activated)
-                },
-                headers={'Content-Type': 'application/json'},
-                timeout=10
+                }
             )
             
             # Kiểm tra status code trước khi parse JSON
@@ -228,15 +484,14 @@ class AuthManager:
         
         # Chế độ online - kết nối với server
         try:
-            response = requests.post(
-                API_ENDPOINTS['activate_key'],
+            response = api_request(
+                'POST',
+                'activate_key',
                 json={
                     'email_or_phone': email_or_phone,
                     'password': password,
                     'key': key.strip()
-                },
-                headers={'Content-Type': 'application/json'},
-                timeout=10
+                }
             )
             
             # Kiểm tra status code trước khi parse JSON
@@ -337,11 +592,10 @@ class AuthManager:
         
         # Chế độ online - kết nối với server
         try:
-            response = requests.post(
-                API_ENDPOINTS['verify_key'],
-                json={'key': key},
-                headers={'Content-Type': 'application/json'},
-                timeout=10
+            response = api_request(
+                'POST',
+                'verify_key',
+                json={'key': key}
             )
             
             # Kiểm tra status code trước khi parse JSON
@@ -501,28 +755,22 @@ class AuthManager:
         if not access_token:
             return False, None, "Không có access token"
         
-        # Debug: Log API URL và token format
-        license_url = API_ENDPOINTS['license_info']
-        print(f"🔍 [get_license_info] API URL: {license_url}")
-        print(f"🔍 [get_license_info] API_BASE_URL: {API_BASE_URL}")
-        print(f"🔍 [get_license_info] Token present: {bool(access_token)}")
-        print(f"🔍 [get_license_info] Token length: {len(access_token) if access_token else 0}")
+        # Debug: chỉ ghi độ dài token, không bao giờ ghi nội dung token vào log
+        log.debug("[get_license_info] GET %s (token length %d)", API_ENDPOINTS['license_info'], len(access_token))
         
         try:
             # Đảm bảo Authorization header đúng format: "Bearer {token}"
             auth_header = f"Bearer {access_token}".strip()
-            print(f"🔍 [get_license_info] Authorization header: Bearer {access_token[:20]}...")
             
-            response = requests.get(
-                license_url,
+            response = api_request(
+                'GET',
+                'license_info',
                 headers={
                     "Authorization": auth_header,  # Đảm bảo chữ hoa đúng
-                    "Content-Type": "application/json"
-                },
-                timeout=10
+                }
             )
             
-            print(f"🔍 [get_license_info] Response status: {response.status_code}")
+            log.debug("[get_license_info] Response status: %s", response.status_code)
             
             if response.status_code == 401:
                 # ✅ Check KEY_EXPIRED từ middleware
@@ -530,7 +778,7 @@ class AuthManager:
                     error_data = response.json()
                     if error_data.get('detail') == 'KEY_EXPIRED':
                         # Key hết hạn → trigger auto logout
-                        print(f"❌ KEY_EXPIRED detected - triggering auto logout")
+                        log.warning("❌ KEY_EXPIRED detected - triggering auto logout")
                         # Clear session
                         self.clear_session()
                         return False, None, "KEY_EXPIRED"
@@ -545,7 +793,7 @@ class AuthManager:
                     error_data = response.json()
                     # ✅ Check KEY_EXPIRED trong error response
                     if error_data.get('detail') == 'KEY_EXPIRED':
-                        print(f"❌ KEY_EXPIRED detected - triggering auto logout")
+                        log.warning("❌ KEY_EXPIRED detected - triggering auto logout")
                         self.clear_session()
                         return False, None, "KEY_EXPIRED"
                     
@@ -557,23 +805,27 @@ class AuthManager:
             # Parse response
             try:
                 license_data = response.json()
-                print(f"🔍 [get_license_info] Response data: {license_data}")
                 
                 # ✅ [3] UPDATE SESSION ngay sau khi nhận data từ API
                 if license_data:
+                    # Không ghi cả response (có chứa key) vào log
+                    log.debug(
+                        "[get_license_info] status=%s, expire_at=%s, days_left=%s",
+                        license_data.get('status'), license_data.get('expire_at'), license_data.get('days_left')
+                    )
                     # Cập nhật session với data mới nhất
                     if self.session_data:
                         self.session_data['key_expires_at'] = license_data.get('expire_at')
                         self.session_data['key'] = license_data.get('key')
                         self.session_data['license_status'] = license_data.get('status')
                         self.session_data['license_days_left'] = license_data.get('days_left')
-                        # Lưu session
-                        self.save_session(self.session_data)
-                        print(f"✅ [get_license_info] Session updated with license data")
+                        # Lưu session (chỉ ghi file khi có thay đổi, gộp các lần cập nhật liên tiếp)
+                        self.save_session(self.session_data, immediate=False)
+                        log.debug("[get_license_info] Session updated with license data")
                 
                 return True, license_data, None
             except ValueError as e:
-                print(f"❌ [get_license_info] JSON parse error: {e}")
+                log.error("[get_license_info] JSON parse error: %s", e)
                 return False, None, f'Lỗi định dạng response: {str(e)}'
                 
         except requests.exceptions.ConnectionError:
@@ -592,16 +844,17 @@ class AuthManager:
             try:
                 error_data = response.json()
                 if error_data.get('detail') == 'KEY_EXPIRED':
-                    print(f"❌ KEY_EXPIRED detected in API response - triggering auto logout")
+                    log.warning("❌ KEY_EXPIRED detected in API response - triggering auto logout")
                     self.clear_session()
                     return True, "KEY_EXPIRED"
             except:
                 pass
         return False, None
     
-    def validate_session_with_server(self):
+    def validate_session_with_server(self, max_age=None):
         """
         Xác thực session với server để đảm bảo user vẫn tồn tại
+        max_age: dùng lại kết quả chưa cũ hơn số giây này (mặc định VALIDATION_CACHE_SECONDS, 0 = luôn hỏi server)
         Returns: (is_valid: bool, message: str)
         """
         # Chế độ offline - không cần validate
@@ -614,17 +867,42 @@ class AuthManager:
         
         email_or_phone = self.session_data.get('email_or_phone')
         user_id = self.session_data.get('user_id')
+        cache_key = (email_or_phone, user_id)
+        
+        # Dùng lại kết quả vừa validate, hoặc chờ request đang chạy cho cùng tài khoản
+        while True:
+            with _validation_lock:
+                cached = _validation_cache.get(cache_key)
+                if cached and time.monotonic() - cached[0] < (VALIDATION_CACHE_SECONDS if max_age is None else max_age):
+                    return cached[1]
+                pending = _validation_inflight.get(cache_key)
+                if pending is None:
+                    pending = _validation_inflight[cache_key] = threading.Event()
+                    break
+            pending.wait()
         
+        result = None
+        try:
+            result = self._validate_with_server(email_or_phone, user_id)
+            return result
+        finally:
+            with _validation_lock:
+                if result is not None:
+                    _validation_cache[cache_key] = (time.monotonic(), result)
+                del _validation_inflight[cache_key]
+            pending.set()
+    
+    def _validate_with_server(self, email_or_phone, user_id):
+        """Gọi API validate_user (không qua cache). Returns: (is_valid: bool, message: str)"""
         # Kiểm tra user có tồn tại trên server không
         try:
-            response = requests.post(
-                API_ENDPOINTS['validate_user'],
+            response = api_request(
+                'POST',
+                'validate_user',
                 json={
                     'email_or_phone': email_or_phone,
                     'user_id': user_id
-                },
-                headers={'Content-Type': 'application/json'},
-                timeout=10
+                }
             )
             
             # ✅ Check KEY_EXPIRED từ middleware
@@ -1,15 +1,17 @@
 import cv2
+import logging
 import threading
 import time
 from PIL import Image
 import customtkinter as ctk
 import os
 import datetime
-import pyttsx3
 import json
 import winsound
-from qreader import QReader # Import the new, powerful QR detector
-from . import utils, config
+from . import utils, config, recording, video_index, video_catalog, retention, thumbnails, qr_parser, scan_router
+from . import qr_detector, startup_profile, camera_metrics
+
+log = logging.getLogger(__name__)
 
 # Đường dẫn file cài đặt dùng chung
 SETTINGS_FILE = r".\camera_settings.json"
@@ -22,15 +24,23 @@ def _frame_grabber_loop(app, camera):
     A tight loop that continuously reads frames from the camera stream.
     Its only job is to empty the buffer and keep camera.frame fresh.
     """
-    print(f"[CAM {camera.name}] Frame grabber thread started.")
+    log.debug("[CAM %s] Frame grabber thread started.", camera.name)
+    metrics = camera.metrics
     while app.is_running and camera.preview_cap and camera.preview_cap.isOpened():
+        read_start = time.perf_counter()
         ret, frame = camera.preview_cap.read()
+        read_end = time.perf_counter()
         if not ret:
-            print(f"[CAM {camera.name}] Grabber: Failed to read frame. Signaling for reconnect.")
+            metrics.grab_failures.inc()
+            log.warning("[CAM %s] Grabber: Failed to read frame. Signaling for reconnect.", camera.name)
             break
+        metrics.grab_read_seconds.observe(read_end - read_start)
+        metrics.grab_frames.mark()
         with camera.frame_lock:
             camera.frame = frame
-    print(f"[CAM {camera.name}] Frame grabber thread stopped.")
+            camera.frame_seq += 1
+            camera.frame_time = read_end
+    log.debug("[CAM %s] Frame grabber thread stopped.", camera.name)
 
 # =====================================================================
 # Main Camera Logic (Modified to use QReader)
@@ -50,19 +60,19 @@ class Camera:
         self.start_time = None
         self.last_file = None
         self.preview_cap = None
-        self.last_scan_time = None
         self.frame = None
+        self.frame_seq = 0      # số thứ tự frame do grabber ghi (phát hiện frame bị bỏ qua/ghi lặp)
+        self.frame_time = None  # time.perf_counter() lúc đọc frame hiện tại
         self.frame_lock = threading.Lock()
+        self.metrics = camera_metrics.CameraMetrics()
         self.record_thread = None
         self.grabber_thread = None
-        self.last_warning_time = None
-        self.last_warning_order_id = None
 
     def release(self):
         """Release camera resources."""
         if self.preview_cap and self.preview_cap.isOpened():
             self.preview_cap.release()
-            print(f"[CAM {self.name}] Preview capture released.")
+            log.debug("[CAM %s] Preview capture released.", self.name)
 
 def load_cameras_from_settings(app):
     """
@@ -71,7 +81,7 @@ def load_cameras_from_settings(app):
     """
     try:
         if not os.path.exists(SETTINGS_FILE):
-            print(f"[WARN] {SETTINGS_FILE} not found. Creating default.")
+            log.warning("%s not found. Creating default.", SETTINGS_FILE)
             default_settings = {
                 "camera_type": "WEBCAM",
                 "webcam_index": 0,
@@ -116,7 +126,7 @@ def load_cameras_from_settings(app):
         return camera_objects
 
     except Exception as e:
-        print(f"[ERROR] Error loading settings: {e}")
+        log.error("Error loading settings: %s", e)
         return []
 
 def get_camera_settings():
@@ -138,10 +148,10 @@ def save_camera_settings(settings_data):
     try:
         with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
             json.dump(settings_data, f, indent=4)
-        print("[SETTINGS] Đã lưu cấu hình thành công.")
+        log.info("[SETTINGS] Đã lưu cấu hình thành công.")
         return True
     except Exception as e:
-        print(f"[SETTINGS] Lỗi khi lưu cấu hình: {e}")
+        log.error("[SETTINGS] Lỗi khi lưu cấu hình: %s", e)
         return False
 
 # Alias để tương thích ngược nếu cần
@@ -154,7 +164,7 @@ def start_camera_threads(app):
         if hasattr(app, 'log_label') and app.log_label.winfo_exists():
             app.after(0, lambda: app.log_label.configure(text=error_msg, text_color="red"))
         else:
-            print(f"[GUI ERROR] {error_msg}")
+            log.error(error_msg)
         return
     app.camera_threads = []
     for camera in app.cameras:
@@ -167,7 +177,7 @@ def restart_cameras(app):
     Dừng toàn bộ camera hiện tại, tải lại cấu hình và khởi động lại.
     Được gọi sau khi người dùng thay đổi cài đặt.
     """
-    print("[SYSTEM] Đang khởi động lại hệ thống camera...")
+    log.info("[SYSTEM] Đang khởi động lại hệ thống camera...")
     # 1. Dừng ghi hình nếu đang ghi
     _stop_all_recordings(app)
     
@@ -211,6 +221,24 @@ def _draw_overlay(frame, text_left, text_right):
         cv2.rectangle(frame, (x - PADDING, y - th - PADDING), (x + tw + PADDING, y + baseline + PADDING), BG_COLOR, -1)
         cv2.putText(frame, text_right, (x, y), FONT, FONT_SCALE, TEXT_COLOR, FONT_THICKNESS, cv2.LINE_AA)
 
+def _draw_diagnostics(frame, lines):
+    """Vẽ các dòng chỉ số (camera_metrics) ở góc dưới bên trái của frame."""
+    FONT = cv2.FONT_HERSHEY_SIMPLEX
+    FONT_SCALE = 0.45
+    LINE_HEIGHT = 18
+    h = frame.shape[0]
+    top = h - LINE_HEIGHT * len(lines) - 8
+    cv2.rectangle(frame, (0, top), (430, h), (0, 0, 0), -1)
+    for i, line in enumerate(lines):
+        y = top + LINE_HEIGHT * (i + 1)
+        cv2.putText(frame, line, (6, y), FONT, FONT_SCALE, (0, 255, 255), 1, cv2.LINE_AA)
+
+def _render_preview(app, frame, camera):
+    """Vẽ preview trên luồng GUI và đo thời gian vẽ."""
+    render_start = time.perf_counter()
+    update_image_frame(app, frame, camera)
+    camera.metrics.render_seconds.observe(time.perf_counter() - render_start)
+
 def _camera_feed_loop(app, camera):
     """
     The main processing loop for a camera.
@@ -218,21 +246,25 @@ def _camera_feed_loop(app, camera):
     - Processes a central Region of Interest (ROI) to improve performance.
     - Draws the ROI on the preview to guide the user.
     """
-    # 1. Initialize the QReader with performance optimizations
-    # 'n' model is faster, and min_prob filters weak detections.
-    qreader = QReader(model_size='n', min_confidence=0.5)
+    # 1. The QReader model is shared by all cameras and loaded/warmed once in the background
+    # (qr_detector). Until it is ready, detection returns nothing and the preview runs as usual.
+    qr_detector.warm_up()
 
     # 2. Set scan interval to avoid processing every frame
     scan_interval = max(1, config.FPS // 5)  # Scan ~5 times per second
     frame_counter = 0
+    last_unrecognized = None
+    metrics = camera.metrics
+    last_seq = None
 
     while app.is_running and camera.is_active:
         # --- Connection Management ---
         if camera.preview_cap is None or not camera.preview_cap.isOpened():
             with camera.frame_lock:
                 camera.frame = None
-            print(f"[CAM {camera.name}] Đang kết nối tới nguồn: {camera.source}")
+            log.info("[CAM %s] Đang kết nối tới nguồn: %s", camera.name, camera.source)
             app.after(0, lambda: update_camera_status(app, camera, "Đang kết nối...", utils.COLOR_GRAY_ACCENT))
+            connect_start = time.perf_counter()
             
             # Xử lý kết nối dựa trên loại nguồn (RTSP URL hoặc Webcam Index)
             if isinstance(camera.source, str):
@@ -240,14 +272,17 @@ def _camera_feed_loop(app, camera):
                 camera.preview_cap = cv2.VideoCapture(camera.source, cv2.CAP_FFMPEG)
             else:
                 camera.preview_cap = cv2.VideoCapture(camera.source, cv2.CAP_DSHOW)
+            metrics.connect_seconds.observe(time.perf_counter() - connect_start)
                 
             if not camera.preview_cap.isOpened():
+                metrics.connect_failures.inc()
                 app.after(0, lambda: update_camera_status(app, camera, "Lỗi kết nối: Kiểm tra URL/Mạng", utils.COLOR_RED_EXIT))
-                print(f"[CAM {camera.name}] Lỗi: không thể kết nối tới luồng.")
+                log.warning("[CAM %s] Lỗi: không thể kết nối tới luồng.", camera.name)
                 time.sleep(5) # Wait before retrying
                 continue
             else:
-                print(f"[CAM {camera.name}] Kết nối thành công. Bắt đầu luồng lấy hình ảnh.")
+                metrics.connects.inc()
+                log.info("[CAM %s] Kết nối thành công. Bắt đầu luồng lấy hình ảnh.", camera.name)
                 app.after(0, lambda: update_camera_status(app, camera, "Trạng thái: Đang chờ", "#555"))
                 camera.grabber_thread = threading.Thread(target=_frame_grabber_loop, args=(app, camera), daemon=True)
                 camera.grabber_thread.start()
@@ -257,10 +292,18 @@ def _camera_feed_loop(app, camera):
         with camera.frame_lock:
             if camera.frame is not None:
                 frame_to_process = camera.frame.copy()
+                frame_seq, frame_time = camera.frame_seq, camera.frame_time
         
         if frame_to_process is None:
             time.sleep(0.1) # Wait for the first frame
             continue
+
+        # Frames the grabber overwrote before this loop got to them
+        if last_seq is not None and frame_seq - last_seq > 1:
+            metrics.preview_dropped.inc(frame_seq - last_seq - 1)
+        last_seq = frame_seq
+        metrics.frame_age_seconds.set(time.perf_counter() - frame_time)
+        metrics.preview_frames.mark()
             
         frame_counter += 1
         
@@ -277,15 +320,31 @@ def _camera_feed_loop(app, camera):
 
             # Use QReader's combined detect_and_decode method on the ROI.
             # This is the correct and most efficient way to use the library.
-            decoded_qrs = qreader.detect_and_decode(image=frame_roi)
+            detect_start = time.perf_counter()
+            decoded_qrs = qr_detector.detect_and_decode(frame_roi)
+            if qr_detector.is_ready():
+                metrics.detect_seconds.observe(time.perf_counter() - detect_start)
 
             # detect_and_decode returns a tuple of strings (or None if nothing found)
             if decoded_qrs and decoded_qrs[0]:
-                order_id = decoded_qrs[0].strip()
-                # Schedule the business logic to run on the main thread
-                app.after(0, lambda: _handle_auto_switch_for_camera(app, camera, order_id))
+                metrics.qr_decoded.inc()
+                # Nhận dạng đơn vị vận chuyển và trích mã vận đơn; QR không phải mã vận đơn bị bỏ qua
+                _, order_id = qr_parser.parse(decoded_qrs[0])
+                if order_id:
+                    # Lọc lượt quét lặp lại ngay tại đây; chỉ lượt cần xử lý mới được đưa sang luồng GUI
+                    decision = app.scan_router.accept(camera.id, order_id)
+                    if decision == scan_router.FORWARD:
+                        # Schedule the business logic to run on the main thread
+                        app.after(0, lambda order_id=order_id: _handle_auto_switch_for_camera(app, camera, order_id))
+                    elif decision is not None:
+                        app.after(0, lambda order_id=order_id, decision=decision: _warn_scan(app, camera, order_id, decision))
+                elif decoded_qrs[0] != last_unrecognized:
+                    # Chỉ ghi log một lần cho mỗi mã lạ (mã vẫn nằm trước camera sẽ được quét lại liên tục)
+                    last_unrecognized = decoded_qrs[0]
+                    log.info("[CAM %s] Không nhận dạng được mã QR: '%s'", camera.name, decoded_qrs[0])
 
         # --- GUI Update with Visual Feedback ---
+        prepare_start = time.perf_counter()
         # Draw overlay info if recording
         if camera.is_recording:
             timestamp_str = datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")
@@ -306,8 +365,16 @@ def _camera_feed_loop(app, camera):
         bottom_right = (preview_roi_x + preview_roi_w, preview_roi_y + preview_roi_h)
         cv2.rectangle(preview_frame, top_left, bottom_right, (0, 255, 0), 2)
 
+        # Optional diagnostics overlay (F3)
+        if app.show_diagnostics:
+            _draw_diagnostics(preview_frame, metrics.overlay_lines())
+        metrics.prepare_seconds.observe(time.perf_counter() - prepare_start)
+
         # Update the GUI on the main thread
-        app.after(0, lambda f=preview_frame, cam=camera: update_image_frame(app, f, cam))
+        metrics.render_scheduled.inc()
+        app.after(0, lambda f=preview_frame, cam=camera: _render_preview(app, f, cam))
+        if startup_profile.mark(startup_profile.MARK_FIRST_PREVIEW) and startup_profile.BENCHMARK:
+            app.after(500, app.on_closing)
         
         # Control the processing/display rate to match desired FPS
         time.sleep(1 / config.FPS)
@@ -321,43 +388,48 @@ def _camera_feed_loop(app, camera):
 # Recording Logic and other helpers (all unchanged)
 # =====================================================================
 
-def _start_recording_for_camera(app, camera, order_id):
-    os.makedirs(utils.OUTPUT_DIR, exist_ok=True)
-    file_name = f"{order_id}.avi"
-    file_path = os.path.join(utils.OUTPUT_DIR, file_name)
-    if os.path.exists(file_path):
-        # Kiểm tra cooldown 5 giây cho cảnh báo trùng lặp
-        current_time = datetime.datetime.now()
-        if camera.last_warning_order_id == order_id and camera.last_warning_time:
-            if (current_time - camera.last_warning_time).total_seconds() < 5:
-                return False
-
-        camera.last_warning_order_id = order_id
-        camera.last_warning_time = current_time
+def _warn_scan(app, camera, order_id, decision):
+    """Hiển thị cảnh báo cho lượt quét bị từ chối (đã được app.scan_router giới hạn tần suất)."""
+    if decision == scan_router.WARN_OTHER_CAMERA:
+        owner_id = app.scan_router.owner_of(order_id)
+        owner = next((cam for cam in app.cameras if cam.id == owner_id), None)
+        owner_name = owner.name if owner else "camera khác"
+        update_camera_status(app, camera, f"Lỗi: Đơn {order_id} đang được ghi bởi {owner_name}", utils.COLOR_RED_EXIT)
+        app.after(2000, lambda: update_camera_status(app, camera, "Trạng thái: Đang chờ", "#555"))
+    else:
         update_camera_status(app, camera, f"Lỗi: Đơn hàng {order_id} đã tồn tại", utils.COLOR_RED_EXIT)
         app.after(0, lambda: _play_audio('DonHangTonTai.wav'))
+
+def _start_recording_for_camera(app, camera, order_id):
+    # Tra trong bộ nhớ (không đọc ổ đĩa)
+    if utils.video_exists(order_id):
+        _warn_scan(app, camera, order_id, scan_router.WARN_DUPLICATE)
         return False
     with app.lock:
-        if camera.is_recording:
+        # Kiểm tra lại trong lock: hai camera có thể quét cùng một đơn gần như đồng thời
+        if camera.is_recording or utils.video_exists(order_id):
             return False
         with camera.frame_lock:
             if camera.frame is None:
                 update_camera_status(app, camera, "Lỗi: Không có hình ảnh từ camera", utils.COLOR_RED_EXIT)
-                print(f"[CAM {camera.name}] Không thể ghi hình, không có frame.")
+                log.warning("[CAM %s] Không thể ghi hình, không có frame.", camera.name)
                 return False
             frame_height, frame_width, _ = camera.frame.shape
             frame_size = (frame_width, frame_height)
-        fourcc = cv2.VideoWriter_fourcc(*utils.VIDEO_CODEC_FOURCC)
-        video_writer = cv2.VideoWriter(file_path, fourcc, config.FPS, frame_size)
+        start_time = datetime.datetime.now()
+        # Recording ghi theo đoạn (hoặc 1 file) và lưu metadata tiến trình để chống mất dữ liệu khi crash
+        video_writer = recording.Recording(order_id, camera, frame_size, start_time)
         if not video_writer.isOpened():
+            video_writer.release()
             update_camera_status(app, camera, f"Lỗi: Không tạo được file video", utils.COLOR_RED_EXIT)
             return False
+        video_catalog.known_orders.add(order_id)
         camera.is_recording = True
         camera.order_id = order_id
-        camera.start_time = datetime.datetime.now()
-        camera.last_file = file_name
-        camera.last_scan_time = datetime.datetime.now()
+        camera.start_time = start_time
+        camera.last_file = video_writer.metadata["file_name"]
         camera.video_writer = video_writer
+        app.scan_router.claim(order_id, camera.id)
         camera.record_thread = threading.Thread(target=_record_loop, args=(app, camera), daemon=True)
         camera.record_thread.start()
     app.after(0, lambda: _play_audio('BatDauGhiHinh.wav'))
@@ -366,13 +438,25 @@ def _start_recording_for_camera(app, camera, order_id):
     return True
 
 def _record_loop(app, camera):
-    print(f"[CAM {camera.name}] Luồng ghi hình bắt đầu cho đơn hàng {camera.order_id}.")
+    log.info("[CAM %s] Luồng ghi hình bắt đầu cho đơn hàng %s.", camera.name, camera.order_id)
+    metrics = camera.metrics
+    metrics.recordings.inc()
+    last_seq = None
     while camera.is_recording and app.is_running:
         frame_to_write = None
         with camera.frame_lock:
             if camera.frame is not None:
                 frame_to_write = camera.frame.copy()
+                frame_seq = camera.frame_seq
         if frame_to_write is not None:
+            # Grabber chậm hơn FPS ghi -> frame bị ghi lặp; nhanh hơn -> frame bị bỏ qua
+            if last_seq is not None:
+                if frame_seq == last_seq:
+                    metrics.record_repeated.inc()
+                elif frame_seq - last_seq > 1:
+                    metrics.record_dropped.inc(frame_seq - last_seq - 1)
+            last_seq = frame_seq
+            write_start = time.perf_counter()
             try:
                 # Draw overlay info on recorded frame
                 timestamp_str = datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")
@@ -380,14 +464,18 @@ def _record_loop(app, camera):
 
                 if camera.video_writer and camera.video_writer.isOpened():
                     camera.video_writer.write(frame_to_write)
+                    metrics.record_write_seconds.observe(time.perf_counter() - write_start)
+                    metrics.record_frames.mark()
                 else:
-                    print(f"[CAM {camera.name}] Lỗi: VideoWriter không mở. Dừng ghi hình.")
+                    metrics.record_errors.inc()
+                    log.error("[CAM %s] Lỗi: VideoWriter không mở. Dừng ghi hình.", camera.name)
                     camera.is_recording = False
             except Exception as e:
-                print(f"[CAM {camera.name}] Lỗi khi đang ghi frame: {e}")
+                metrics.record_errors.inc()
+                log.error("[CAM %s] Lỗi khi đang ghi frame: %s", camera.name, e)
                 camera.is_recording = False
         time.sleep(1 / config.FPS)
-    print(f"[CAM {camera.name}] Luồng ghi hình đã dừng cho đơn hàng {camera.order_id}.")
+    log.info("[CAM %s] Luồng ghi hình đã dừng cho đơn hàng %s.", camera.name, camera.order_id)
 
 def _stop_recording_for_camera(app, camera):
     with app.lock:
@@ -399,38 +487,34 @@ def _stop_recording_for_camera(app, camera):
         recording_start_time = camera.start_time
         camera.is_recording = False
         if camera.record_thread and camera.record_thread.is_alive():
-            print(f"[CAM {camera.name}] Chờ luồng ghi hình hoàn tất...")
+            log.debug("[CAM %s] Chờ luồng ghi hình hoàn tất...", camera.name)
             camera.record_thread.join(timeout=2)
+        saved_writer = camera.video_writer
         if camera.video_writer:
             camera.video_writer.release()
             camera.video_writer = None
-            print(f"[CAM {camera.name}] Đã giải phóng VideoWriter cho đơn {saved_id}.")
+            log.debug("[CAM %s] Đã giải phóng VideoWriter cho đơn %s.", camera.name, saved_id)
         camera.order_id = None
         camera.start_time = None
         camera.last_file = None
         camera.record_thread = None
-    if saved_id and saved_file_name and recording_start_time:
-        try:
-            duration_sec = (recording_end_time - recording_start_time).total_seconds()
-        except Exception as e:
-            print(f"[CẢNH BÁO] Không thể tính duration cho {saved_file_name}: {e}")
-            duration_sec = 0
-        metadata = {
-            "file_name": saved_file_name,
-            "camera_name": camera.name,
-            "camera_id": camera.id,
-            "start_time": recording_start_time.isoformat(), 
-            "end_time": recording_end_time.isoformat(),
-            "duration_seconds": round(duration_sec, 2)
-        }
-        os.makedirs(utils.METADATA_DIR, exist_ok=True)
-        metadata_file_name = f"{saved_id}.json"
-        metadata_file_path = os.path.join(utils.METADATA_DIR, metadata_file_name)
+        app.scan_router.release(saved_id)
+    if saved_id and saved_file_name and recording_start_time and saved_writer:
+        # Hoàn tất: ghép đoạn (đổi tên, không encode lại) và ghi Metadata/<order>.json
         try:
-            with open(metadata_file_path, 'w') as f:
-                json.dump(metadata, f, indent=4)
+            metadata = saved_writer.finalize(recording_end_time)
+            utils.invalidate_metadata_cache(saved_id)
+            if metadata is None:
+                # Không ghi được khung hình nào: không có gì để lưu, cho phép quét lại đơn này
+                video_catalog.known_orders.discard(saved_id)
+            elif video_index.get_index().add_recording(metadata):
+                # Ảnh xem trước + chỉ mục tua được tạo ở luồng nền, xong thì vẽ lại danh sách tra cứu
+                thumbnails.schedule(app, metadata["file_name"], on_done=lambda: app.video_list.refresh())
+            else:
+                # Không còn file video nào (ví dụ chưa ghi được frame): cho phép quét lại đơn này
+                video_catalog.known_orders.discard(saved_id)
         except Exception as e:
-            print(f"[LỖI] Không thể lưu metadata cho {saved_id} tại {metadata_file_path}: {e}")
+            log.error("Không thể hoàn tất bản ghi cho %s: %s", saved_id, e)
     update_camera_status(app, camera, "Trạng thái: Đã lưu", utils.COLOR_GREEN_SUCCESS)
     app.after(1500, lambda: update_camera_status(app, camera, "Trạng thái: Đang chờ", "#555"))
     any_recording = any(cam.is_recording for cam in app.cameras)
@@ -440,23 +524,24 @@ def _stop_recording_for_camera(app, camera):
 def _play_audio(file_name):
     file_path = os.path.join(utils.AUDIO_DIR, file_name)
     if not os.path.exists(file_path):
-        print(f"[AUDIO ERROR] File không tồn tại: {file_path}")
+        log.warning("[AUDIO] File không tồn tại: %s", file_path)
         return
     try:
         winsound.PlaySound(file_path, winsound.SND_FILENAME | winsound.SND_ASYNC)
     except Exception as e:
-        print(f"[AUDIO ERROR] Lỗi phát file {file_name}: {e}")
+        log.warning("[AUDIO] Lỗi phát file %s: %s", file_name, e)
 
 def _play_beep():
     try:
         winsound.Beep(1000, 150)
         winsound.Beep(1500, 150)
     except Exception as e:
-        print("[BEEP ERROR]", e)
+        log.warning("[BEEP] %s", e)
 
 def speak(text):
     def _run():
         try:
+            import pyttsx3  # nạp khi cần (chậm, chỉ dùng khi đọc thông báo)
             engine = pyttsx3.init()
             engine.setProperty("rate", 165)
             engine.setProperty("volume", 1.0)
@@ -468,12 +553,12 @@ def speak(text):
                     vietnamese_voice_found = True
                     break
             if not vietnamese_voice_found:
-                 print("[WARN] Không tìm thấy giọng nói tiếng Việt. Sử dụng giọng mặc định.")
+                 log.warning("[TTS] Không tìm thấy giọng nói tiếng Việt. Sử dụng giọng mặc định.")
             engine.say(text)
             engine.runAndWait()
             engine.stop() 
         except Exception as e:
-            print("[TTS ERROR]", e)
+            log.warning("[TTS] %s", e)
     threading.Thread(target=_run, daemon=True).start()
         
 def _stop_manual_recording_for_camera(app, camera):
@@ -481,60 +566,37 @@ def _stop_manual_recording_for_camera(app, camera):
     app.after(0, lambda: _play_audio('DungGhiHinh.wav'))
 
 def _handle_auto_switch_for_camera(app, camera, new_order_id):
-    if camera.last_scan_time and (datetime.datetime.now() - camera.last_scan_time).total_seconds() < 3:
-        if camera.order_id == new_order_id:
-             print(f"[CAM {camera.name}] Bỏ qua quét lặp lại cho mã {new_order_id} (cooldown).")
-             return
+    # Lượt quét lặp lại đã được app.scan_router loại bỏ trong luồng camera
     if camera.is_recording and camera.order_id == new_order_id:
-        # Logic mới: Nếu quét lại đúng mã đơn hàng đang ghi -> BỎ QUA (Tiếp tục ghi hình)
-        # Chỉ cập nhật thời gian quét để tránh xử lý lặp lại quá nhanh trong vòng lặp
-        camera.last_scan_time = datetime.datetime.now()
+        # Quét lại đúng mã đơn hàng đang ghi -> BỎ QUA (Tiếp tục ghi hình)
+        return
+    # Bảng đơn đang ghi -> camera (tra O(1), không duyệt app.cameras)
+    owner_id = app.scan_router.owner_of(new_order_id)
+    if owner_id is not None and owner_id != camera.id:
+        _warn_scan(app, camera, new_order_id, scan_router.WARN_OTHER_CAMERA)
         return
-    with app.lock:
-        for other_cam in app.cameras:
-            if other_cam.is_recording and other_cam.order_id == new_order_id and other_cam.id != camera.id:
-                msg = f"Lỗi: Đơn {new_order_id} đang được ghi bởi {other_cam.name}"
-                update_camera_status(app, camera, msg, utils.COLOR_RED_EXIT)
-                app.after(2000, lambda: update_camera_status(app, camera, "Trạng thái: Đang chờ", "#555"))
-                return
     if camera.is_recording:
         _stop_recording_for_camera(app, camera)
         time.sleep(0.5)
     _start_recording_for_camera(app, camera, new_order_id)
-    camera.last_scan_time = datetime.datetime.now()
 
 def _stop_all_recordings(app):
-    print("Dừng tất cả các camera đang ghi hình...")
+    log.info("Dừng tất cả các camera đang ghi hình...")
     for camera in app.cameras:
         if camera.is_recording:
             _stop_recording_for_camera(app, camera)
 
-def _cleanup_old_files(app):
-    print(f"[DỌN DẸP] Bắt đầu kiểm tra và xóa các file đã cũ hơn {utils.DAYS_TO_KEEP} ngày...")
-    cutoff_time = datetime.datetime.now() - datetime.timedelta(days=utils.DAYS_TO_KEEP)
-    directories_to_clean = [utils.OUTPUT_DIR, utils.METADATA_DIR]
-    deleted_count = 0
-    deleted_space = 0
-    for folder_path in directories_to_clean:
-        if not os.path.isdir(folder_path):
-            print(f"[CẢNH BÁO] Thư mục dọn dẹp không tồn tại: {folder_path}")
-            continue
-        try:
-            for file_name in os.listdir(folder_path):
-                file_path = os.path.join(folder_path, file_name)
-                if os.path.isfile(file_path):
-                    file_modified_time = datetime.datetime.fromtimestamp(os.path.getmtime(file_path))
-                    if file_modified_time < cutoff_time:
-                        file_size_bytes = os.path.getsize(file_path)
-                        os.remove(file_path)
-                        deleted_count += 1
-                        deleted_space += file_size_bytes
-                        print(f"[XÓA] Đã xóa: {file_name}")
-        except Exception as e:
-            print(f"[LỖI DỌN DẸP] Lỗi khi xử lý thư mục {folder_path}: {e}")
+def _cleanup_old_files(app, engine):
+    """Một lượt dọn dẹp (tuổi + dung lượng đĩa) dựa trên chỉ mục video."""
+    try:
+        deleted_count, deleted_space = engine.run_once()
+    except Exception as e:
+        log.error("[DỌN DẸP] %s", e)
+        return None
     deleted_space_mb = deleted_space / (1024 * 1024)
-    print(f"[HOÀN TẤT] Đã xóa tổng cộng {deleted_count} file, giải phóng {deleted_space_mb:.2f} MB.")
-    app.cleanup_queue.put((deleted_count, deleted_space_mb))
+    if deleted_count:
+        log.info("[DỌN DẸP] Đã xóa tổng cộng %d file, giải phóng %.2f MB.", deleted_count, deleted_space_mb)
+    return deleted_count, deleted_space_mb
     
 def _update_cleanup_log(app, count, size_mb):
     if count > 0:
@@ -546,21 +608,33 @@ def _update_cleanup_log(app, count, size_mb):
     if hasattr(app, 'log_label') and app.log_label.winfo_exists():
         app.log_label.configure(text=log_text, text_color=color)
     else:
-        print(f"Cleanup Log: {log_text}") # Fallback to print if log_label is removed
-
-CLEANUP_INTERVAL_SECONDS = 24 * 60 * 60
+        log.info(log_text) # Fallback to the log if log_label is removed
 
 def start_cleanup_thread(app):
+    """
+    Kiểm tra định kỳ (config.RETENTION_CHECK_SECONDS) thay vì mỗi ngày một lần,
+    để phản ứng kịp khi ổ đĩa đầy giữa ngày. Khi không có gì cần xóa, mỗi lượt chỉ là
+    vài truy vấn chỉ mục và một lần disk_usage.
+    """
+    engine = retention.RetentionEngine(app)
+
     def cleanup_loop():
-        _cleanup_old_files(app) 
+        log.info("[DỌN DẸP] Bắt đầu kiểm tra và xóa các file đã cũ hơn %s ngày...", utils.DAYS_TO_KEEP)
+        result = _cleanup_old_files(app, engine)
+        if result:
+            # Lượt đầu luôn báo kết quả (kể cả khi không xóa gì)
+            app.cleanup_queue.put(result)
         while app.is_running:
-            time.sleep(CLEANUP_INTERVAL_SECONDS)
-            if app.is_running:
-                _cleanup_old_files(app)
+            time.sleep(config.RETENTION_CHECK_SECONDS)
+            if not app.is_running:
+                break
+            result = _cleanup_old_files(app, engine)
+            if result and result[0] > 0:
+                app.cleanup_queue.put(result)
     threading.Thread(target=cleanup_loop, daemon=True).start()
 
 def update_camera_status(app, camera, text, color):
-    print(f"[STATUS CAM {camera.name}]: {text}")
+    log.debug("[CAM %s] Trạng thái: %s", camera.name, text)
 
 def update_image_frame(app, frame, camera):
     pass
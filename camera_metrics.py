@@ -0,0 +1,248 @@
+# camera_metrics.py
+# Chỉ số hiệu năng theo từng camera: bộ đếm, giá trị tức thời (gauge), tốc độ (fps) và phân bố độ trễ.
+#
+# Mỗi Camera có một CameraMetrics (camera.metrics). Các luồng của camera cập nhật chỉ số của mình:
+# - Grabber (_frame_grabber_loop): fps đọc từ camera, thời gian read(), lỗi đọc, số lần kết nối lại.
+# - Preview (_camera_feed_loop): fps xử lý, độ cũ của camera.frame, frame bị bỏ qua (grabber ghi đè
+#   trước khi được xử lý), thời gian phát hiện QR, thời gian chuẩn bị/vẽ preview, số preview đang chờ
+#   luồng GUI vẽ (hàng đợi after()).
+# - Ghi hình (_record_loop): fps ghi, thời gian ghi mỗi frame, frame bị bỏ qua/ghi lặp, lỗi ghi;
+#   dung lượng đã ghi được recording.Recording cộng vào khi đóng từng đoạn video.
+#
+# Cập nhật chỉ là vài phép cộng và một lần bisect, không khóa: mỗi chỉ số chỉ được một luồng ghi,
+# luồng đọc (overlay, xuất file) chấp nhận số liệu lệch nhau trong vài micro giây.
+#
+# Xem trên giao diện: phím F3 bật/tắt overlay chẩn đoán trên preview (mặc định theo
+# CAMERA_DIAGNOSTICS_OVERLAY). Xuất ra file: CAMERA_METRICS_EXPORT_SECONDS > 0 ghi định kỳ một dòng JSON
+# cho mọi camera vào Logs/camera_metrics.jsonl (dùng để chọn cấu hình máy cho bàn đóng gói mới).
+
+import os
+import json
+import time
+import bisect
+import logging
+import datetime
+import threading
+from . import config, app_log, qr_detector
+
+log = logging.getLogger(__name__)
+
+EXPORT_FILE = os.path.join(app_log.LOG_DIR, 'camera_metrics.jsonl')
+
+# Mốc phân bố độ trễ (giây): 1ms ... 2s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0)
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+
+class Gauge:
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+class Meter:
+    """Bộ đếm kèm tốc độ (lần/giây) tính trên cửa sổ window giây gần nhất."""
+
+    def __init__(self, window=1.0):
+        self.window = window
+        self.count = 0
+        self.window_start = time.perf_counter()
+        self.window_count = 0
+        self.last_rate = 0.0
+
+    def mark(self, n=1):
+        self.count += n
+        self.window_count += n
+        now = time.perf_counter()
+        elapsed = now - self.window_start
+        if elapsed >= self.window:
+            self.last_rate = self.window_count / elapsed
+            self.window_start = now
+            self.window_count = 0
+
+    def rate(self):
+        # Không còn sự kiện nào (luồng dừng/mất hình): tốc độ về 0 thay vì giữ giá trị cũ
+        if time.perf_counter() - self.window_start > 2 * self.window:
+            return 0.0
+        return self.last_rate
+
+
+class Histogram:
+    """Phân bố giá trị theo các mốc buckets (giống histogram của Prometheus), kèm tổng, số lần và lần gần nhất."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)   # phần tử cuối: lớn hơn mốc cuối
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.last = value
+        if value > self.max:
+            self.max = value
+
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        """Ước lượng phân vị q (0..1): mốc trên của bucket chứa phân vị đó."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count, "sum": round(self.sum, 6), "mean": round(self.mean(), 6),
+            "p50": self.quantile(0.5), "p95": self.quantile(0.95), "max": round(self.max, 6),
+            "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts)),
+        }
+
+
+class CameraMetrics:
+    def __init__(self):
+        # Grabber
+        self.grab_frames = Meter()
+        self.grab_read_seconds = Histogram()
+        self.grab_failures = Counter()
+        self.connects = Counter()
+        self.connect_failures = Counter()
+        self.connect_seconds = Histogram()
+        # Preview / phát hiện QR
+        self.preview_frames = Meter()
+        self.preview_dropped = Counter()
+        self.frame_age_seconds = Gauge()
+        self.detect_seconds = Histogram()
+        self.qr_decoded = Counter()
+        self.prepare_seconds = Histogram()
+        self.render_scheduled = Counter()     # preview đã gửi sang luồng GUI (after)
+        self.render_seconds = Histogram()     # đo trên luồng GUI (update_image_frame)
+        # Ghi hình
+        self.recordings = Counter()
+        self.record_frames = Meter()
+        self.record_write_seconds = Histogram()
+        self.record_dropped = Counter()
+        self.record_repeated = Counter()
+        self.record_errors = Counter()
+        self.record_bytes = Counter()         # tính khi mỗi file/đoạn video được đóng (recording.Recording)
+
+    def reconnects(self):
+        """Số lần kết nối lại (các lần kết nối sau lần đầu)."""
+        return max(0, self.connects.value + self.connect_failures.value - 1)
+
+    def render_pending(self):
+        """Số preview đang chờ luồng GUI vẽ (tăng dần nghĩa là giao diện không vẽ kịp)."""
+        return max(0, self.render_scheduled.value - self.render_seconds.count)
+
+    def snapshot(self):
+        return {
+            "grab_fps": round(self.grab_frames.rate(), 2),
+            "grab_frames": self.grab_frames.count,
+            "grab_read_seconds": self.grab_read_seconds.snapshot(),
+            "grab_failures": self.grab_failures.value,
+            "connects": self.connects.value,
+            "connect_failures": self.connect_failures.value,
+            "reconnects": self.reconnects(),
+            "connect_seconds": self.connect_seconds.snapshot(),
+            "preview_fps": round(self.preview_frames.rate(), 2),
+            "preview_frames": self.preview_frames.count,
+            "preview_dropped": self.preview_dropped.value,
+            "frame_age_seconds": round(self.frame_age_seconds.value, 4),
+            "detect_seconds": self.detect_seconds.snapshot(),
+            "qr_decoded": self.qr_decoded.value,
+            "prepare_seconds": self.prepare_seconds.snapshot(),
+            "render_seconds": self.render_seconds.snapshot(),
+            "render_pending": self.render_pending(),
+            "recordings": self.recordings.value,
+            "record_fps": round(self.record_frames.rate(), 2),
+            "record_frames": self.record_frames.count,
+            "record_write_seconds": self.record_write_seconds.snapshot(),
+            "record_dropped": self.record_dropped.value,
+            "record_repeated": self.record_repeated.value,
+            "record_errors": self.record_errors.value,
+            "record_bytes": self.record_bytes.value,
+        }
+
+    def overlay_lines(self):
+        """Các dòng chữ ngắn cho overlay chẩn đoán trên preview."""
+        lines = [
+            f"grab {self.grab_frames.rate():4.1f}fps  read {self.grab_read_seconds.last * 1000:5.1f}ms  "
+            f"age {self.frame_age_seconds.value * 1000:4.0f}ms",
+            f"view {self.preview_frames.rate():4.1f}fps  drop {self.preview_dropped.value}  "
+            f"gui {self.render_seconds.last * 1000:5.1f}ms  wait {self.render_pending()}",
+            f"qr {self.detect_seconds.last * 1000:5.1f}ms  p95 {self.detect_seconds.quantile(0.95) * 1000:4.0f}ms  "
+            f"reconn {self.reconnects()}",
+        ]
+        if self.record_frames.count:
+            lines.append(
+                f"rec {self.record_frames.rate():4.1f}fps  write {self.record_write_seconds.last * 1000:5.1f}ms  "
+                f"drop {self.record_dropped.value}  err {self.record_errors.value}"
+            )
+        return lines
+
+
+# ----------------------------------------------------
+# ẢNH CHỤP TOÀN ỨNG DỤNG & XUẤT FILE
+# ----------------------------------------------------
+
+def collect(app):
+    """Chỉ số của mọi camera, kèm số lượt quét bị scan_router bỏ qua và trạng thái bộ phát hiện QR."""
+    suppressed = app.scan_router.suppressed_counts()
+    cameras = []
+    for camera in list(app.cameras):
+        entry = {"id": camera.id, "name": camera.name, "recording": camera.is_recording}
+        entry.update(camera.metrics.snapshot())
+        entry["scans_suppressed"] = suppressed.get(camera.id, {})
+        cameras.append(entry)
+    return {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "qr_detector": qr_detector.status(),
+        "cameras": cameras,
+    }
+
+
+def export(app, path=EXPORT_FILE):
+    """Ghi thêm một dòng JSON (collect) vào path."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(collect(app), ensure_ascii=False) + "\n")
+
+
+def start_export_thread(app, interval=None, path=EXPORT_FILE):
+    """Xuất chỉ số định kỳ ở luồng nền (interval mặc định CAMERA_METRICS_EXPORT_SECONDS, 0 = tắt)."""
+    interval = config.CAMERA_METRICS_EXPORT_SECONDS if interval is None else interval
+    if interval <= 0:
+        return None
+
+    def _run():
+        while app.is_running:
+            time.sleep(interval)
+            if not app.is_running:
+                break
+            try:
+                export(app, path)
+            except Exception as e:
+                log.warning("Không thể xuất chỉ số camera: %s", e)
+
+    thread = threading.Thread(target=_run, daemon=True, name="Camera metrics export")
+    thread.start()
+    return thread
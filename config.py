@@ -60,6 +60,66 @@ CAMERA_PREVIEW_WIDTH = 640
 CAMERA_PREVIEW_HEIGHT = 480
 FPS = 30.0
 
+# Chế độ ghi hình
+# - 'SEGMENTED': Ghi thành các đoạn ngắn, mỗi đoạn được đóng hoàn chỉnh ngay khi đủ thời lượng.
+#   Nếu mất điện/crash giữa chừng, các đoạn đã ghi vẫn xem được và được hoàn tất khi khởi động lại.
+# - 'SINGLE': Ghi một file .avi duy nhất cho mỗi đơn (cách cũ, file có thể hỏng nếu crash)
+RECORDING_MODE = 'SEGMENTED'
+
+# Độ dài mỗi đoạn video (giây). Đồng thời là chu kỳ cập nhật metadata trong lúc ghi.
+RECORDING_SEGMENT_SECONDS = 60
+
+# Lưu video/metadata theo thư mục ngày và camera: Video/YYYY/MM/DD/<camera>/<order>.avi
+# - True: Bố cục phân vùng (listdir, tìm kiếm và dọn dẹp nhanh khi kho lớn)
+# - False: Lưu phẳng trong Video/ và Metadata/ (cách cũ)
+# Kho cũ có thể chuyển sang bố cục mới bằng: python -m PackingApp.storage
+STORAGE_PARTITIONED = True
+
+# Metadata của các đơn đã ghi được lưu trong nhật ký theo ngày: Metadata/YYYY/MM/DD/journal.jsonl
+# - True: Ghi thêm file Metadata/.../<order>.json cho từng đơn (cho công cụ cũ đọc từng file)
+# - False: Chỉ ghi nhật ký; xuất JSON từng đơn khi cần bằng: python -m PackingApp.metadata_journal
+# (Bố cục phẳng luôn ghi kèm file JSON vì đường dẫn video không chứa ngày để tra nhật ký)
+METADATA_PER_ORDER_JSON = False
+
+# ============================================
+# CẤU HÌNH DỌN DẸP (RETENTION)
+# ============================================
+
+# Số ngày giữ video được đặt ở utils.DAYS_TO_KEEP.
+# Ngoài giới hạn theo tuổi, video cũ nhất sẽ bị xóa trước khi ổ đĩa đầy:
+# Tổng dung lượng tối đa của thư mục Video (GB). 0 = không giới hạn
+RETENTION_MAX_STORAGE_GB = 0
+
+# Dung lượng trống tối thiểu phải giữ trên ổ chứa Video (GB). 0 = không kiểm tra
+# (Nếu ổ đầy vì dữ liệu khác ngoài video, xóa video không đủ bù: chỉ xóa trong giới hạn bên dưới rồi cảnh báo)
+RETENTION_MIN_FREE_GB = 0
+
+# Hai chính sách dung lượng ở trên không bao giờ xóa video mới hơn số ngày này
+RETENTION_MIN_KEEP_DAYS = 3
+
+# Số video tối đa được xóa trong một lượt kiểm tra do vượt giới hạn dung lượng
+RETENTION_MAX_DELETE_PER_RUN = 100
+
+# Chu kỳ kiểm tra (giây) - đủ ngắn để phản ứng khi ổ đĩa đầy giữa ngày
+RETENTION_CHECK_SECONDS = 60
+
+# Số video xóa mỗi lô và thời gian nghỉ giữa các lô (tránh dồn I/O khi đang ghi hình)
+RETENTION_BATCH_SIZE = 20
+RETENTION_BATCH_PAUSE_SECONDS = 0.5
+
+# ============================================
+# CẤU HÌNH QUÉT MÃ QR
+# ============================================
+
+# Cùng một camera thấy lại cùng mã trong khoảng này (giây, tính từ lần thấy gần nhất) -> bỏ qua
+SCAN_REPEAT_SECONDS = 3
+
+# Camera khác vừa nhận cùng mã trong khoảng này (giây) -> bỏ qua (vùng nhìn các camera chồng nhau)
+SCAN_GLOBAL_SECONDS = 2
+
+# Cảnh báo đơn đã tồn tại / đang được camera khác ghi: tối đa một lần mỗi khoảng này cho mỗi camera
+SCAN_WARNING_SECONDS = 5
+
 
 # ============================================
 # CẤU HÌNH GIAO DIỆN
@@ -79,6 +139,62 @@ DEFAULT_WINDOW_HEIGHT = 700
 # Timeout cho API requests (giây)
 API_TIMEOUT = 10
 
-# Retry attempts
+# Retry attempts (chỉ lỗi kết nối và 502/503/504 của GET), thời gian chờ tăng dần: 0.5s, 1s, 2s...
 API_RETRY_ATTEMPTS = 3
+API_RETRY_BACKOFF = 0.5
+
+# Sau số lần lỗi liên tiếp này, tạm ngưng gọi API trong API_CIRCUIT_RESET_SECONDS giây
+# (các lần gọi lỗi ngay và dùng dữ liệu offline/session local thay vì chờ timeout)
+API_CIRCUIT_FAILURES = 3
+API_CIRCUIT_RESET_SECONDS = 30
+
+# Kết quả xác thực session với server được dùng lại trong khoảng này (giây)
+VALIDATION_CACHE_SECONDS = 15
+
+# Cập nhật session từ kiểm tra license được gộp lại và ghi ra .session.json sau khoảng này (giây)
+SESSION_SAVE_DELAY_SECONDS = 2
+
+# Chu kỳ kiểm tra license ở nền (giây) và biên độ dao động ngẫu nhiên (0.2 = ±20%)
+LICENSE_CHECK_SECONDS = 30
+LICENSE_CHECK_JITTER = 0.2
+
+# Kết quả kiểm tra license/session được dùng chung (khởi động, kiểm tra định kỳ, tab Tài khoản)
+# và dùng lại trong khoảng này (giây) thay vì gọi server lần nữa
+LICENSE_CACHE_SECONDS = 20
+
+# ============================================
+# CẤU HÌNH LOG
+# ============================================
+
+# Mức log chung: 'DEBUG', 'INFO', 'WARNING', 'ERROR'
+LOG_LEVEL = os.getenv('PACKINGAPP_LOG_LEVEL', 'INFO')
+
+# Mức log riêng cho từng module, ví dụ: {'auth': 'DEBUG', 'camera_logic': 'WARNING'}
+LOG_MODULE_LEVELS = {}
+
+# Cùng một thông báo lặp lại trong khoảng này (giây) chỉ được ghi một lần. 0 = ghi tất cả
+LOG_RATE_LIMIT_SECONDS = 10
+
+# File log xoay vòng Logs/packingapp.log: dung lượng tối đa mỗi file (MB) và số file cũ giữ lại
+LOG_FILE_MAX_MB = 5
+LOG_FILE_BACKUPS = 5
+
+# In log ra console (ngoài file)
+LOG_CONSOLE = True
+
+# ============================================
+# CẤU HÌNH CHỈ SỐ HIỆU NĂNG CAMERA
+# ============================================
+
+# Hiện overlay chỉ số (fps, độ trễ đọc/quét QR/vẽ, frame bị bỏ qua...) trên preview khi khởi động.
+# Có thể bật/tắt bất cứ lúc nào bằng phím F3
+CAMERA_DIAGNOSTICS_OVERLAY = False
+
+# Ghi chỉ số mọi camera vào Logs/camera_metrics.jsonl mỗi khoảng này (giây) và khi đóng ứng dụng. 0 = tắt
+CAMERA_METRICS_EXPORT_SECONDS = 0
 
+# Endpoint HTTP chỉ số cho Prometheus: http://<host>:<port>/metrics
+# Mặc định chỉ nghe trên máy này; đặt METRICS_HTTP_HOST = '0.0.0.0' (hoặc IP mạng nội bộ) để server giám sát đọc được
+METRICS_HTTP_ENABLED = os.getenv('PACKINGAPP_METRICS', 'false').lower() in ('1', 'true')
+METRICS_HTTP_HOST = os.getenv('PACKINGAPP_METRICS_HOST', '127.0.0.1')
+METRICS_HTTP_PORT = int(os.getenv('PACKINGAPP_METRICS_PORT', '9108'))
@@ -2,13 +2,18 @@
 
 import customtkinter as ctk
 import os
+import logging
 import cv2
 from PIL import Image
-from . import utils, config
-from .utils import get_video_metadata
+from . import utils, config, video_index, storage, thumbnails, video_player
 from . import account_widgets
 from . import camera_logic
 import json # Cần thiết để xử lý dữ liệu settings tạm thời
+import time
+import datetime
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
 
 class CameraWidget:
     """A class to hold the UI elements for a single camera."""
@@ -76,7 +81,7 @@ def update_image_frame(app, frame, camera):
             widget.video_label.configure(image=ctk_img, text="")
             widget.video_label.image = ctk_img # Keep a reference
     except Exception as e:
-        print(f"Error updating image for CAM {camera.name}: {e}")
+        log.error("Error updating image for CAM %s: %s", camera.name, e)
 
 
 def update_camera_status(app, camera, text, color):
@@ -272,6 +277,9 @@ def _create_search_frame(app):
     ctk.CTkLabel(search_widget_frame, text="Nhập Mã Đơn Hàng:", font=ctk.CTkFont(size=16)).grid(row=0, column=0, padx=10, pady=10, sticky="w")
     app.search_entry = ctk.CTkEntry(search_widget_frame, width=300, placeholder_text="Ví dụ: SPX...")
     app.search_entry.grid(row=0, column=1, padx=10, pady=10, sticky="ew")
+    # Lọc danh sách ngay khi gõ (chờ ngừng gõ rồi mới tìm); Enter = tìm và mở video
+    app.search_entry.bind("<KeyRelease>", lambda e: utils.schedule_incremental_search(app, create_list_buttons))
+    app.search_entry.bind("<Return>", lambda e: utils.search_video(app, create_list_buttons))
 
     action_buttons_frame = ctk.CTkFrame(search_widget_frame, fg_color="transparent")
     action_buttons_frame.grid(row=0, column=2, padx=10, pady=10)
@@ -282,7 +290,7 @@ def _create_search_frame(app):
     app.search_button_action.grid(row=0, column=0, padx=(0, 5), sticky="e")
     
     app.refresh_button = ctk.CTkButton(action_buttons_frame, text="🔄 LÀM MỚI", 
-                                       command=lambda: utils.display_file_list(app, create_list_buttons), 
+                                       command=lambda: utils.refresh_file_list(app, create_list_buttons), 
                                        fg_color=utils.COLOR_GREEN_ACTION,
                                        hover_color="#006400")
     app.refresh_button.grid(row=0, column=1, sticky="e")
@@ -294,85 +302,434 @@ def _create_search_frame(app):
     ctk.CTkLabel(app.search_frame, text="📦 DANH SÁCH VIDEO ĐÓNG GÓI:", 
                  font=ctk.CTkFont(size=16, weight="bold"), text_color=utils.COLOR_BLUE_ACTION).grid(row=3, column=0, padx=50, pady=(10, 5), sticky="w")
 
-    app.list_container_frame = ctk.CTkScrollableFrame(app.search_frame, fg_color="white", corner_radius=10, height=350)
-    app.list_container_frame.grid(row=4, column=0, padx=50, pady=(0, 10), sticky="ew")
-    app.list_container_frame.grid_columnconfigure(0, weight=1)
+    # Danh sách ảo hóa: chỉ tạo widget cho các dòng đang hiển thị, cuộn = truy vấn trang khác
+    app.video_list = VideoListView(app.search_frame, app)
+    app.video_list.frame.grid(row=4, column=0, padx=50, pady=(0, 10), sticky="ew")
+
+    # Trình xem nhúng: hiện khi bấm "Xem Video", tua nhanh bằng chỉ mục tua
+    app.preview_player = PreviewPlayerView(app.search_frame, app)
+    app.preview_player.frame.grid(row=5, column=0, padx=50, pady=(0, 10))
+    app.preview_player.frame.grid_remove()
 
     ctk.CTkLabel(app.search_frame, text=f"Thư mục lưu trữ: {utils.OUTPUT_DIR}", 
-                 text_color="#999").grid(row=5, column=0, pady=(0, 20))
+                 text_color="#999").grid(row=6, column=0, pady=(0, 20))
     
     utils.display_file_list(app, create_list_buttons)
 
-def create_list_buttons(app, file_names):
-    """Xóa các widget cũ và tạo bảng chi tiết video, căn chỉnh thẩm mỹ hơn."""
+# Số dòng hiển thị cùng lúc trong danh sách video (cũng là số dòng widget được tạo ra)
+VIDEO_LIST_VISIBLE_ROWS = 12
 
-    for widget in app.list_container_frame.winfo_children():
-        widget.destroy()
+# (Tiêu đề, trọng số cột, cột sắp xếp trong chỉ mục hoặc None nếu không sắp xếp được)
+VIDEO_LIST_HEADERS = [
+    ("STT", 1, None),
+    ("🎞 Xem Trước", 3, None),
+    ("Mã Đơn Hàng", 4, "order_id"),
+    ("🕐 Bắt Đầu", 3, "start_time"),
+    ("🛑 Kết Thúc", 3, None),
+    ("⏳ Thời Lượng", 2, "duration_seconds"),
+    ("Hành Động", 4, None),
+]
 
-    if not file_names:
-        ctk.CTkLabel(app.list_container_frame, text="Thư mục Video hiện đang trống.", 
-                      text_color="#666",
-                      font=ctk.CTkFont(family=utils.FONT_FAMILY_SYSTEM, size=utils.FONT_SIZE_NORMAL)).pack(padx=10, pady=10, fill="x")
-        return
 
-    headers = [("STT", 1), ("Mã Đơn Hàng", 4), ("🕐 Bắt Đầu", 3), ("🛑 Kết Thúc", 3), ("⏳ Thời Lượng", 2), ("Hành Động", 4)]
-    
-    header_frame = ctk.CTkFrame(app.list_container_frame, fg_color="#3B8ED0")
-    header_frame.pack(fill="x", padx=5, pady=(0, 2)) 
-    
-    for col_idx, (text, weight) in enumerate(headers):
-        label = ctk.CTkLabel(header_frame, text=text, 
-                             font=ctk.CTkFont(size=14, weight="bold"), 
-                             text_color="white")
-        label.grid(row=0, column=col_idx, sticky="nsew", padx=5, pady=5)
-        header_frame.grid_columnconfigure(col_idx, weight=weight)
-        
-    for i, file_name in enumerate(file_names):
-        file_path = os.path.join(utils.OUTPUT_DIR, file_name)
-        metadata = get_video_metadata(file_name) 
-        
-        row_frame = ctk.CTkFrame(app.list_container_frame)
-        row_frame.pack(fill="x", padx=5, pady=0)
-        
-        bg_color = ("#ffffff" if i % 2 == 0 else "#f0f0f0") 
-        row_frame.configure(fg_color=bg_color)
-        
-        for col_idx, (_, weight) in enumerate(headers):
-            row_frame.grid_columnconfigure(col_idx, weight=weight)
-            
-        ctk.CTkLabel(row_frame, text=f"{i+1}.", fg_color="transparent", 
-                     anchor="center").grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
-        
-        entry_file_name = ctk.CTkEntry(row_frame, fg_color="transparent", border_width=0, 
+# Ảnh xem trước đã nạp: {đường dẫn: (mtime, CTkImage)}, giới hạn để không giữ ảnh của cả kho
+_THUMBNAIL_IMAGE_CACHE_SIZE = 128
+_thumbnail_images = OrderedDict()
+
+
+def _load_thumbnail(file_name):
+    """CTkImage của dải ảnh xem trước, hoặc None nếu chưa được tạo."""
+    path = thumbnails.strip_path(file_name)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _thumbnail_images.get(path)
+    if cached and cached[0] == mtime:
+        _thumbnail_images.move_to_end(path)
+        return cached[1]
+    with Image.open(path) as img:
+        img.load()
+        width, height = img.size
+        image = ctk.CTkImage(light_image=img.copy(), size=(width, height))
+    _thumbnail_images[path] = (mtime, image)
+    while len(_thumbnail_images) > _THUMBNAIL_IMAGE_CACHE_SIZE:
+        _thumbnail_images.popitem(last=False)
+    return image
+
+
+class _VideoListRow:
+    """Một dòng của bảng video. Widget được tạo một lần và tái sử dụng khi cuộn."""
+    def __init__(self, parent, app):
+        self.app_ref = app
+        self.file_name = None
+        self.frame = ctk.CTkFrame(parent)
+        for col_idx, (_, weight, _) in enumerate(VIDEO_LIST_HEADERS):
+            self.frame.grid_columnconfigure(col_idx, weight=weight)
+
+        self.index_label = ctk.CTkLabel(self.frame, text="", fg_color="transparent", anchor="center")
+        self.index_label.grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
+
+        self.thumbnail_label = ctk.CTkLabel(self.frame, text="", fg_color="transparent", anchor="center",
+                                            text_color="#999")
+        self.thumbnail_label.grid(row=0, column=1, padx=5, pady=2, sticky="nsew")
+
+        self.name_entry = ctk.CTkEntry(self.frame, fg_color="transparent", border_width=0,
                                        text_color="#333", justify="left")
-        entry_file_name.insert(0, file_name)
-        entry_file_name.configure(state="readonly") 
-        entry_file_name.grid(row=0, column=1, padx=(5, 10), sticky="ew")
+        self.name_entry.grid(row=0, column=2, padx=(5, 10), sticky="ew")
 
-        ctk.CTkLabel(row_frame, text=metadata["start_time"], fg_color="transparent", 
-                     anchor="center").grid(row=0, column=2, padx=5, pady=5, sticky="nsew") 
-        
-        ctk.CTkLabel(row_frame, text=metadata["end_time"], fg_color="transparent", 
-                     anchor="center").grid(row=0, column=3, padx=5, pady=5, sticky="nsew") 
-        
-        ctk.CTkLabel(row_frame, 
-                     text=metadata["duration"], 
-                     font=ctk.CTkFont(size=14, weight="bold"), 
-                     text_color=utils.COLOR_ORANGE_ACCENT, 
-                     fg_color="transparent", 
-                     anchor="center").grid(row=0, column=4, padx=5, pady=5, sticky="nsew") 
-        
-        action_frame = ctk.CTkFrame(row_frame, fg_color="transparent")
-        action_frame.grid(row=0, column=5, padx=5, pady=5, sticky="e") 
-        
-        ctk.CTkButton(action_frame, text="▶ Xem Video", 
-                      command=lambda path=file_path: utils.open_file_or_dir(path), 
+        self.start_label = ctk.CTkLabel(self.frame, text="", fg_color="transparent", anchor="center")
+        self.start_label.grid(row=0, column=3, padx=5, pady=5, sticky="nsew")
+
+        self.end_label = ctk.CTkLabel(self.frame, text="", fg_color="transparent", anchor="center")
+        self.end_label.grid(row=0, column=4, padx=5, pady=5, sticky="nsew")
+
+        self.duration_label = ctk.CTkLabel(self.frame, text="",
+                                           font=ctk.CTkFont(size=14, weight="bold"),
+                                           text_color=utils.COLOR_ORANGE_ACCENT,
+                                           fg_color="transparent", anchor="center")
+        self.duration_label.grid(row=0, column=5, padx=5, pady=5, sticky="nsew")
+
+        action_frame = ctk.CTkFrame(self.frame, fg_color="transparent")
+        action_frame.grid(row=0, column=6, padx=5, pady=5, sticky="e")
+
+        # Lệnh của nút đọc self.file_name tại thời điểm bấm, nên không cần tạo lại nút khi dòng đổi dữ liệu
+        ctk.CTkButton(action_frame, text="▶ Xem Video",
+                      command=lambda: self.file_name and open_preview(app, self.file_name),
                       width=90, height=25, fg_color=utils.COLOR_ORANGE_ACCENT).pack(side="left", padx=(0, 5))
-                      
-        ctk.CTkButton(action_frame, text="✕ Xóa Video", 
-                      command=lambda name=file_name: utils.delete_video(app, name, create_list_buttons), 
+
+        ctk.CTkButton(action_frame, text="✕ Xóa Video",
+                      command=lambda: self.file_name and utils.delete_video(app, self.file_name, create_list_buttons),
                       width=90, height=25, fg_color=utils.COLOR_RED_EXIT).pack(side="left")
 
+    def show(self, position, record):
+        """Gán dữ liệu của một video cho dòng này."""
+        self.file_name = record["file_name"]
+        metadata = utils.format_index_record(record)
+
+        thumbnail = _load_thumbnail(self.file_name)
+        if thumbnail is not None:
+            self.thumbnail_label.configure(image=thumbnail, text="")
+        else:
+            # Video cũ chưa có ảnh xem trước: tạo ở luồng nền, xong thì vẽ lại danh sách
+            self.thumbnail_label.configure(image=None, text="...")
+            thumbnails.schedule(self.app_ref, self.file_name, on_done=self.app_ref.video_list.refresh)
+
+        self.frame.configure(fg_color=("#ffffff" if position % 2 == 0 else "#f0f0f0"))
+        self.index_label.configure(text=f"{position + 1}.")
+        self.name_entry.configure(state="normal")
+        self.name_entry.delete(0, "end")
+        # Chỉ hiện tên file; thư mục ngày/camera đã thể hiện qua cột thời gian
+        self.name_entry.insert(0, self.file_name.rsplit('/', 1)[-1])
+        self.name_entry.configure(state="readonly")
+        self.start_label.configure(text=metadata["start_time"])
+        self.end_label.configure(text=metadata["end_time"])
+        self.duration_label.configure(text=metadata["duration"])
+
+
+class VideoListView:
+    """
+    Bảng video ảo hóa cho tab Tra cứu.
+    Chỉ có VIDEO_LIST_VISIBLE_ROWS dòng widget; khi cuộn hoặc đổi cách sắp xếp,
+    các dòng được gán lại dữ liệu từ một trang truy vấn (LIMIT/OFFSET) trên chỉ mục.
+    """
+    def __init__(self, parent, app):
+        self.app = app
+        self.total = 0
+        self.first_row = 0
+        self.fetch_page = None
+        self.order_by = "file_mtime"
+        self.descending = True
+
+        self.frame = ctk.CTkFrame(parent, fg_color="white", corner_radius=10)
+        self.frame.grid_columnconfigure(0, weight=1)
+
+        # Tiêu đề cột (bấm để sắp xếp)
+        header_frame = ctk.CTkFrame(self.frame, fg_color="#3B8ED0")
+        header_frame.grid(row=0, column=0, sticky="ew", padx=5, pady=(5, 2))
+        self.header_widgets = {}
+        for col_idx, (text, weight, sort_column) in enumerate(VIDEO_LIST_HEADERS):
+            if sort_column:
+                widget = ctk.CTkButton(header_frame, text=text, fg_color="transparent", hover_color="#2F72A8",
+                                       font=ctk.CTkFont(size=14, weight="bold"), text_color="white",
+                                       command=lambda c=sort_column: self.sort_by(c))
+                self.header_widgets[sort_column] = (widget, text)
+            else:
+                widget = ctk.CTkLabel(header_frame, text=text,
+                                      font=ctk.CTkFont(size=14, weight="bold"), text_color="white")
+            widget.grid(row=0, column=col_idx, sticky="nsew", padx=5, pady=5)
+            header_frame.grid_columnconfigure(col_idx, weight=weight)
+
+        # Vùng dòng + thanh cuộn riêng (thanh cuộn ánh xạ tới vị trí trong toàn bộ kết quả)
+        body_frame = ctk.CTkFrame(self.frame, fg_color="transparent")
+        body_frame.grid(row=1, column=0, sticky="nsew", padx=5)
+        body_frame.grid_columnconfigure(0, weight=1)
+
+        self.rows_frame = ctk.CTkFrame(body_frame, fg_color="transparent")
+        self.rows_frame.grid(row=0, column=0, sticky="nsew")
+
+        self.scrollbar = ctk.CTkScrollbar(body_frame, command=self._on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+
+        self.rows = [_VideoListRow(self.rows_frame, app) for _ in range(VIDEO_LIST_VISIBLE_ROWS)]
+
+        self.message_label = ctk.CTkLabel(self.rows_frame, text="", text_color="#666",
+                                          font=ctk.CTkFont(family=utils.FONT_FAMILY_SYSTEM, size=utils.FONT_SIZE_NORMAL))
+
+        self.status_label = ctk.CTkLabel(self.frame, text="", text_color="#999")
+        self.status_label.grid(row=2, column=0, sticky="e", padx=10, pady=(0, 5))
+
+        # Con lăn chuột: gắn một bind tag riêng cho mọi widget con của danh sách (không dùng bind_all,
+        # vì bind_all/unbind_all thay thế rồi xóa binding toàn cục của các CTkScrollableFrame khác)
+        self.wheel_tag = f"VideoListWheel{id(self)}"
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.frame.bind_class(self.wheel_tag, sequence, self._on_mousewheel)
+        self._add_wheel_tag(self.frame)
+
+    # --- Nguồn dữ liệu ---
+
+    def set_source(self, total, fetch_page):
+        """Gán nguồn dữ liệu mới, giữ nguyên vị trí cuộn (trong giới hạn) để xóa/làm mới không bị nhảy."""
+        self.total = total
+        self.fetch_page = fetch_page
+        self._render()
+
+    def sort_by(self, column):
+        if self.order_by == column:
+            self.descending = not self.descending
+        else:
+            self.order_by = column
+            self.descending = column != "order_id"
+        for sort_column, (widget, text) in self.header_widgets.items():
+            arrow = (" ▼" if self.descending else " ▲") if sort_column == self.order_by else ""
+            widget.configure(text=f"{text}{arrow}")
+        self.first_row = 0
+        self._render()
+
+    def refresh(self):
+        """Vẽ lại trang đang xem (ví dụ khi ảnh xem trước vừa được tạo xong)."""
+        self._render()
+
+    def show_message(self, text, color="#666"):
+        for row in self.rows:
+            row.frame.pack_forget()
+        self.message_label.configure(text=text, text_color=color)
+        self.message_label.pack(padx=10, pady=10, fill="x")
+        self.status_label.configure(text="")
+
+    # --- Cuộn ---
+
+    def _max_first_row(self):
+        return max(0, self.total - VIDEO_LIST_VISIBLE_ROWS)
+
+    def scroll_to(self, first_row):
+        first_row = min(max(0, int(first_row)), self._max_first_row())
+        if first_row != self.first_row:
+            self.first_row = first_row
+            self._render()
+
+    def _on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            self.scroll_to(float(args[1]) * self.total)
+        elif args[0] == "scroll":
+            step = VIDEO_LIST_VISIBLE_ROWS if args[2] == "pages" else 1
+            self.scroll_to(self.first_row + int(args[1]) * step)
+
+    def _on_mousewheel(self, event):
+        if getattr(event, "num", None) == 4:
+            delta = -1
+        elif getattr(event, "num", None) == 5:
+            delta = 1
+        else:
+            delta = -1 if event.delta > 0 else 1
+        self.scroll_to(self.first_row + delta * 3)
+        return "break"
+
+    def _add_wheel_tag(self, widget):
+        """Gắn wheel_tag cho widget và mọi widget con (kể cả canvas/label bên trong các widget CTk)."""
+        tags = widget.bindtags()
+        if self.wheel_tag not in tags:
+            widget.bindtags((self.wheel_tag,) + tags)
+        for child in widget.winfo_children():
+            self._add_wheel_tag(child)
+
+    # --- Vẽ ---
+
+    def _render(self):
+        if not self.fetch_page:
+            return
+        if self.total == 0:
+            self.first_row = 0
+            self.scrollbar.set(0, 1)
+            self.show_message("Thư mục Video hiện đang trống.")
+            return
+
+        self.first_row = min(self.first_row, self._max_first_row())
+        records = self.fetch_page(self.first_row, VIDEO_LIST_VISIBLE_ROWS, self.order_by, self.descending)
+
+        self.message_label.pack_forget()
+        for i, row in enumerate(self.rows):
+            if i < len(records):
+                row.show(self.first_row + i, records[i])
+                row.frame.pack(fill="x", padx=0, pady=0)
+            else:
+                row.file_name = None
+                row.frame.pack_forget()
+
+        last_row = self.first_row + len(records)
+        self.scrollbar.set(self.first_row / self.total, last_row / self.total)
+        self.status_label.configure(text=f"Hiển thị {self.first_row + 1}-{last_row} / {self.total} video")
+
+
+# Kích thước khung hình của trình xem nhúng trong tab Tra cứu
+PREVIEW_PLAYER_SIZE = (640, 360)
+PREVIEW_PLAYER_POLL_MS = 30
+
+
+class PreviewPlayerView:
+    """
+    Trình xem video nhúng trong tab Tra cứu (ẩn cho tới khi mở một video).
+    Việc giải mã chạy ở video_player.PreviewDecoder; widget này chỉ hiển thị khung mới nhất
+    theo chu kỳ PREVIEW_PLAYER_POLL_MS và chuyển lệnh phát/tạm dừng/tua xuống bộ giải mã.
+    """
+    def __init__(self, parent, app):
+        self.app = app
+        self.decoder = None
+        self.shown_serial = 0
+        self.poll_job = None
+        self.slider_busy_until = 0.0
+
+        self.frame = ctk.CTkFrame(parent, fg_color="white", corner_radius=10)
+        self.frame.grid_columnconfigure(1, weight=1)
+
+        self.title_label = ctk.CTkLabel(self.frame, text="", font=ctk.CTkFont(size=14, weight="bold"), text_color="#333")
+        self.title_label.grid(row=0, column=0, columnspan=4, padx=10, pady=(8, 4), sticky="w")
+
+        self.video_label = ctk.CTkLabel(self.frame, text="", width=PREVIEW_PLAYER_SIZE[0],
+                                        height=PREVIEW_PLAYER_SIZE[1], fg_color="black")
+        self.video_label.grid(row=1, column=0, columnspan=4, padx=10, pady=4)
+
+        self.play_button = ctk.CTkButton(self.frame, text="⏸", width=40, command=self.toggle_play,
+                                         fg_color=utils.COLOR_BLUE_ACTION)
+        self.play_button.grid(row=2, column=0, padx=(10, 5), pady=(4, 10))
+
+        self.slider = ctk.CTkSlider(self.frame, from_=0, to=1, command=self._on_slider)
+        self.slider.grid(row=2, column=1, padx=5, pady=(4, 10), sticky="ew")
+
+        self.time_label = ctk.CTkLabel(self.frame, text="0:00:00 / 0:00:00", text_color="#666")
+        self.time_label.grid(row=2, column=2, padx=5, pady=(4, 10))
+
+        action_frame = ctk.CTkFrame(self.frame, fg_color="transparent")
+        action_frame.grid(row=2, column=3, padx=(5, 10), pady=(4, 10))
+        ctk.CTkButton(action_frame, text="Mở ngoài", width=80, fg_color=utils.COLOR_ORANGE_ACCENT,
+                      command=self._open_external).pack(side="left", padx=(0, 5))
+        ctk.CTkButton(action_frame, text="✕ Đóng", width=70, fg_color=utils.COLOR_RED_EXIT,
+                      command=self.close).pack(side="left")
+
+    @staticmethod
+    def _format_seconds(seconds):
+        return str(datetime.timedelta(seconds=int(seconds)))
+
+    def open(self, file_name):
+        """Mở một video (đường dẫn tương đối trong Video/) và bắt đầu phát."""
+        self._stop_decoder()
+        try:
+            self.decoder = video_player.PreviewDecoder(file_name, PREVIEW_PLAYER_SIZE)
+        except Exception as e:
+            log.error("[PLAYER] Không thể mở %s: %s", file_name, e)
+            utils.open_file_or_dir(storage.video_path(file_name))
+            return
+        self.shown_serial = 0
+        # Chỉ mục tua được nạp ở luồng giải mã: khóa thanh trượt cho tới khi có (xem _poll)
+        self.slider_ready = False
+        self.slider.configure(to=0.001, state="disabled")
+        self.slider.set(0)
+        self.title_label.configure(text=f"▶ {file_name.rsplit('/', 1)[-1]}")
+        self.play_button.configure(text="⏸")
+        self.frame.grid()
+        self.decoder.start()
+        self._poll()
+
+    def close(self):
+        self._stop_decoder()
+        self.frame.grid_remove()
+
+    def _stop_decoder(self):
+        if self.poll_job is not None:
+            self.frame.after_cancel(self.poll_job)
+            self.poll_job = None
+        if self.decoder is not None:
+            self.decoder.stop()
+            self.decoder = None
+
+    def toggle_play(self):
+        if self.decoder is None:
+            return
+        if self.decoder.paused and self.decoder.position >= self.decoder.duration - 0.1:
+            # Đang ở cuối video: phát lại từ đầu
+            self.decoder.seek(0)
+        self.decoder.set_paused(not self.decoder.paused)
+
+    def _on_slider(self, value):
+        if self.decoder is not None:
+            # Trong lúc kéo, không cập nhật ngược vị trí thanh trượt từ bộ giải mã
+            self.slider_busy_until = time.monotonic() + 0.3
+            self.decoder.seek(value)
+
+    def _open_external(self):
+        if self.decoder is not None:
+            utils.open_file_or_dir(storage.video_path(self.decoder.rel_file))
+
+    def _poll(self):
+        decoder = self.decoder
+        if decoder is None:
+            return
+        if not self.slider_ready and decoder.ready.is_set():
+            self.slider_ready = True
+            self.slider.configure(to=max(decoder.duration, 0.001), state="normal")
+        serial, image, position = decoder.latest_frame()
+        if image is not None and serial != self.shown_serial:
+            self.shown_serial = serial
+            ctk_img = ctk.CTkImage(light_image=image, size=image.size)
+            self.video_label.configure(image=ctk_img, text="")
+            self.video_label.image = ctk_img
+            if time.monotonic() > self.slider_busy_until:
+                self.slider.set(position)
+            self.time_label.configure(
+                text=f"{self._format_seconds(position)} / {self._format_seconds(decoder.duration)}")
+        self.play_button.configure(text="▶" if decoder.paused else "⏸")
+        self.poll_job = self.frame.after(PREVIEW_PLAYER_POLL_MS, self._poll)
+
+
+def open_preview(app, file_name):
+    """Mở video trong trình xem nhúng (nếu tab Tra cứu đã được tạo), nếu không thì mở bằng trình phát ngoài."""
+    player = getattr(app, "preview_player", None)
+    if player is not None:
+        player.open(file_name)
+    else:
+        utils.open_file_or_dir(storage.video_path(file_name))
+
+
+def create_list_buttons(app, total, fetch_page):
+    """Cập nhật bảng video với nguồn dữ liệu phân trang (chỉ vẽ các dòng đang hiển thị)."""
+    app.video_list.set_source(total, fetch_page)
+
+def on_catalog_changed(app, diff):
+    """
+    Được gọi từ luồng theo dõi thư mục khi có video thêm/xóa/đổi tên.
+    Chỉ cập nhật tổng số và vẽ lại trang đang xem, giữ nguyên vị trí cuộn.
+    Khi đang xem kết quả tìm kiếm thì tìm lại để danh sách vẫn chỉ gồm các video khớp.
+    """
+    total = video_index.get_index().count()
+
+    def _update():
+        if getattr(app, 'last_search_query', ''):
+            utils.incremental_search(app, create_list_buttons, force=True)
+        else:
+            create_list_buttons(app, total, utils.fetch_index_page)
+
+    if app.is_running:
+        app.after(0, _update)
+
 def _create_settings_frame(app):
     """Khung Cài đặt Camera (Mới)."""
     app.settings_frame = ctk.CTkFrame(app.main_content_frame, fg_color=utils.COLOR_BACKGROUND)
@@ -0,0 +1,213 @@
+# license_monitor.py
+# Trạng thái license/session dùng chung và kiểm tra license định kỳ ở luồng nền.
+#
+# Trước đây PackingApp gọi auth_manager.get_license_info() (requests, timeout 10 giây) ngay trên
+# luồng Tk mỗi 30 giây: khi server chậm/mất kết nối, toàn bộ giao diện và preview camera bị treo.
+# Tab Tài khoản lại tự gọi validate_session_with_server() và get_license_info() mỗi lần làm mới.
+#
+# Nay mọi nơi (khởi động, kiểm tra định kỳ, tab Tài khoản) đọc chung một LicenseState:
+# - Kết quả gần nhất (validate session + /license-info) được dùng lại trong LICENSE_CACHE_SECONDS.
+# - Chỉ một lần gọi server tại một thời điểm: ai cần làm mới khi đang có request thì chờ request đó.
+# - Ai cần biết khi có kết quả mới thì subscribe(); callback chạy trên luồng đã gọi server
+#   (phía giao diện phải tự chuyển về luồng GUI bằng after()).
+#
+# LicenseMonitor làm mới trạng thái theo chu kỳ có dao động ngẫu nhiên (LICENSE_CHECK_JITTER) để
+# nhiều máy không gọi server cùng lúc, và đưa mọi kết quả mới vào hàng đợi; PackingApp đọc hàng đợi
+# bằng after() (giống cleanup_queue) và chỉ xử lý kết quả trên luồng GUI.
+# Phản hồi /license-info hợp lệ gần nhất được giữ lại (last_good) để dùng khi server tạm thời không trả lời.
+
+import time
+import queue
+import random
+import logging
+import threading
+from . import config
+
+log = logging.getLogger(__name__)
+
+
+class LicenseSnapshot:
+    """Một lần kiểm tra: validation = (is_valid, message), license_result = (success, license_data, error)."""
+
+    def __init__(self, validation, license_result):
+        self.checked_at = time.monotonic()
+        self.validation = validation
+        self.license_result = license_result
+
+    def age(self):
+        return time.monotonic() - self.checked_at
+
+
+def _fetch(auth_manager, max_age=None):
+    """Gọi validate_user và /license-info song song. Returns: (validation, license_result)"""
+    license_result = []
+
+    def _license():
+        try:
+            license_result.append(auth_manager.get_license_info())
+        except Exception as e:
+            license_result.append((False, None, str(e)))
+
+    thread = threading.Thread(target=_license, daemon=True)
+    thread.start()
+    try:
+        validation = auth_manager.validate_session_with_server(max_age=max_age)
+    except Exception as e:
+        # Giống các nhánh lỗi trong validate_session_with_server: cho phép tiếp tục
+        validation = (True, f"Lỗi không xác định: {str(e)} - cho phép tiếp tục")
+    thread.join()
+    return validation, license_result[0]
+
+
+class LicenseState:
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else config.LICENSE_CACHE_SECONDS
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.inflight = None       # threading.Event trong lúc đang gọi server
+        self.generation = 0        # tăng khi reset(): kết quả của request cũ hơn không được lưu/báo
+        self.subscribers = []
+
+    def reset(self):
+        """Bỏ kết quả đã có (khi đăng nhập lại); request đang chạy cho session cũ không được lưu hay báo đi."""
+        with self.lock:
+            self.snapshot = None
+            self.inflight = None
+            self.generation += 1
+
+    def get(self, max_age=None):
+        """Kết quả gần nhất nếu chưa cũ hơn max_age giây (mặc định ttl), nếu không là None. Không gọi server."""
+        max_age = self.ttl if max_age is None else max_age
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.age() < max_age:
+            return snapshot
+        return None
+
+    def refresh(self, auth_manager, max_age=None):
+        """
+        Trả về kết quả chưa cũ hơn max_age giây; gọi server (chặn luồng hiện tại) nếu cần.
+        Nếu đang có request khác thì chờ và dùng kết quả của request đó. max_age=0: luôn làm mới.
+        """
+        with self.lock:
+            snapshot = self.get(max_age)
+            if snapshot is not None:
+                return snapshot
+            pending = self.inflight
+            owner = pending is None
+            if owner:
+                pending = self.inflight = threading.Event()
+            generation = self.generation
+        if not owner:
+            pending.wait()
+            return self.snapshot
+
+        snapshot = None
+        current = False
+        try:
+            snapshot = LicenseSnapshot(*_fetch(auth_manager, max_age))
+            with self.lock:
+                current = generation == self.generation
+                if current:
+                    self.snapshot = snapshot
+        finally:
+            with self.lock:
+                if self.inflight is pending:
+                    self.inflight = None
+            pending.set()
+        if current:
+            self._notify(snapshot)
+        return snapshot
+
+    def refresh_async(self, auth_manager, max_age=None):
+        """refresh() ở luồng nền; kết quả mới được báo qua subscribe()."""
+        threading.Thread(target=self.refresh, args=(auth_manager, max_age), daemon=True).start()
+
+    def subscribe(self, callback, replay=False):
+        """
+        callback(snapshot) được gọi mỗi khi có kết quả mới (replay=True: gọi ngay với kết quả hiện có).
+        Trả về hàm hủy đăng ký.
+        """
+        with self.lock:
+            self.subscribers.append(callback)
+            snapshot = self.snapshot
+        if replay and snapshot is not None:
+            callback(snapshot)
+
+        def unsubscribe():
+            with self.lock:
+                if callback in self.subscribers:
+                    self.subscribers.remove(callback)
+        return unsubscribe
+
+    def _notify(self, snapshot):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                log.exception("Lỗi khi báo trạng thái license: %s", e)
+
+
+# Trạng thái dùng chung của cả ứng dụng
+state = LicenseState()
+
+
+class LicenseMonitor:
+    def __init__(self, app, auth_manager, interval=None, jitter=None, license_state=None):
+        self.app = app
+        self.auth_manager = auth_manager
+        self.interval = interval if interval is not None else config.LICENSE_CHECK_SECONDS
+        self.jitter = jitter if jitter is not None else config.LICENSE_CHECK_JITTER
+        self.state = license_state if license_state is not None else state
+        self.results = queue.Queue()
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+        # (thời điểm time.time(), license_data) của lần kiểm tra thành công gần nhất
+        self.last_good = None
+        self.thread = None
+        # Mọi kết quả mới (kể cả do khởi động hay tab Tài khoản làm mới) đều được PackingApp xử lý
+        self.unsubscribe = self.state.subscribe(self._on_snapshot, replay=True)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.unsubscribe()
+        self.wake.set()
+
+    def check_now(self):
+        """Kiểm tra ngay (không chờ hết chu kỳ)."""
+        self.wake.set()
+
+    def next_delay(self):
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def last_good_license(self):
+        """license_data của lần kiểm tra thành công gần nhất, hoặc None."""
+        with self.lock:
+            return self.last_good[1] if self.last_good else None
+
+    def _on_snapshot(self, snapshot):
+        success, license_data, _ = snapshot.license_result
+        if success and license_data:
+            with self.lock:
+                self.last_good = (time.time(), license_data)
+        self.results.put(snapshot)
+
+    def check_once(self):
+        """
+        Làm mới trạng thái (trên luồng hiện tại). Không gọi server nếu nơi khác vừa làm mới
+        trong LICENSE_CACHE_SECONDS; kết quả mới đi vào hàng đợi qua _on_snapshot.
+        """
+        try:
+            self.state.refresh(self.auth_manager)
+        except Exception as e:
+            log.warning("Lỗi kiểm tra license: %s", e)
+
+    def _run(self):
+        while self.app.is_running:
+            self.check_once()
+            self.wake.wait(self.next_delay())
+            self.wake.clear()
@@ -1,20 +1,58 @@
 # main_app.py
 
 # -*- coding: utf-8 -*-
+from . import startup_profile  # nạp đầu tiên: mốc 0 để đo thời gian khởi động
+from . import app_log
+app_log.setup()  # trước các module khác để log lúc nạp module (auth...) cũng được ghi
 import customtkinter as ctk
+import logging
 import threading
 import sys
 import queue
-# Import các module đã chia nhỏ
+from concurrent.futures import ThreadPoolExecutor
+# Import các module đã chia nhỏ.
+# Chỉ các module cần cho cửa sổ đăng nhập và bước xác thực được nạp ngay; các module của cửa sổ chính
+# (kéo theo OpenCV, PIL, pyttsx3...) được nạp bởi _import_app_modules() - ở luồng nền trong lúc
+# cửa sổ đăng nhập/bước xác thực đang chạy, hoặc khi tạo PackingApp.
 from . import utils
-from . import gui_widgets
-from . import camera_logic
+from . import config
 from . import login_window
 from . import activate_window
 from . import auth
+from . import license_monitor
+from . import qr_detector
+from . import camera_metrics
+
+# Chạy bằng python -m nên __name__ là "__main__": đặt tên theo package để log đi qua app_log
+log = logging.getLogger(f"{app_log.PACKAGE}.main_app")
+
+gui_widgets = camera_logic = recording = video_index = video_catalog = search_index = scan_router = None
+metrics_server = None
+
+
+def _import_app_modules():
+    """Nạp các module của cửa sổ chính (gọi nhiều lần không sao)."""
+    global gui_widgets, camera_logic, recording, video_index, video_catalog, search_index, scan_router
+    global metrics_server
+    from . import gui_widgets, camera_logic, recording, video_index, video_catalog, search_index, scan_router
+    from . import metrics_server
+
+
+def preload_app_modules():
+    """Nạp trước các module của cửa sổ chính và model QReader ở luồng nền."""
+    def _run():
+        try:
+            _import_app_modules()
+        except Exception as e:
+            log.error("⚠️ Lỗi nạp trước module: %s", e)
+    threading.Thread(target=_run, daemon=True).start()
+    # Nạp và chạy thử model QReader một lần, dùng chung cho mọi camera và giữ qua các lần restart camera
+    qr_detector.warm_up()
+
 
 class PackingApp(ctk.CTk):
-    def __init__(self, user_data=None):
+    def __init__(self, user_data=None, startup_check=None):
+        _import_app_modules()
         super().__init__()
         self.title("Packing System - Exon Technology")
         # self.geometry("1000x750")
@@ -32,6 +70,13 @@ class PackingApp(ctk.CTk):
         
         # Lock đồng bộ hóa
         self.lock = threading.Lock()
+
+        # Lọc lượt quét QR lặp lại ngay trong luồng camera (trước khi tới GUI)
+        self.scan_router = scan_router.ScanRouter()
+
+        # Overlay chỉ số hiệu năng trên preview từng camera (phím F3 bật/tắt)
+        self.show_diagnostics = config.CAMERA_DIAGNOSTICS_OVERLAY
+        self.bind("<F3>", lambda e: self.toggle_diagnostics())
         
         # Queue for cleanup thread communication
         self.cleanup_queue = queue.Queue()
@@ -53,18 +98,57 @@ class PackingApp(ctk.CTk):
         if self.user_data:
             self.show_user_info()
         
-        # ✅ Tạo periodic check để tự động logout khi key hết hạn
-        # Check mỗi 30 giây
-        self.check_key_periodically()
+        # ✅ Kiểm tra license định kỳ ở luồng nền để tự động logout khi key hết hạn
+        # (không gọi API trên luồng GUI); kết quả được xử lý trong process_license_queue.
+        # Lần kiểm tra đầu dùng chung kết quả với bước xác thực lúc khởi động (license_monitor.state)
+        self.license_monitor = license_monitor.LicenseMonitor(self, self.auth_manager)
+        # Session bị server từ chối: đóng cửa sổ chính và quay lại cửa sổ đăng nhập (xem __main__)
+        self.relogin_requested = False
+        self.license_monitor.start()
+        self.process_license_queue()
+        if startup_check is not None:
+            self.after(200, lambda: self.await_startup_verdict(startup_check))
 
     def start_background_tasks(self):
         """Start background threads after the GUI is fully initialized and running."""
+        # Hoàn tất các bản ghi bị gián đoạn ở lần chạy trước (crash/mất điện) trước khi camera chạy
+        recovered = recording.recover_interrupted_recordings()
+        if recovered:
+            log.info("[KHÔI PHỤC] Đã hoàn tất %d bản ghi dở dang.", recovered)
+
+        # Nạp tập mã đơn đã ghi từ chỉ mục để kiểm tra trùng đơn trong bộ nhớ ngay từ lần quét đầu
+        video_catalog.known_orders.load(video_index.get_index().order_ids())
+
+        # Theo dõi Video/ và Metadata/ để cập nhật danh sách tra cứu theo từng thay đổi
+        self.catalog_watcher = video_catalog.CatalogWatcher(
+            self, on_change=lambda diff: gui_widgets.on_catalog_changed(self, diff)
+        )
+        self.catalog_watcher.start()
+
+        # Đồng bộ chỉ mục video với ổ đĩa ở luồng nền, xong thì vẽ lại danh sách tra cứu
+        # và dựng sẵn chỉ mục tìm kiếm khi gõ
+        def _on_index_synced():
+            utils.display_file_list(self, gui_widgets.create_list_buttons)
+            search_index.warm_up()
+
+        video_index.start_sync_thread(self, on_done=_on_index_synced)
+
         # Khởi động luồng camera từ camera_logic
         camera_logic.start_camera_threads(self)
         
         # Khoi dong luong don dep dinh ky
         camera_logic.start_cleanup_thread(self)
 
+        # Xuất chỉ số camera định kỳ ra Logs/camera_metrics.jsonl (nếu bật trong config)
+        camera_metrics.start_export_thread(self)
+
+        # Endpoint Prometheus cho giám sát tập trung (nếu bật trong config)
+        self.metrics_server = metrics_server.start(self)
+
+    def toggle_diagnostics(self):
+        """Bật/tắt overlay chỉ số camera (camera_metrics) trên preview."""
+        self.show_diagnostics = not self.show_diagnostics
+
     def process_cleanup_queue(self):
         """Process messages from the cleanup queue to update the GUI safely."""
         try:
@@ -85,61 +169,122 @@ class PackingApp(ctk.CTk):
             if session:
                 key_status, status_msg = self.auth_manager.check_key_status()
                 # Có thể thêm label hiển thị thông tin user ở header nếu cần
-                print(f"Đã đăng nhập: {session.get('email_or_phone')}")
-                print(f"Key status: {status_msg}")
+                log.info("Đã đăng nhập: %s", session.get('email_or_phone'))
+                log.info("Key status: %s", status_msg)
     
-    def check_key_periodically(self):
-        """✅ Check key expiration định kỳ và tự động logout nếu hết hạn"""
+    def await_startup_verdict(self, startup_check):
+        """
+        Chờ kết quả xác thực lúc khởi động (start_startup_auth) mà không chặn giao diện/camera.
+        Session không hợp lệ -> quay lại cửa sổ đăng nhập; license không hợp lệ -> báo lỗi và đóng ứng dụng.
+        """
         if not self.is_running:
             return
-        
+        if not startup_check.done():
+            self.after(200, lambda: self.await_startup_verdict(startup_check))
+            return
+        try:
+            is_valid, title, message, relogin = startup_check.result()
+        except Exception as e:
+            log.error("⚠️ Error in startup auth check: %s", e)
+            return
+        if is_valid:
+            log.info("✅ %s", message)
+            return
+
+        log.warning("❌ %s: %s", title, message)
+        if relogin:
+            self.request_relogin(title, message)
+        else:
+            self.close_for_auth(title, message)
+
+    def request_relogin(self, title, message):
+        """Báo lỗi, đóng cửa sổ chính và quay lại cửa sổ đăng nhập trong cùng tiến trình. Trả về False."""
+        if getattr(self, 'closing_for_auth', False):
+            return False
+        self.closing_for_auth = True
+        self.relogin_requested = True
+        try:
+            import tkinter.messagebox as messagebox
+            messagebox.showerror(title, message)
+        except Exception as e:
+            log.error("Error showing message box: %s", e)
+        self.on_closing()
+        return False
+
+    def close_for_auth(self, title, message):
+        """Báo lỗi xác thực và đóng ứng dụng (chỉ một lần dù nhiều nơi cùng phát hiện). Trả về False."""
+        if getattr(self, 'closing_for_auth', False):
+            return False
+        self.closing_for_auth = True
+        try:
+            import tkinter.messagebox as messagebox
+            messagebox.showerror(title, message)
+        except Exception as e:
+            log.error("Error showing message box: %s", e)
+        self.on_closing()
+        sys.exit(0)
+        return False
+
+    def process_license_queue(self):
+        """Xử lý kết quả kiểm tra license từ luồng nền (chạy trên luồng GUI)."""
+        try:
+            while not self.license_monitor.results.empty():
+                snapshot = self.license_monitor.results.get_nowait()
+                if not self.apply_license_state(snapshot):
+                    return
+        except queue.Empty:
+            pass
+        finally:
+            if self.is_running:
+                self.after(1000, self.process_license_queue)
+
+    def apply_license_state(self, snapshot):
+        """Xử lý một kết quả của license_monitor.state. Trả về False nếu ứng dụng đã đóng."""
+        is_valid, validation_message = snapshot.validation
+        if not is_valid:
+            # User đã bị xóa hoặc suspended - tự động logout
+            log.warning("❌ Session không hợp lệ: %s - auto logout", validation_message)
+            self.auth_manager.clear_session()
+            return self.request_relogin(
+                "Tài khoản không hợp lệ",
+                f"{validation_message}\n\nVui lòng đăng nhập lại."
+            )
+        return self.apply_license_result(*snapshot.license_result)
+
+    def apply_license_result(self, license_success, license_data, license_error):
+        """✅ Tự động logout nếu key hết hạn/bị đình chỉ. Trả về False nếu ứng dụng đã đóng."""
         try:
-            # Gọi API /license-info để check key status
-            license_success, license_data, license_error = self.auth_manager.get_license_info()
-            
             if license_error == "KEY_EXPIRED":
                 # Key hết hạn → tự động đăng xuất
-                print(f"❌ KEY_EXPIRED detected - auto logout")
+                log.warning("❌ KEY_EXPIRED detected - auto logout")
                 self.auth_manager.clear_session()
-                import tkinter.messagebox as messagebox
-                try:
-                    messagebox.showerror(
-                        "Key đã hết hạn",
-                        "Key đã hết hạn hoặc bị xóa. Vui lòng liên hệ admin để gia hạn.\n\nỨng dụng sẽ đóng."
-                    )
-                except:
-                    pass
-                self.on_closing()
-                sys.exit(0)
-                return
+                return self.close_for_auth(
+                    "Key đã hết hạn",
+                    "Key đã hết hạn hoặc bị xóa. Vui lòng liên hệ admin để gia hạn.\n\nỨng dụng sẽ đóng."
+                )
             elif license_success and license_data:
                 status = license_data.get('status', 'expired')
                 if status == 'expired' or status == 'suspended':
                     # Key hết hạn hoặc bị đình chỉ
-                    print(f"❌ Key status: {status} - auto logout")
+                    log.warning("❌ Key status: %s - auto logout", status)
                     self.auth_manager.clear_session()
-                    import tkinter.messagebox as messagebox
-                    try:
-                        messagebox.showerror(
-                            "Key không hợp lệ",
-                            f"Key đã {status == 'expired' and 'hết hạn' or 'bị đình chỉ'}. Vui lòng liên hệ admin để gia hạn.\n\nỨng dụng sẽ đóng."
-                        )
-                    except:
-                        pass
-                    self.on_closing()
-                    sys.exit(0)
-                    return
+                    return self.close_for_auth(
+                        "Key không hợp lệ",
+                        f"Key đã {status == 'expired' and 'hết hạn' or 'bị đình chỉ'}. Vui lòng liên hệ admin để gia hạn.\n\nỨng dụng sẽ đóng."
+                    )
+            elif license_error:
+                # Server tạm thời không trả lời: tiếp tục với phản hồi hợp lệ gần nhất (nếu có)
+                log.warning("⚠️ License check failed (%s), last good: %s", license_error, self.license_monitor.last_good_license())
         except Exception as e:
-            print(f"⚠️ Error in periodic key check: {e}")
-        
-        # Schedule next check (30 seconds)
-        if self.is_running:
-            self.after(30000, self.check_key_periodically)  # 30 seconds = 30000 ms
+            log.error("⚠️ Error in periodic key check: %s", e)
+        return True
     
     # Sự kiện đóng cửa sổ
     def on_closing(self):
         """Xử lý sự kiện đóng cửa sổ."""
         self.is_running = False
+        self.license_monitor.stop()
+        metrics_server.stop(getattr(self, 'metrics_server', None))
         
         # Dừng tất cả các bản ghi đang hoạt động
         camera_logic._stop_all_recordings(self)
@@ -153,6 +298,15 @@ class PackingApp(ctk.CTk):
         for camera in self.cameras:
             camera.release()
 
+        if config.CAMERA_METRICS_EXPORT_SECONDS > 0:
+            try:
+                camera_metrics.export(self)
+            except Exception as e:
+                log.warning("Không thể xuất chỉ số camera: %s", e)
+
+        for camera_id, counts in self.scan_router.suppressed_counts().items():
+            log.info("[SCAN] Camera %s: đã bỏ qua %d lượt quét %s", camera_id, sum(counts.values()), counts)
+
         self.destroy()
 
 def check_license_status(auth_manager):
@@ -199,14 +353,14 @@ def check_license_status(auth_manager):
                 if now > expires_date:
                     return False, "Key đã hết hạn"
             except Exception as e:
-                print(f"⚠️ Lỗi parse key_expires_at: {e}")
+                log.warning("⚠️ Lỗi parse key_expires_at: %s", e)
         
         # Nếu không có trong session, check từ database qua validate_user
         # validate_user đã check rồi, nếu pass thì OK
         return True, "License hợp lệ"
         
     except Exception as e:
-        print(f"❌ Lỗi kiểm tra license: {e}")
+        log.error("❌ Lỗi kiểm tra license: %s", e)
         # Nếu không thể check từ server, dùng session làm fallback
         key_expires_at = session.get('key_expires_at')
         if key_expires_at:
@@ -223,6 +377,63 @@ def check_license_status(auth_manager):
         
         return False, f"Lỗi kiểm tra license: {str(e)}"
 
+def _startup_verdict(auth_manager):
+    """
+    Làm mới license_monitor.state (validate session và /license-info gọi song song) rồi kết luận.
+    Returns: (is_valid, title, message, relogin) - relogin: session bị từ chối, cần đăng nhập lại
+    """
+    snapshot = license_monitor.state.refresh(auth_manager)
+
+    is_valid, validation_message = snapshot.validation
+    if not is_valid:
+        # Session không hợp lệ hoặc user bị suspended - xóa session và yêu cầu đăng nhập lại
+        auth_manager.clear_session()
+        return (False, "Phiên đăng nhập không hợp lệ",
+                f"{validation_message}\n\nVui lòng đăng nhập lại.", True)
+
+    # ✅ [3] Session đã được update trong get_license_info()
+    license_success, license_data, license_error = snapshot.license_result
+    if license_success and license_data:
+        log.info("✅ License info received: expire_at=%s, days_left=%s, status=%s",
+                 license_data.get('expire_at'), license_data.get('days_left'), license_data.get('status'))
+        if license_data.get('status') == 'expired':
+            # Key hết hạn - force logout
+            auth_manager.clear_session()
+            return (False, "Key đã hết hạn",
+                    "Key đã hết hạn – vui lòng liên hệ Admin để gia hạn.\n\nỨng dụng sẽ đóng.", False)
+    elif license_error:
+        log.warning("⚠️ License info error: %s", license_error)
+
+    # Kiểm tra license status (key expiration) - validate bên trong dùng lại kết quả vừa có (cache TTL)
+    # Key chỉ dùng 1 lần để activate account, sau đó chỉ check expiration
+    license_valid, license_message = check_license_status(auth_manager)
+    if not license_valid:
+        # KHÔNG hiển thị activate_window vì key đã được dùng để activate account rồi
+        error_msg = f"Không thể sử dụng ứng dụng:\n{license_message}\n\n"
+        if "hết hạn" in license_message.lower():
+            error_msg += "Vui lòng gia hạn key trên Web App để tiếp tục sử dụng."
+        elif "chưa kích hoạt" in license_message.lower():
+            error_msg += "Vui lòng sử dụng key để kích hoạt tài khoản lần đầu."
+        else:
+            error_msg += "Vui lòng liên hệ admin để được hỗ trợ."
+        return False, "Lỗi License", error_msg, False
+
+    return True, None, license_message, False
+
+
+def start_startup_auth(auth_manager):
+    """
+    Validate session và lấy /license-info song song ở luồng nền (trước đây: 3 request nối tiếp,
+    mỗi request timeout 10 giây, trước khi cửa sổ chính hiện ra). Tab Tài khoản và kiểm tra định kỳ
+    dùng chung kết quả này thay vì tự gọi server.
+    Returns: Future của (is_valid, title, message, relogin) - xem _startup_verdict.
+    """
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="startup-auth")
+    verdict = executor.submit(_startup_verdict, auth_manager)
+    executor.shutdown(wait=False)
+    return verdict
+
+
 if __name__ == "__main__":
     import os
     # Force OpenCV to use TCP for RTSP, which is more reliable than UDP over many networks.
@@ -234,104 +445,59 @@ if __name__ == "__main__":
     ctk.set_appearance_mode("Light")
     ctk.set_default_color_theme("blue")
     
+    # Nạp OpenCV/QReader... ở nền trong lúc hiển thị cửa sổ đăng nhập và xác thực
+    preload_app_modules()
+    
     auth_manager = auth.AuthManager()
     
     # Kiểm tra xem đã đăng nhập chưa
     session = auth_manager.get_session_info()
     is_logged_in = session and session.get('email_or_phone')
     
-    # Nếu có session, validate với server để đảm bảo user vẫn tồn tại và không bị suspended (REAL-TIME CHECK)
-    if is_logged_in:
-        # Không phải offline mode thì phải validate với server (check real-time từ database)
-        if not auth_manager.session_data.get('offline_mode'):
-            print("🔍 Đang kiểm tra session với server (real-time check)...")
-            is_valid, validation_message = auth_manager.validate_session_with_server()
-            if not is_valid:
-                # Session không hợp lệ hoặc user bị suspended - xóa session và yêu cầu đăng nhập lại
-                print(f"⚠️ Session không hợp lệ hoặc user bị đình chỉ: {validation_message}")
-                auth_manager.clear_session()
-                is_logged_in = False
-            else:
-                print(f"✅ Session hợp lệ: {validation_message}")
-    
-    if not is_logged_in:
-        # Hiển thị cửa sổ đăng nhập
-        login_win = login_window.LoginWindow()
-        login_success, user_data = login_win.run()
-        
-        if not login_success or not user_data:
-            # Đăng nhập thất bại, thoát ứng dụng
-            sys.exit(0)
-        
-        # Reload session sau khi đăng nhập
-        auth_manager.load_session()
-    
-    # Kiểm tra license status (key expiration) - REAL-TIME từ API /license-info
-    # Key chỉ dùng 1 lần để activate account, sau đó chỉ check expiration
-    license_valid, license_message = check_license_status(auth_manager)
-    
-    # Gọi API /license-info để lấy thông tin real-time và cập nhật session
-    # ✅ [3] Session sẽ được update tự động trong get_license_info()
-    try:
-        license_success, license_data, license_error = auth_manager.get_license_info()
-        if license_success and license_data:
-            # Session đã được update trong get_license_info(), chỉ log để debug
-            print(f"✅ License info received: expire_at={license_data.get('expire_at')}, days_left={license_data.get('days_left')}, status={license_data.get('status')}")
+    # Chọn cửa sổ theo session lưu trên máy (không gọi server trước khi có cửa sổ); việc validate
+    # với server chạy ở nền (start_startup_auth) - session không hợp lệ thì quay lại cửa sổ đăng nhập
+    while True:
+        if not is_logged_in:
+            # Hiển thị cửa sổ đăng nhập
+            login_win = login_window.LoginWindow()
+            login_win.after(0, lambda: startup_profile.mark(startup_profile.MARK_LOGIN_WINDOW))
+            if startup_profile.BENCHMARK:
+                login_win.after(500, login_win.destroy)
+            login_success, user_data = login_win.run()
             
-            if license_data.get('status') == 'expired':
-                # Key hết hạn - force logout
-                print(f"❌ Key đã hết hạn - forcing logout")
-                auth_manager.clear_session()
-                import tkinter.messagebox as messagebox
-                messagebox.showerror(
-                    "Key đã hết hạn",
-                    "Key đã hết hạn – vui lòng liên hệ Admin để gia hạn.\n\nỨng dụng sẽ đóng."
-                )
+            if not login_success or not user_data:
+                # Đăng nhập thất bại, thoát ứng dụng
                 sys.exit(0)
-        elif license_error:
-            print(f"⚠️ License info error: {license_error}")
-    except Exception as e:
-        print(f"⚠️ Error getting license info: {e}")
-    
-    if not license_valid:
-        # Key hết hạn hoặc chưa activate - báo lỗi và thoát
-        # KHÔNG hiển thị activate_window vì key đã được dùng để activate account rồi
-        print(f"❌ License không hợp lệ: {license_message}")
-        
-        # Hiển thị thông báo lỗi cho user
-        try:
-            import tkinter.messagebox as messagebox
-            error_msg = f"Không thể sử dụng ứng dụng:\n{license_message}\n\n"
-            if "hết hạn" in license_message.lower():
-                error_msg += "Vui lòng gia hạn key trên Web App để tiếp tục sử dụng."
-            elif "chưa kích hoạt" in license_message.lower():
-                error_msg += "Vui lòng sử dụng key để kích hoạt tài khoản lần đầu."
-            else:
-                error_msg += "Vui lòng liên hệ admin để được hỗ trợ."
             
-            messagebox.showerror("Lỗi License", error_msg)
-        except Exception as e:
-            print(f"Error showing message box: {e}")
+            # Reload session sau khi đăng nhập
+            auth_manager.load_session()
         
-        # Thoát ứng dụng
-        sys.exit(0)
+        # Thông tin user lấy từ session trước khi luồng kiểm tra có thể xóa session
+        session = auth_manager.get_session_info()
+        user_data = {
+            'email_or_phone': session.get('email_or_phone'),
+            'is_admin': session.get('is_admin', False),
+            'user_id': session.get('user_id'),
+            'key': session.get('key'),
+            'key_data': {
+                'phone': session.get('key_phone'),
+                'expires_at': session.get('key_expires_at')
+            } if session.get('key') else None
+        }
         
-        # Reload session sau khi kích hoạt thành công
-        auth_manager.load_session()
-    
-    # Đăng nhập và license đều OK, mở app chính
-    session = auth_manager.get_session_info()
-    user_data = {
-        'email_or_phone': session.get('email_or_phone'),
-        'is_admin': session.get('is_admin', False),
-        'user_id': session.get('user_id'),
-        'key': session.get('key'),
-        'key_data': {
-            'phone': session.get('key_phone'),
-            'expires_at': session.get('key_expires_at')
-        } if session.get('key') else None
-    }
-    
-    app = PackingApp(user_data=user_data)
-    app.protocol("WM_DELETE_WINDOW", app.on_closing)
-    app.mainloop()
\ No newline at end of file
+        # Validate session (REAL-TIME CHECK: user còn tồn tại, không bị suspended) và kiểm tra license
+        # ở luồng nền; cửa sổ chính và camera khởi động ngay, kết quả được xử lý khi có
+        log.info("🔍 Đang kiểm tra session và license với server (real-time check)...")
+        startup_check = start_startup_auth(auth_manager)
+        
+        # Mở app chính (đóng lại nếu bước kiểm tra trên kết luận session/license không hợp lệ)
+        app = PackingApp(user_data=user_data, startup_check=startup_check)
+        app.after(0, lambda: startup_profile.mark(startup_profile.MARK_MAIN_WINDOW))
+        app.protocol("WM_DELETE_WINDOW", app.on_closing)
+        app.mainloop()
+        
+        if not app.relogin_requested:
+            break
+        # Session bị server từ chối: đăng nhập lại trong cùng tiến trình, bỏ kết quả kiểm tra của session cũ
+        license_monitor.state.reset()
+        is_logged_in = False
\ No newline at end of file
@@ -0,0 +1,160 @@
+# metadata_journal.py
+# Nhật ký metadata theo ngày (JSON Lines, chỉ ghi nối thêm):
+#     Metadata/YYYY/MM/DD/journal.jsonl   - mỗi dòng là metadata của một bản ghi đã hoàn tất
+#
+# Thay cho việc ghi một file Metadata/<order>.json cho mỗi đơn: liệt kê/báo cáo một ngày
+# chỉ cần mở một file. Ngày của nhật ký là ngày bắt đầu ghi (start_time), trùng với thư mục
+# phân vùng của video nên dọn dẹp theo ngày xóa luôn nhật ký.
+#
+# File JSON riêng cho từng đơn (tương thích công cụ cũ) được xuất theo yêu cầu:
+#     python -m PackingApp.metadata_journal SPX123 SPX456   # xuất một số đơn
+#     python -m PackingApp.metadata_journal --day 2025-12-11  # xuất cả một ngày
+# hoặc bật config.METADATA_PER_ORDER_JSON để vẫn ghi kèm như trước.
+#
+# Vì chỉ ghi nối thêm, vị trí (byte) của dòng trong nhật ký là "phiên bản" của metadata một đơn:
+# không đổi khi các đơn khác được ghi thêm, chỉ đổi khi chính đơn đó có dòng mới. Chỉ mục và
+# danh mục so sánh vị trí này thay cho mtime của cả file (đổi sau mỗi lần ghi nối).
+
+import os
+import json
+import threading
+import datetime
+from . import utils, storage
+
+JOURNAL_FILE_NAME = "journal.jsonl"
+
+_append_lock = threading.Lock()
+
+# Nhật ký đã đọc: {đường dẫn: (chữ ký, vị trí sau dòng đầy đủ cuối cùng, {order_id: (vị trí dòng, metadata)})}
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def journal_path(day):
+    """Đường dẫn nhật ký của một ngày (date/datetime)."""
+    return os.path.join(utils.METADATA_DIR, f"{day:%Y}", f"{day:%m}", f"{day:%d}", JOURNAL_FILE_NAME)
+
+
+def append(metadata):
+    """Ghi nối một bản ghi vào nhật ký của ngày bắt đầu ghi (flush + fsync để không mất khi mất điện)."""
+    start_time = datetime.datetime.fromisoformat(metadata["start_time"])
+    path = journal_path(start_time)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    line = json.dumps(metadata, ensure_ascii=False) + "\n"
+    with _append_lock:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+    return path
+
+
+def signature(path):
+    """
+    (mtime_ns, size, inode) của nhật ký, hoặc None nếu không tồn tại. Không chỉ dựa vào mtime: trên
+    FAT/exFAT hay ổ mạng, hai lần ghi nối liên tiếp có thể cùng mtime, nhưng kích thước luôn tăng.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def read_journal(path):
+    """
+    Đọc một nhật ký, trả về {order_id: (vị trí dòng, metadata)} - dòng sau ghi đè dòng trước của cùng đơn.
+    Dòng cuối bị ghi dở (mất điện) được bỏ qua. Kết quả được giữ lại; khi file được ghi nối thêm
+    chỉ đọc phần mới (từ sau dòng đầy đủ cuối cùng), file bị thu nhỏ/thay thế thì đọc lại từ đầu.
+    """
+    current = signature(path)
+    if current is None:
+        with _cache_lock:
+            _cache.pop(path, None)
+        return {}
+    with _cache_lock:
+        cached = _cache.get(path)
+    if cached and cached[0] == current:
+        return cached[2]
+
+    _, size, inode = current
+    offset, records = 0, {}
+    if cached and cached[0][2] == inode and size >= cached[1]:
+        offset, records = cached[1], dict(cached[2])
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            position, offset = offset, offset + len(line)
+            try:
+                metadata = json.loads(line)
+            except ValueError:
+                continue
+            file_name = metadata.get("file_name")
+            if file_name:
+                records[storage.order_id_of(file_name)] = (position, metadata)
+    with _cache_lock:
+        _cache[path] = (current, offset, records)
+    return records
+
+
+def iter_journals():
+    """Trả về (date, đường dẫn) cho các nhật ký hiện có, cũ nhất trước."""
+    for day, rel_dir in storage.iter_day_partitions(utils.METADATA_DIR):
+        path = os.path.join(utils.METADATA_DIR, *rel_dir.split('/'), JOURNAL_FILE_NAME)
+        if os.path.exists(path):
+            yield day, path
+
+
+def lookup(file_name):
+    """
+    Tìm metadata của video file_name trong nhật ký. Với bố cục phân vùng, ngày được lấy từ
+    đường dẫn nên chỉ mở đúng một nhật ký. Trả về (metadata, vị trí dòng trong nhật ký) hoặc ({}, None).
+    """
+    parts = file_name.split('/')
+    if len(parts) < 4:
+        return {}, None
+    try:
+        day = datetime.date(int(parts[0]), int(parts[1]), int(parts[2]))
+    except ValueError:
+        return {}, None
+    position, metadata = read_journal(journal_path(day)).get(storage.order_id_of(file_name), (None, None))
+    return (metadata, position) if metadata else ({}, None)
+
+
+def export_json(metadata):
+    """Xuất metadata ra file <order>.json cạnh vị trí cũ (cùng thư mục phân vùng). Trả về đường dẫn."""
+    path = storage.metadata_path(metadata["file_name"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(metadata, f, indent=4)
+    os.replace(tmp_path, path)
+    return path
+
+
+if __name__ == "__main__":
+    import argparse
+    from . import video_index
+
+    parser = argparse.ArgumentParser(description="Xuất metadata từ nhật ký ra file JSON riêng cho từng đơn.")
+    parser.add_argument("order_ids", nargs="*", help="Mã đơn cần xuất")
+    parser.add_argument("--day", help="Xuất toàn bộ một ngày (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    exported = 0
+    if args.day:
+        records = read_journal(journal_path(datetime.date.fromisoformat(args.day)))
+        for _, metadata in records.values():
+            print(f"[JOURNAL] {export_json(metadata)}")
+            exported += 1
+    for order_id in args.order_ids:
+        row = video_index.get_index().get(order_id)
+        metadata = lookup(row["file_name"])[0] if row else {}
+        if not metadata:
+            print(f"[JOURNAL] Không tìm thấy metadata của đơn {order_id}.")
+            continue
+        print(f"[JOURNAL] {export_json(metadata)}")
+        exported += 1
+    print(f"[JOURNAL] Đã xuất {exported} file.")
@@ -0,0 +1,170 @@
+# metrics_server.py
+# Endpoint HTTP chỉ số cho Prometheus (định dạng text 0.0.4, đọc được bởi Prometheus/OpenMetrics scraper).
+#
+# Dùng để giám sát tập trung nhiều bàn đóng gói: camera nào tốn CPU (fps/độ trễ quét QR), camera
+# kết nối lại liên tục, frame bị bỏ qua, số đơn đã ghi, dung lượng đã ghi và dung lượng ổ đĩa còn trống.
+#
+# Bật bằng METRICS_HTTP_ENABLED; mặc định chỉ nghe trên 127.0.0.1 (METRICS_HTTP_HOST) cổng
+# METRICS_HTTP_PORT. Server chạy ở luồng nền riêng; mỗi lần scrape chỉ đọc các chỉ số đã có trong
+# camera.metrics (camera_metrics) - không khóa và không chạm vào vòng lặp camera.
+#
+#     curl http://127.0.0.1:9108/metrics
+
+import shutil
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from . import config, utils, qr_detector
+
+log = logging.getLogger(__name__)
+
+PREFIX = "packingapp"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# (tên, loại, mô tả, hàm lấy giá trị từ CameraMetrics)
+CAMERA_METRICS = (
+    ("camera_grab_fps", "gauge", "Frames per second read from the camera stream", lambda m: m.grab_frames.rate()),
+    ("camera_preview_fps", "gauge", "Frames per second processed by the preview/QR loop", lambda m: m.preview_frames.rate()),
+    ("camera_record_fps", "gauge", "Frames per second written to the recording", lambda m: m.record_frames.rate()),
+    ("camera_frame_age_seconds", "gauge", "Age of the latest frame when the preview loop took it", lambda m: m.frame_age_seconds.value),
+    ("camera_render_pending", "gauge", "Preview frames queued for the GUI thread but not yet drawn", lambda m: m.render_pending()),
+    ("camera_grab_frames_total", "counter", "Frames read from the camera stream", lambda m: m.grab_frames.count),
+    ("camera_grab_failures_total", "counter", "Failed frame reads (each one triggers a reconnect)", lambda m: m.grab_failures.value),
+    ("camera_reconnects_total", "counter", "Connection attempts after the first one", lambda m: m.reconnects()),
+    ("camera_connect_failures_total", "counter", "Failed connection attempts", lambda m: m.connect_failures.value),
+    ("camera_preview_dropped_total", "counter", "Frames overwritten before the preview loop processed them", lambda m: m.preview_dropped.value),
+    ("camera_qr_decoded_total", "counter", "QR codes decoded", lambda m: m.qr_decoded.value),
+    ("camera_recordings_total", "counter", "Recordings started", lambda m: m.recordings.value),
+    ("camera_record_frames_total", "counter", "Frames written to recordings", lambda m: m.record_frames.count),
+    ("camera_record_dropped_total", "counter", "Frames skipped by the recorder (grabber faster than FPS)", lambda m: m.record_dropped.value),
+    ("camera_record_repeated_total", "counter", "Frames written twice by the recorder (grabber slower than FPS)", lambda m: m.record_repeated.value),
+    ("camera_record_errors_total", "counter", "Recording write errors", lambda m: m.record_errors.value),
+    ("camera_record_bytes_total", "counter", "Bytes of video written (counted as each segment file is closed)", lambda m: m.record_bytes.value),
+)
+
+# (tên, mô tả, hàm lấy Histogram từ CameraMetrics)
+CAMERA_HISTOGRAMS = (
+    ("camera_detect_seconds", "QR detection time per scan", lambda m: m.detect_seconds),
+    ("camera_grab_read_seconds", "Time spent in VideoCapture.read()", lambda m: m.grab_read_seconds),
+    ("camera_render_seconds", "Time to draw one preview frame on the GUI thread", lambda m: m.render_seconds),
+    ("camera_record_write_seconds", "Time to write one frame to the recording", lambda m: m.record_write_seconds),
+)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(int(value))
+
+
+def render(app):
+    """Toàn bộ chỉ số ở định dạng text của Prometheus."""
+    lines = []
+
+    def header(name, kind, help_text):
+        lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+    cameras = [(camera, _labels(camera_id=camera.id, camera=camera.name)) for camera in list(app.cameras)]
+
+    header("camera_recording", "gauge", "1 while the camera is recording an order")
+    for camera, labels in cameras:
+        lines.append(f"{PREFIX}_camera_recording{labels} {int(bool(camera.is_recording))}")
+
+    for name, kind, help_text, value in CAMERA_METRICS:
+        header(name, kind, help_text)
+        for camera, labels in cameras:
+            lines.append(f"{PREFIX}_{name}{labels} {_number(value(camera.metrics))}")
+
+    for name, help_text, histogram in CAMERA_HISTOGRAMS:
+        header(name, "histogram", help_text)
+        for camera, labels in cameras:
+            h = histogram(camera.metrics)
+            counts = list(h.counts)
+            label_base = labels[1:-1]
+            cumulative = 0
+            for bound, count in zip(h.buckets, counts):
+                cumulative += count
+                lines.append(f'{PREFIX}_{name}_bucket{{{label_base},le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{PREFIX}_{name}_bucket{{{label_base},le="+Inf"}} {cumulative}')
+            lines.append(f"{PREFIX}_{name}_sum{labels} {_number(float(h.sum))}")
+            lines.append(f"{PREFIX}_{name}_count{labels} {cumulative}")
+
+    header("scans_suppressed_total", "counter", "QR scans ignored by the scan router, by reason")
+    for camera_id, counts in app.scan_router.suppressed_counts().items():
+        for reason, count in counts.items():
+            lines.append(f"{PREFIX}_scans_suppressed_total{_labels(camera_id=camera_id, reason=reason)} {count}")
+
+    header("qr_detector_ready", "gauge", "1 once the shared QR detector model is loaded")
+    lines.append(f"{PREFIX}_qr_detector_ready {int(qr_detector.is_ready())}")
+
+    try:
+        usage = shutil.disk_usage(utils.OUTPUT_DIR)
+    except OSError:
+        usage = None
+    if usage is not None:
+        labels = _labels(path=utils.OUTPUT_DIR)
+        header("disk_free_bytes", "gauge", "Free space on the drive holding the Video directory")
+        lines.append(f"{PREFIX}_disk_free_bytes{labels} {usage.free}")
+        header("disk_total_bytes", "gauge", "Size of the drive holding the Video directory")
+        lines.append(f"{PREFIX}_disk_total_bytes{labels} {usage.total}")
+
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        try:
+            body = render(self.server.app).encode("utf-8")
+        except Exception as e:
+            log.warning("Lỗi khi tạo chỉ số: %s", e)
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug("%s - %s", self.address_string(), format % args)
+
+
+def start(app, host=None, port=None):
+    """
+    Mở endpoint ở luồng nền nếu METRICS_HTTP_ENABLED (hoặc khi truyền port).
+    Trả về server (để stop()), hoặc None nếu tắt/không mở được cổng.
+    """
+    if port is None:
+        if not config.METRICS_HTTP_ENABLED:
+            return None
+        port = config.METRICS_HTTP_PORT
+    host = config.METRICS_HTTP_HOST if host is None else host
+    try:
+        server = ThreadingHTTPServer((host, port), _Handler)
+    except OSError as e:
+        log.warning("Không thể mở endpoint chỉ số tại %s:%s: %s", host, port, e)
+        return None
+    server.daemon_threads = True
+    server.app = app
+    threading.Thread(target=server.serve_forever, daemon=True, name="Metrics HTTP").start()
+    log.info("Endpoint chỉ số: http://%s:%s/metrics", host, server.server_port)
+    return server
+
+
+def stop(server):
+    if server is not None:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,124 @@
+# qr_detector.py
+# Bộ phát hiện mã QR (QReader: mô hình YOLO chạy trên torch) dùng chung cho mọi camera.
+#
+# Trước đây mỗi luồng camera tự tạo một QReader khi bắt đầu (và lại tạo mới sau mỗi lần
+# restart_cameras): N camera = N lần nạp model cùng lúc, CPU tăng vọt, và lần quét đầu tiên
+# rất chậm vì torch còn phải khởi tạo ở lần suy luận đầu.
+#
+# Nay model được nạp MỘT lần ở luồng nền ngay lúc khởi động (warm_up): nạp thư viện qreader/torch,
+# tạo QReader, rồi chạy thử một lần trên ảnh trống để lần quét thật đầu tiên nhanh như mọi lần sau.
+# Model tồn tại suốt vòng đời ứng dụng (không phụ thuộc luồng camera nên giữ nguyên qua restart_cameras).
+# Các camera gọi detect_and_decode(): trong lúc model đang nạp, trả về () để preview vẫn chạy bình thường;
+# các lần suy luận được tuần tự hóa bằng khóa (model YOLO không an toàn khi nhiều luồng gọi cùng lúc).
+# File trọng số do qreader tải về một lần và lưu cạnh thư viện, các lần chạy sau đọc từ đĩa.
+
+import time
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+# Model 'n' nhanh nhất; min_confidence lọc các phát hiện yếu
+MODEL_SIZE = 'n'
+MIN_CONFIDENCE = 0.5
+
+# Kích thước ảnh chạy thử (bằng vùng quét 70% của khung hình preview)
+WARM_UP_SHAPE = (336, 448, 3)
+
+STATE_IDLE = "idle"
+STATE_LOADING = "loading"
+STATE_READY = "ready"
+STATE_ERROR = "error"
+
+
+class DetectorManager:
+    def __init__(self):
+        self.lock = threading.Lock()          # bảo vệ trạng thái
+        self.infer_lock = threading.Lock()    # tuần tự hóa các lần suy luận
+        self.state = STATE_IDLE
+        self.detector = None
+        self.error = None
+        self.ready = threading.Event()
+        # Thời gian (giây) từng bước của lần nạp gần nhất: import, load, first_inference, total
+        self.timings = {}
+
+    def warm_up(self):
+        """Nạp và chạy thử model ở luồng nền (không làm gì nếu đang nạp hoặc đã sẵn sàng)."""
+        with self.lock:
+            if self.state in (STATE_LOADING, STATE_READY):
+                return
+            self.state = STATE_LOADING
+            self.error = None
+        threading.Thread(target=self._load, daemon=True).start()
+
+    def _load(self):
+        timings = {}
+        start = time.perf_counter()
+        try:
+            from qreader import QReader
+            timings["import"] = time.perf_counter() - start
+
+            step = time.perf_counter()
+            detector = QReader(model_size=MODEL_SIZE, min_confidence=MIN_CONFIDENCE)
+            timings["load"] = time.perf_counter() - step
+
+            # Lần suy luận đầu tiên khởi tạo torch/YOLO (chậm hơn nhiều lần so với các lần sau)
+            import numpy as np
+            step = time.perf_counter()
+            detector.detect_and_decode(image=np.zeros(WARM_UP_SHAPE, dtype=np.uint8))
+            timings["first_inference"] = time.perf_counter() - step
+        except Exception as e:
+            with self.lock:
+                self.state = STATE_ERROR
+                self.error = str(e)
+            log.error("Không thể nạp bộ đọc mã QR: %s", e)
+            return
+
+        timings["total"] = time.perf_counter() - start
+        with self.lock:
+            self.detector = detector
+            self.timings = timings
+            self.state = STATE_READY
+        self.ready.set()
+        log.info(
+            "Sẵn sàng sau %.2fs (import %.2fs, nạp model %.2fs, chạy thử %.2fs)",
+            timings['total'], timings['import'], timings['load'], timings['first_inference']
+        )
+
+    def wait_ready(self, timeout=None):
+        return self.ready.wait(timeout)
+
+    def detect_and_decode(self, image):
+        """Như QReader.detect_and_decode; trả về () nếu model chưa sẵn sàng."""
+        detector = self.detector
+        if detector is None:
+            return ()
+        with self.infer_lock:
+            return detector.detect_and_decode(image=image)
+
+    def status(self):
+        with self.lock:
+            return {"state": self.state, "error": self.error, "timings": dict(self.timings)}
+
+
+_manager = DetectorManager()
+
+
+def warm_up():
+    _manager.warm_up()
+
+
+def wait_ready(timeout=None):
+    return _manager.wait_ready(timeout)
+
+
+def is_ready():
+    return _manager.ready.is_set()
+
+
+def detect_and_decode(image):
+    return _manager.detect_and_decode(image)
+
+
+def status():
+    return _manager.status()
@@ -0,0 +1,272 @@
+# qr_parser.py
+# Nhận dạng đơn vị vận chuyển và trích xuất mã vận đơn từ dữ liệu mã QR.
+#
+# Các luật (utils.QR_CODE_PARSERS, hoặc file qr_rules.json nếu có) được ghép thành MỘT biểu thức
+# chính quy dạng (?P<_r0>luật 0)|(?P<_r1>luật 1)|... và biên dịch một lần. Mỗi lần quét chỉ gọi
+# match() một lần; nhóm có tên khớp được cho biết luật nào nhận dạng, không cần vòng lặp Python
+# qua từng luật hay hàm lambda. Thứ tự ưu tiên giữ nguyên như khi thử lần lượt từng luật.
+#
+# Đổi luật không cần sửa code: tạo qr_rules.json cạnh camera_settings.json (xem --export-rules),
+# mỗi luật gồm "name", "pattern" và "group" (số thứ tự nhóm chứa mã vận đơn, 0 = toàn bộ chuỗi khớp),
+# và tùy chọn "key": từ khóa ngắn của đơn vị vận chuyển dùng khi tìm kiếm ("spx", "j&t"; "" = không có).
+# Thiếu "key" thì lấy tên luật bỏ phần trong ngoặc và các số ("Giao Hang Nhanh (GHN)" -> "giao hang nhanh").
+# Vì các luật được ghép chung, không dùng nhóm có tên trùng nhau hay cờ toàn cục như (?i) ở đầu luật
+# (dùng dạng cục bộ (?i:...)). Tham chiếu ngược theo số (\1, (?(1)...)) bị bỏ qua vì số nhóm thay đổi
+# khi ghép - dùng nhóm có tên: (?P<x>\d)(?P=x). Luật nào không biên dịch được khi ghép thì bị bỏ qua;
+# nếu cả biểu thức ghép vẫn lỗi thì dùng luật mặc định.
+#
+#     python -m PackingApp.qr_parser --export-rules           # ghi luật mặc định ra qr_rules.json
+#     python -m PackingApp.qr_parser --benchmark payloads.txt  # đo tốc độ trên tập dữ liệu QR thật
+
+import os
+import re
+import json
+import logging
+import threading
+from . import utils
+
+try:
+    from re import _parser as _sre_parse     # Python 3.11+
+except ImportError:
+    import sre_parse as _sre_parse
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_engine = None
+
+# Tham chiếu ngược theo số: \1..\9 (không bị escape) hoặc điều kiện (?(1)...)
+_NUMBERED_BACKREF = re.compile(r"(?:^|[^\\])(?:\\\\)*\\[1-9]|\(\?\(\d")
+
+
+class _Engine:
+    """Các luật đã ghép và biên dịch thành một biểu thức duy nhất."""
+
+    def __init__(self, rules):
+        alternatives = []
+        self.rules = []
+        self.keys = {}      # {tên luật: từ khóa tìm kiếm hoặc None}
+        for rule in rules:
+            try:
+                compiled = re.compile(rule['pattern'])
+            except (KeyError, re.error) as e:
+                log.warning("[QR PARSER] Bỏ qua luật không hợp lệ %s: %s", rule.get('name'), e)
+                continue
+            group = int(rule.get('group', 1 if compiled.groups else 0))
+            if group > compiled.groups:
+                log.warning("[QR PARSER] Bỏ qua luật %s: không có nhóm số %d", rule.get('name'), group)
+                continue
+            if _NUMBERED_BACKREF.search(rule['pattern']):
+                log.warning("[QR PARSER] Bỏ qua luật %s: không hỗ trợ tham chiếu ngược theo số, dùng (?P=tên)", rule.get('name'))
+                continue
+            # Luật được tìm ở bất kỳ vị trí nào (như search()) vì cả biểu thức dùng match(); '^' bên
+            # trong vẫn chỉ khớp ở đầu chuỗi. Bỏ phần tiền tố chỉ khi chắc chắn cả luật bị neo.
+            prefix = "" if _is_anchored(rule['pattern']) else "(?s:.*?)"
+            alternative = f"(?P<_r{len(self.rules)}>{prefix}({rule['pattern']}))"
+            try:
+                re.compile(alternative)
+            except re.error as e:
+                log.warning("[QR PARSER] Bỏ qua luật %s: không ghép được (%s)", rule.get('name'), e)
+                continue
+            alternatives.append(alternative)
+            self.rules.append((rule.get('name', ''), group, compiled))
+            key = rule.get('key')
+            if key is None:
+                key = _default_key(rule.get('name', ''))
+            self.keys[rule.get('name', '')] = key.lower() or None
+
+        self.pattern = re.compile("|".join(alternatives)) if alternatives else None
+        # Vị trí nhóm chứa mã vận đơn của từng luật trong biểu thức ghép: nhóm bao _rN, rồi nhóm
+        # bao quanh luật (bỏ phần tiền tố .*?), rồi các nhóm của luật - nhóm k của luật là (chỉ số _rN) + 1 + k
+        self.groups = {}
+        if self.pattern is not None:
+            for number, (name, group, _) in enumerate(self.rules):
+                outer = self.pattern.groupindex[f"_r{number}"]
+                self.groups[outer] = (name, outer + 1 + group)
+
+    def parse(self, data):
+        """Trả về (tên đơn vị vận chuyển, mã vận đơn) hoặc (None, None)."""
+        if self.pattern is None:
+            return None, None
+        match = self.pattern.match(data)
+        if match is None:
+            return None, None
+        # Nhóm bao _rN đóng sau cùng nên lastindex chính là nhóm bao của luật đã khớp
+        name, group = self.groups[match.lastindex]
+        return name, match.group(group)
+
+
+def _is_anchored(pattern):
+    """
+    True nếu mọi chuỗi khớp đều bắt đầu ở vị trí 0: phần tử đầu tiên ở cấp ngoài cùng là '^'
+    (không có '|' ở cấp ngoài cùng như ^A|B, không có cờ MULTILINE). Không chắc chắn thì trả về False.
+    """
+    try:
+        parsed = _sre_parse.parse(pattern)
+        if parsed.state.flags & re.MULTILINE or not len(parsed):
+            return False
+        op, arg = parsed[0]
+        return op is _sre_parse.AT and arg is _sre_parse.AT_BEGINNING
+    except Exception:
+        return False
+
+
+def _default_key(name):
+    """Từ khóa tìm kiếm từ tên luật: bỏ phần mô tả trong ngoặc và các từ chỉ gồm chữ số."""
+    name = re.sub(r"\([^)]*\)", " ", name)
+    return " ".join(word for word in name.lower().split() if not word.isdigit())
+
+
+def load_rules():
+    """Luật từ utils.QR_RULES_FILE nếu có, nếu không là utils.QR_CODE_PARSERS."""
+    try:
+        with open(utils.QR_RULES_FILE, 'r', encoding='utf-8') as f:
+            rules = json.load(f)
+        log.info("[QR PARSER] Đã nạp %d luật từ %s", len(rules), utils.QR_RULES_FILE)
+        return rules
+    except FileNotFoundError:
+        return utils.QR_CODE_PARSERS
+    except ValueError as e:
+        log.error("[QR PARSER] Lỗi đọc %s, dùng luật mặc định: %s", utils.QR_RULES_FILE, e)
+        return utils.QR_CODE_PARSERS
+
+
+def reload():
+    """Nạp lại và biên dịch luật (ví dụ sau khi sửa qr_rules.json)."""
+    global _engine
+    try:
+        engine = _Engine(load_rules())
+    except re.error as e:
+        log.error("[QR PARSER] Không biên dịch được biểu thức ghép, dùng luật mặc định: %s", e)
+        engine = _Engine(utils.QR_CODE_PARSERS)
+    with _lock:
+        _engine = engine
+    return engine
+
+
+def _get_engine():
+    engine = _engine
+    return engine if engine is not None else reload()
+
+
+def parse(data):
+    """
+    Phân tích dữ liệu thô từ mã QR. Trả về (tên đơn vị vận chuyển, mã vận đơn),
+    hoặc (None, None) nếu không luật nào khớp.
+    """
+    if not data:
+        return None, None
+    return _get_engine().parse(data.strip())
+
+
+def carrier_of(order_id):
+    """Tên đơn vị vận chuyển có luật khớp với một mã vận đơn đã trích xuất, hoặc None."""
+    return parse(order_id)[0]
+
+
+def carrier_key_of(order_id):
+    """Từ khóa tìm kiếm ngắn ("spx", "j&t"...) của đơn vị vận chuyển khớp với mã vận đơn, hoặc None."""
+    engine = _get_engine()
+    name = engine.parse(order_id)[0]
+    return engine.keys.get(name) if name is not None else None
+
+
+# ----------------------------------------------------
+# ĐO TỐC ĐỘ
+# ----------------------------------------------------
+
+# Dữ liệu mẫu khi không có file tập dữ liệu (mỗi dòng một chuỗi QR)
+SAMPLE_PAYLOADS = [
+    "SPXVN041234567890",
+    "851234567890",
+    "SGNA12B34C56",
+    "1234567890123",
+    "https://track.tiktokshop.com/detail?lang=vi&order_id=5763XYZ_12345",
+    "GY8K2M4P9Q",
+    "https://example.com/khong-phai-ma-van-don",
+    "hello",
+]
+
+# Luật riêng để kiểm tra biểu thức ghép cho kết quả giống cách cũ ở các trường hợp đặc biệt:
+# (luật, chuỗi QR)
+REGRESSION_CASES = [
+    # '|' ở cấp ngoài cùng: chỉ nhánh đầu bị neo, nhánh sau được tìm ở bất kỳ vị trí nào
+    ({'name': 'Neo một nhánh', 'pattern': r'^A(\d+)|B(\d+)', 'group': 0}, "zzB12"),
+    ({'name': 'Neo một nhánh', 'pattern': r'^A(\d+)|B(\d+)', 'group': 0}, "zzA12"),
+]
+
+
+def _parse_sequential(rules, data):
+    """Cách cũ: thử lần lượt từng luật bằng search(). Chỉ dùng để so sánh khi đo tốc độ."""
+    for name, group, compiled in rules:
+        match = compiled.search(data)
+        if match:
+            return name, match.group(group)
+    return None, None
+
+
+def benchmark(payloads, repeat=2000):
+    """
+    So sánh kết quả và tốc độ của biểu thức ghép với cách thử lần lượt từng luật.
+    Trả về (giây/chuỗi khi thử lần lượt, giây/chuỗi với biểu thức ghép, các chuỗi khác kết quả).
+    """
+    import time
+    engine = _get_engine()
+    rules = engine.rules
+
+    mismatches = [p for p in payloads if engine.parse(p) != _parse_sequential(rules, p)]
+    for payload in mismatches:
+        log.warning("[QR PARSER] Khác kết quả: %r: %s != %s", payload, engine.parse(payload), _parse_sequential(rules, payload))
+    for rule, payload in REGRESSION_CASES:
+        case_engine = _Engine([rule])
+        if case_engine.parse(payload) != _parse_sequential(case_engine.rules, payload):
+            log.warning("[QR PARSER] Khác kết quả (luật %r): %r: %s != %s", rule['pattern'], payload,
+                        case_engine.parse(payload), _parse_sequential(case_engine.rules, payload))
+            mismatches.append(payload)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for payload in payloads:
+            _parse_sequential(rules, payload)
+    sequential = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for payload in payloads:
+            engine.parse(payload)
+    compiled = time.perf_counter() - start
+
+    total = repeat * len(payloads)
+    return sequential / total, compiled / total, mismatches
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Bộ nhận dạng mã vận đơn từ dữ liệu QR.")
+    parser.add_argument("--export-rules", action="store_true",
+                        help=f"Ghi luật mặc định ra {os.path.basename(utils.QR_RULES_FILE)} để chỉnh sửa")
+    parser.add_argument("--benchmark", nargs="?", const="", metavar="FILE",
+                        help="Đo tốc độ trên tập dữ liệu QR (mỗi dòng một chuỗi); bỏ trống để dùng dữ liệu mẫu")
+    parser.add_argument("payloads", nargs="*", help="Chuỗi QR cần phân tích")
+    args = parser.parse_args()
+
+    if args.export_rules:
+        if os.path.exists(utils.QR_RULES_FILE):
+            print(f"[QR PARSER] {utils.QR_RULES_FILE} đã tồn tại, không ghi đè.")
+        else:
+            with open(utils.QR_RULES_FILE, 'w', encoding='utf-8') as f:
+                json.dump(utils.QR_CODE_PARSERS, f, indent=4, ensure_ascii=False)
+            print(f"[QR PARSER] Đã ghi {utils.QR_RULES_FILE}")
+    if args.benchmark is not None:
+        if args.benchmark:
+            with open(args.benchmark, 'r', encoding='utf-8') as f:
+                corpus = [line.strip() for line in f if line.strip()]
+        else:
+            corpus = SAMPLE_PAYLOADS
+        sequential, compiled, mismatches = benchmark(corpus)
+        print(f"[QR PARSER] {len(corpus)} chuỗi, {len(mismatches)} khác kết quả")
+        print(f"[QR PARSER] Thử lần lượt: {sequential * 1e6:.2f} µs/chuỗi")
+        print(f"[QR PARSER] Biểu thức ghép: {compiled * 1e6:.2f} µs/chuỗi")
+    for payload in args.payloads:
+        print(f"[QR PARSER] {payload!r} -> {parse(payload)}")
@@ -0,0 +1,356 @@
+# recording.py
+# Ghi hình an toàn khi crash/mất điện: chia video thành các đoạn ngắn và
+# cập nhật metadata tiến trình trong lúc đang ghi.
+#
+# Bố cục thư mục (<ngày> = YYYY/MM/DD/<camera>, xem storage.py):
+# - Đang ghi:  Video/.recording/<order>/part_0000.avi ...  +  Metadata/.recording/<order>.json
+# - Hoàn tất (1 đoạn):      Video/<ngày>/<order>.avi
+# - Hoàn tất (nhiều đoạn):  Video/<ngày>/<order>.m3u  +  Video/<ngày>/<order>.parts/part_0000.avi ...
+# - Metadata:               Metadata/YYYY/MM/DD/journal.jsonl (xem metadata_journal.py)
+#
+# Mỗi đoạn được đóng (VideoWriter.release) ngay khi đủ thời lượng nên luôn xem được.
+# Việc hoàn tất chỉ là đổi tên file/thư mục (os.replace) - không phải encode lại. Tên cuối cùng
+# (.avi hoặc .m3u) được ghi vào metadata tiến trình TRƯỚC khi di chuyển; nếu bị gián đoạn giữa lúc
+# di chuyển và lúc ghi nhật ký, lần khởi động sau tìm lại video trong thư mục phân vùng.
+
+import os
+import json
+import time
+import shutil
+import logging
+import datetime
+import cv2
+from . import utils, config, storage, video_index, metadata_journal
+
+log = logging.getLogger(__name__)
+
+RECORDING_MODE_SEGMENTED = 'SEGMENTED'
+RECORDING_MODE_SINGLE = 'SINGLE'
+
+SEGMENT_PREFIX = 'part_'
+SEGMENT_EXTENSION = '.avi'
+
+
+def _write_json_atomic(path, data):
+    """Ghi JSON ra file tạm rồi đổi tên, để file không bao giờ bị ghi dở."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _progress_metadata_path(order_id):
+    return os.path.join(utils.RECORDING_METADATA_DIR, f"{order_id}.json")
+
+
+def _segment_file_name(index):
+    return f"{SEGMENT_PREFIX}{index:04d}{SEGMENT_EXTENSION}"
+
+
+def _segment_files(parts_dir):
+    """Các đoạn dùng được (khác rỗng) trong thư mục parts_dir, theo thứ tự."""
+    return sorted(
+        f for f in os.listdir(parts_dir)
+        if f.startswith(SEGMENT_PREFIX) and f.endswith(SEGMENT_EXTENSION)
+        and os.path.getsize(os.path.join(parts_dir, f)) > 0
+    )
+
+
+def _finalize_segments(order_id, parts_dir, rel_dir='', segment_durations=None, checkpoint=None):
+    """
+    Chuyển các đoạn đã ghi từ thư mục tạm sang thư mục phân vùng rel_dir trong Video.
+    - 1 đoạn: đổi tên thành <order>.avi
+    - Nhiều đoạn: chuyển cả thư mục thành <order>.parts và tạo playlist <order>.m3u
+    checkpoint(final_name) được gọi trước khi di chuyển để metadata tiến trình trỏ tới tên cuối cùng.
+    Trả về đường dẫn tương đối (so với OUTPUT_DIR) hoặc None nếu không có đoạn nào dùng được.
+    """
+    segment_files = _segment_files(parts_dir)
+
+    if not segment_files:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+        return None
+
+    os.makedirs(storage.video_path(rel_dir), exist_ok=True)
+    if len(segment_files) == 1:
+        final_name = storage.join_relative(rel_dir, f"{order_id}{SEGMENT_EXTENSION}")
+        if checkpoint:
+            checkpoint(final_name)
+        os.replace(os.path.join(parts_dir, segment_files[0]), storage.video_path(final_name))
+        shutil.rmtree(parts_dir, ignore_errors=True)
+        return final_name
+
+    final_name = storage.join_relative(rel_dir, f"{order_id}{utils.PLAYLIST_EXTENSION}")
+    if checkpoint:
+        checkpoint(final_name)
+    os.replace(parts_dir, storage.parts_dir_path(final_name))
+    _write_playlist(order_id, final_name, segment_files, segment_durations)
+    return final_name
+
+
+def _write_playlist(order_id, final_name, segment_files, segment_durations=None):
+    """Tạo playlist final_name (.m3u) cho các đoạn trong thư mục <order>.parts đi kèm."""
+    final_parts_name = f"{order_id}{utils.PARTS_DIR_SUFFIX}"
+    # Playlist dùng đường dẫn tương đối để thư mục Video có thể di chuyển nguyên khối
+    lines = ["#EXTM3U"]
+    for i, segment in enumerate(segment_files):
+        duration = -1
+        if segment_durations and i < len(segment_durations):
+            duration = int(round(segment_durations[i]))
+        lines.append(f"#EXTINF:{duration},{order_id} - đoạn {i + 1}")
+        lines.append(f"{final_parts_name}/{segment}")
+
+    playlist_path = storage.video_path(final_name)
+    tmp_path = f"{playlist_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, playlist_path)
+
+
+def _find_finalized(order_id, rel_dir, file_name=None):
+    """
+    Video của order_id đã được chuyển vào thư mục phân vùng (bản ghi bị gián đoạn sau bước di chuyển):
+    thử file_name trong metadata tiến trình rồi <order>.avi / <order>.m3u trong rel_dir. Playlist còn
+    thiếu (gián đoạn giữa lúc chuyển thư mục .parts và lúc ghi .m3u) được tạo lại.
+    Trả về đường dẫn tương đối hoặc None.
+    """
+    candidates = [file_name] if file_name else []
+    if rel_dir is not None:
+        candidates += [storage.join_relative(rel_dir, f"{order_id}{ext}")
+                       for ext in (SEGMENT_EXTENSION, utils.PLAYLIST_EXTENSION)]
+    for name in candidates:
+        if os.path.exists(storage.video_path(name)):
+            return name
+        if name.endswith(utils.PLAYLIST_EXTENSION):
+            parts_dir = storage.parts_dir_path(name)
+            segment_files = _segment_files(parts_dir) if os.path.isdir(parts_dir) else []
+            if segment_files:
+                _write_playlist(order_id, name, segment_files)
+                return name
+    return None
+
+
+class Recording:
+    """
+    Một phiên ghi hình cho một đơn hàng.
+    Có cùng giao diện write/isOpened/release với cv2.VideoWriter để _record_loop dùng trực tiếp.
+    """
+
+    def __init__(self, order_id, camera, frame_size, start_time, mode=None, segment_seconds=None):
+        self.order_id = order_id
+        self.frame_size = frame_size
+        self.mode = mode or config.RECORDING_MODE
+        self.segment_seconds = segment_seconds or config.RECORDING_SEGMENT_SECONDS
+        self.fourcc = cv2.VideoWriter_fourcc(*utils.VIDEO_CODEC_FOURCC)
+        self.writer = None
+        self.segment_index = 0
+        self.segment_started_at = None
+        self.segment_durations = []
+        self.last_checkpoint = None
+        self.rel_dir = storage.partition_dir(start_time, camera.name)
+        self.metrics = camera.metrics
+
+        if self.mode == RECORDING_MODE_SEGMENTED:
+            self.parts_dir = os.path.join(utils.RECORDING_DIR, order_id)
+            os.makedirs(self.parts_dir, exist_ok=True)
+            file_name = storage.join_relative(self.rel_dir, f"{order_id}{SEGMENT_EXTENSION}")
+        else:
+            # Ghi thẳng vào thư mục phân vùng
+            self.parts_dir = None
+            file_name = storage.join_relative(self.rel_dir, f"{order_id}.avi")
+            os.makedirs(storage.video_path(self.rel_dir), exist_ok=True)
+
+        self.metadata = {
+            "file_name": file_name,
+            "partition": self.rel_dir,
+            "camera_name": camera.name,
+            "camera_id": camera.id,
+            "start_time": start_time.isoformat(),
+            "last_update": start_time.isoformat(),
+            "status": "recording",
+            "recording_mode": self.mode,
+            "segments": 0
+        }
+
+        self._open_writer()
+        if self.isOpened():
+            os.makedirs(utils.RECORDING_METADATA_DIR, exist_ok=True)
+            self._checkpoint()
+        elif self.parts_dir:
+            # Không mở được file: dọn thư mục tạm để đơn này không bị coi là "đang ghi"
+            shutil.rmtree(self.parts_dir, ignore_errors=True)
+
+    def _current_path(self):
+        if self.parts_dir:
+            return os.path.join(self.parts_dir, _segment_file_name(self.segment_index))
+        return storage.video_path(self.metadata["file_name"])
+
+    def _open_writer(self):
+        self.writer = cv2.VideoWriter(self._current_path(), self.fourcc, config.FPS, self.frame_size)
+        self.segment_started_at = time.monotonic()
+        self.last_checkpoint = self.segment_started_at
+
+    def _close_writer(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+            self.segment_durations.append(time.monotonic() - self.segment_started_at)
+            try:
+                self.metrics.record_bytes.inc(os.path.getsize(self._current_path()))
+            except OSError:
+                pass
+
+    def _checkpoint(self):
+        """Ghi metadata tiến trình (nguyên tử) để có thể khôi phục nếu app bị tắt đột ngột."""
+        self.metadata["last_update"] = datetime.datetime.now().isoformat()
+        self.metadata["segments"] = len(self.segment_durations)
+        try:
+            _write_json_atomic(_progress_metadata_path(self.order_id), self.metadata)
+        except Exception as e:
+            log.warning("[GHI HÌNH] Không thể lưu metadata tiến trình cho %s: %s", self.order_id, e)
+        self.last_checkpoint = time.monotonic()
+
+    def _checkpoint_final_name(self, final_name):
+        self.metadata["file_name"] = final_name
+        self._checkpoint()
+
+    def isOpened(self):
+        return self.writer is not None and self.writer.isOpened()
+
+    def write(self, frame):
+        now = time.monotonic()
+        if now - self.segment_started_at >= self.segment_seconds:
+            if self.parts_dir:
+                # Đóng đoạn hiện tại (file hoàn chỉnh, xem được) và mở đoạn mới
+                self._close_writer()
+                self.segment_index += 1
+                self._open_writer()
+                self._checkpoint()
+            elif now - self.last_checkpoint >= self.segment_seconds:
+                self._checkpoint()
+        if self.writer is not None:
+            self.writer.write(frame)
+
+    def release(self):
+        self._close_writer()
+
+    def finalize(self, end_time):
+        """
+        Đóng đoạn cuối, chuyển video vào thư mục Video và ghi metadata hoàn chỉnh.
+        Trả về metadata cuối cùng, hoặc None nếu không có khung hình nào được ghi (không ghi nhật ký,
+        metadata tiến trình bị xóa - giống recover_interrupted_recordings).
+        """
+        self.release()
+        if self.parts_dir:
+            final_name = _finalize_segments(self.order_id, self.parts_dir, self.rel_dir,
+                                            self.segment_durations, self._checkpoint_final_name)
+        else:
+            final_name = self.metadata["file_name"]
+            path = storage.video_path(final_name)
+            if os.path.exists(path) and not os.path.getsize(path):
+                os.remove(path)
+            if not os.path.exists(path):
+                final_name = None
+        if not final_name:
+            log.warning("[GHI HÌNH] Không có dữ liệu video cho đơn %s, bỏ qua.", self.order_id)
+            _remove_progress_metadata(self.order_id)
+            return None
+        self.metadata["file_name"] = final_name
+
+        start_time = datetime.datetime.fromisoformat(self.metadata["start_time"])
+        self.metadata.pop("last_update", None)
+        self.metadata.pop("partition", None)
+        self.metadata["end_time"] = end_time.isoformat()
+        self.metadata["duration_seconds"] = round((end_time - start_time).total_seconds(), 2)
+        self.metadata["segments"] = len(self.segment_durations)
+        self.metadata["status"] = "completed"
+        _finish_metadata(self.order_id, self.metadata)
+        return self.metadata
+
+
+def _finish_metadata(order_id, metadata):
+    """Ghi metadata vào nhật ký ngày (Metadata/YYYY/MM/DD/journal.jsonl) và xóa metadata tiến trình."""
+    try:
+        metadata_journal.append(metadata)
+        if config.METADATA_PER_ORDER_JSON or not config.STORAGE_PARTITIONED:
+            metadata_journal.export_json(metadata)
+    except Exception as e:
+        log.error("[LỖI] Không thể lưu metadata cho %s: %s", order_id, e)
+        return
+    _remove_progress_metadata(order_id)
+
+
+def _remove_progress_metadata(order_id):
+    try:
+        os.remove(_progress_metadata_path(order_id))
+    except FileNotFoundError:
+        pass
+
+
+def recover_interrupted_recordings():
+    """
+    Hoàn tất các bản ghi bị gián đoạn (crash, mất điện) ở lần chạy trước.
+    Chỉ duyệt thư mục .recording nên chi phí tỉ lệ với số đơn dở dang, không phải toàn bộ kho video.
+    Phải gọi trước khi khởi động các luồng camera.
+    Trả về số đơn đã khôi phục.
+    """
+    pending = set()
+    if os.path.isdir(utils.RECORDING_METADATA_DIR):
+        pending.update(os.path.splitext(f)[0] for f in os.listdir(utils.RECORDING_METADATA_DIR) if f.endswith('.json'))
+    if os.path.isdir(utils.RECORDING_DIR):
+        pending.update(d for d in os.listdir(utils.RECORDING_DIR) if os.path.isdir(os.path.join(utils.RECORDING_DIR, d)))
+
+    recovered = 0
+    for order_id in sorted(pending):
+        try:
+            metadata = {}
+            progress_path = _progress_metadata_path(order_id)
+            if os.path.exists(progress_path):
+                try:
+                    with open(progress_path, 'r') as f:
+                        metadata = json.load(f)
+                except Exception as e:
+                    log.warning("[KHÔI PHỤC] Metadata tiến trình của %s bị hỏng: %s", order_id, e)
+
+            rel_dir = metadata.pop("partition", None)
+            if rel_dir is None and metadata.get("start_time"):
+                rel_dir = storage.partition_dir(datetime.datetime.fromisoformat(metadata["start_time"]), metadata.get("camera_name"))
+
+            def checkpoint(final_name):
+                os.makedirs(utils.RECORDING_METADATA_DIR, exist_ok=True)
+                _write_json_atomic(progress_path, dict(metadata, file_name=final_name, partition=rel_dir))
+
+            final_name = None
+            parts_dir = os.path.join(utils.RECORDING_DIR, order_id)
+            if os.path.isdir(parts_dir):
+                final_name = _finalize_segments(order_id, parts_dir, rel_dir or '', checkpoint=checkpoint)
+            if not final_name:
+                # Thư mục tạm không còn/rỗng: video có thể đã được chuyển trước khi gián đoạn
+                final_name = _find_finalized(order_id, rel_dir, metadata.get("file_name"))
+
+            if not final_name:
+                log.warning("[KHÔI PHỤC] Không còn dữ liệu video cho đơn %s, bỏ qua.", order_id)
+                _remove_progress_metadata(order_id)
+                continue
+
+            # Thời điểm kết thúc = lần cập nhật metadata cuối cùng trước khi gián đoạn
+            now_iso = datetime.datetime.now().isoformat()
+            start_iso = metadata.get("start_time") or now_iso
+            end_iso = metadata.pop("last_update", None) or start_iso
+            duration_sec = (datetime.datetime.fromisoformat(end_iso) - datetime.datetime.fromisoformat(start_iso)).total_seconds()
+
+            metadata.update({
+                "file_name": final_name,
+                "start_time": start_iso,
+                "end_time": end_iso,
+                "duration_seconds": round(max(duration_sec, 0), 2),
+                "status": "recovered"
+            })
+            _finish_metadata(order_id, metadata)
+            video_index.get_index().add_recording(metadata)
+            recovered += 1
+            log.info("[KHÔI PHỤC] Đã hoàn tất bản ghi dở dang: %s", final_name)
+        except Exception as e:
+            log.error("[KHÔI PHỤC] Lỗi khi khôi phục đơn %s: %s", order_id, e)
+    return recovered
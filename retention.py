@@ -0,0 +1,193 @@
+# retention.py
+# Dọn dẹp video dựa trên chỉ mục (video_index): xóa video cũ nhất trước, theo hai chính sách
+# - Tuổi:      video cũ hơn utils.DAYS_TO_KEEP ngày
+# - Dung lượng: tổng dung lượng Video vượt RETENTION_MAX_STORAGE_GB, hoặc ổ đĩa còn ít hơn
+#               RETENTION_MIN_FREE_GB trống (cả hai mặc định tắt)
+#
+# Chính sách dung lượng chỉ xóa được trong phạm vi kho video: không đụng tới video mới hơn
+# RETENTION_MIN_KEEP_DAYS ngày và xóa tối đa RETENTION_MAX_DELETE_PER_RUN video mỗi lượt. Nếu ổ đầy vì
+# dữ liệu khác (Windows Update, ứng dụng khác...), xóa hết video cũ cũng không đủ: chỉ cảnh báo thay vì
+# xóa dần toàn bộ kho mỗi phút.
+#
+# Chỉ mục đã sắp xếp theo file_mtime nên mỗi lần chạy chỉ đọc đúng những dòng cần xóa
+# (không stat toàn bộ kho). Việc xóa chia thành lô nhỏ, nghỉ giữa các lô để không tranh
+# I/O với các luồng ghi hình. Đơn đang ghi không bao giờ bị xóa.
+
+import os
+import time
+import shutil
+import logging
+import datetime
+from . import utils, config, video_index, video_catalog, storage, thumbnails
+
+log = logging.getLogger(__name__)
+
+_BYTES_PER_GB = 1024 ** 3
+
+
+def _active_order_ids(app):
+    return {camera.order_id for camera in app.cameras if camera.is_recording and camera.order_id}
+
+
+def _delete_recording(row):
+    """Xóa video (kèm thư mục đoạn) và metadata của một dòng chỉ mục. Trả về số byte đã giải phóng."""
+    file_name = row["file_name"]
+    freed = 0
+    video_file_path = storage.video_path(file_name)
+    if os.path.exists(video_file_path):
+        freed += os.path.getsize(video_file_path)
+        os.remove(video_file_path)
+    parts_dir = storage.parts_dir_path(file_name)
+    if os.path.isdir(parts_dir):
+        freed += storage.parts_size(file_name)
+        shutil.rmtree(parts_dir, ignore_errors=True)
+    try:
+        os.remove(storage.metadata_path(file_name))
+    except FileNotFoundError:
+        pass
+    thumbnails.remove(file_name)
+
+    # Dọn thư mục camera/ngày/tháng/năm nếu đã trống
+    if '/' in file_name:
+        rel_dir = file_name.rsplit('/', 1)[0]
+        storage.remove_empty_parents(utils.OUTPUT_DIR, rel_dir)
+        storage.remove_empty_parents(utils.METADATA_DIR, rel_dir)
+    return freed
+
+
+class RetentionEngine:
+    """Một lượt chạy (run_once) áp dụng lần lượt chính sách tuổi rồi chính sách dung lượng."""
+
+    def __init__(self, app, days_to_keep=None, max_storage_gb=None, min_free_gb=None,
+                 batch_size=None, batch_pause=None, min_keep_days=None, max_delete_per_run=None):
+        self.app = app
+        self.days_to_keep = days_to_keep if days_to_keep is not None else utils.DAYS_TO_KEEP
+        max_storage_gb = max_storage_gb if max_storage_gb is not None else config.RETENTION_MAX_STORAGE_GB
+        min_free_gb = min_free_gb if min_free_gb is not None else config.RETENTION_MIN_FREE_GB
+        self.max_storage_bytes = int(max_storage_gb * _BYTES_PER_GB)
+        self.min_free_bytes = int(min_free_gb * _BYTES_PER_GB)
+        self.batch_size = batch_size or config.RETENTION_BATCH_SIZE
+        self.batch_pause = batch_pause if batch_pause is not None else config.RETENTION_BATCH_PAUSE_SECONDS
+        self.min_keep_days = min_keep_days if min_keep_days is not None else config.RETENTION_MIN_KEEP_DAYS
+        self.max_delete_per_run = max_delete_per_run or config.RETENTION_MAX_DELETE_PER_RUN
+        self.shortfall_warned = False   # đã cảnh báo không đạt được giới hạn dung lượng (chỉ báo một lần)
+
+    def bytes_over_limit(self):
+        """Số byte cần giải phóng để thỏa cả giới hạn tổng dung lượng và dung lượng trống tối thiểu."""
+        needed = 0
+        if self.max_storage_bytes > 0:
+            needed = max(needed, video_index.get_index().total_size() - self.max_storage_bytes)
+        if self.min_free_bytes > 0:
+            free = shutil.disk_usage(utils.OUTPUT_DIR).free
+            needed = max(needed, self.min_free_bytes - free)
+        return needed
+
+    def _expire_day_partitions(self, cutoff_date):
+        """
+        Xóa nguyên các thư mục ngày đã quá hạn (bố cục phân vùng). Trả về (số video, số byte).
+        Nếu rmtree dừng giữa chừng (file đang mở bởi trình phát...), video đã bị xóa vẫn được gỡ khỏi
+        chỉ mục và được tính; phần còn lại được thử xóa ở lượt sau.
+        """
+        index = video_index.get_index()
+        deleted_count = deleted_space = 0
+        for folder_path in (utils.OUTPUT_DIR, utils.METADATA_DIR, utils.THUMBNAIL_DIR):
+            for day, rel_dir in storage.iter_day_partitions(folder_path):
+                if day >= cutoff_date:
+                    break
+                rows = index.partition_rows(rel_dir) if folder_path == utils.OUTPUT_DIR else []
+                try:
+                    shutil.rmtree(os.path.join(folder_path, *rel_dir.split('/')))
+                    storage.remove_empty_parents(folder_path, rel_dir.rsplit('/', 1)[0])
+                    log.info("[XÓA] Đã xóa thư mục ngày: %s", os.path.join(folder_path, rel_dir))
+                except Exception as e:
+                    log.warning("[LỖI DỌN DẸP] Không thể xóa thư mục %s: %s", rel_dir, e)
+                    rows = [row for row in rows if not os.path.exists(storage.video_path(row["file_name"]))]
+                if rows:
+                    removed = [row["order_id"] for row in rows]
+                    index.remove_many(removed)
+                    for order_id in removed:
+                        video_catalog.known_orders.discard(order_id)
+                    deleted_count += len(rows)
+                    deleted_space += sum(row["disk_size"] or row["file_size"] or 0 for row in rows)
+        return deleted_count, deleted_space
+
+    def _delete_batches(self, should_continue, before_mtime=None, max_count=None):
+        """
+        Xóa theo lô các video cũ nhất (cũ hơn before_mtime nếu có) cho tới khi should_continue(số byte
+        đã xóa) trả về False hoặc đã xóa max_count video. Trả về (số video, số byte).
+        """
+        index = video_index.get_index()
+        deleted_count = deleted_space = 0
+        skipped = set()
+
+        def limit_reached(freed, count):
+            return (max_count is not None and count >= max_count) or not should_continue(freed)
+
+        while self.app.is_running and not limit_reached(deleted_space, deleted_count):
+            active = _active_order_ids(self.app)
+            rows = [
+                row for row in index.oldest(self.batch_size + len(skipped), before_mtime)
+                if row["order_id"] not in skipped
+            ]
+            if not rows:
+                break
+            removed = []
+            for row in rows:
+                if row["order_id"] in active:
+                    skipped.add(row["order_id"])
+                    continue
+                try:
+                    deleted_space += _delete_recording(row)
+                    removed.append(row["order_id"])
+                    log.debug("[XÓA] Đã xóa: %s", row["file_name"])
+                except Exception as e:
+                    # Không xóa được (file đang mở...): bỏ qua trong lượt này
+                    skipped.add(row["order_id"])
+                    log.warning("[LỖI DỌN DẸP] Không thể xóa %s: %s", row["file_name"], e)
+                if limit_reached(deleted_space, deleted_count + len(removed)):
+                    break
+            if removed:
+                index.remove_many(removed)
+                for order_id in removed:
+                    video_catalog.known_orders.discard(order_id)
+                deleted_count += len(removed)
+            elif all(row["order_id"] in skipped for row in rows):
+                break
+            time.sleep(self.batch_pause)
+        return deleted_count, deleted_space
+
+    def run_once(self):
+        """Chạy một lượt dọn dẹp. Trả về (số video đã xóa, số byte đã giải phóng)."""
+        cutoff_time = datetime.datetime.now() - datetime.timedelta(days=self.days_to_keep)
+        deleted_count, deleted_space = self._expire_day_partitions(cutoff_time.date())
+
+        # Video còn lại quá hạn (file phẳng của kho cũ, hoặc phần đầu của ngày cắt)
+        count, space = self._delete_batches(lambda _: True, before_mtime=cutoff_time.timestamp())
+        deleted_count += count
+        deleted_space += space
+
+        # Ổ đĩa sắp đầy / vượt hạn mức: xóa tiếp video cũ nhất (trong giới hạn) cho tới khi đủ
+        needed = self.bytes_over_limit()
+        if needed <= 0:
+            self.shortfall_warned = False
+            return deleted_count, deleted_space
+        if not self.shortfall_warned:
+            log.info("[DỌN DẸP] Vượt giới hạn dung lượng, cần giải phóng %.2f MB.", needed / (1024 * 1024))
+        floor_time = datetime.datetime.now() - datetime.timedelta(days=self.min_keep_days)
+        count, space = self._delete_batches(
+            lambda freed: freed < needed, before_mtime=floor_time.timestamp(), max_count=self.max_delete_per_run
+        )
+        deleted_count += count
+        deleted_space += space
+        if space >= needed:
+            self.shortfall_warned = False
+        elif count >= self.max_delete_per_run:
+            # Còn video có thể xóa: lượt kiểm tra sau xóa tiếp
+            log.info("[DỌN DẸP] Đã xóa tối đa %d video trong lượt này, còn thiếu %.2f MB.",
+                     count, (needed - space) / (1024 * 1024))
+        elif not self.shortfall_warned:
+            self.shortfall_warned = True
+            log.warning("[CẢNH BÁO DỌN DẸP] Không thể đạt giới hạn dung lượng: còn thiếu %.2f MB sau khi xóa hết "
+                        "video cũ hơn %d ngày. Ổ đĩa có thể đang bị chiếm bởi dữ liệu khác ngoài video.",
+                        (needed - space) / (1024 * 1024), self.min_keep_days)
+        return deleted_count, deleted_space
@@ -0,0 +1,113 @@
+# scan_router.py
+# Bộ định tuyến lượt quét QR: quyết định ngay trong luồng camera lượt quét nào cần tới luồng GUI.
+#
+# Một mã QR nằm trước camera được giải mã ~5 lần/giây. Trước đây mỗi lần giải mã đều đặt một
+# callback Tk rồi mới bị loại bởi các mốc thời gian rải rác trên Camera. Nay mọi lượt quét đi qua
+# ScanRouter.accept() (gọi từ luồng camera); chỉ các lượt cần xử lý mới được chuyển cho GUI:
+# - Lặp lại theo camera: cùng camera, cùng mã, chưa quá SCAN_REPEAT_SECONDS kể từ lượt được xét gần
+#   nhất. Mốc chỉ trượt theo lượt bị bỏ qua khi camera đang ghi chính đơn đó; nếu không (ví dụ bắt đầu
+#   ghi thất bại vì camera mất kết nối), mã vẫn nằm trước camera được thử lại sau mỗi SCAN_REPEAT_SECONDS.
+# - Lặp lại toàn cục: camera khác vừa nhận đúng mã này trong SCAN_GLOBAL_SECONDS (vùng nhìn chồng nhau).
+# - Mã đang được chính camera này ghi: bỏ qua (tiếp tục ghi).
+# - Mã đang được camera khác ghi, hoặc đã ghi trước đó: chỉ chuyển một cảnh báo mỗi
+#   SCAN_WARNING_SECONDS cho mỗi cặp (camera, mã).
+# Bảng mã đơn -> camera đang ghi được cập nhật khi bắt đầu/kết thúc ghi, tra cứu O(1).
+
+import time
+import threading
+from collections import Counter
+from . import config, video_catalog
+
+# Lý do bỏ qua (khóa của bộ đếm)
+SUPPRESSED_REPEAT = "repeat"
+SUPPRESSED_OTHER_CAMERA = "other_camera"
+SUPPRESSED_RECORDING = "recording"
+SUPPRESSED_WARNING = "warning_cooldown"
+
+# Kết quả của accept()
+FORWARD = "forward"                  # xử lý bình thường (bắt đầu/chuyển đơn)
+WARN_DUPLICATE = "warn_duplicate"    # cảnh báo đơn đã được ghi
+WARN_OTHER_CAMERA = "warn_other"     # cảnh báo đơn đang được camera khác ghi
+
+
+class ScanRouter:
+    def __init__(self, repeat_seconds=None, global_seconds=None, warning_seconds=None):
+        self.repeat_seconds = repeat_seconds if repeat_seconds is not None else config.SCAN_REPEAT_SECONDS
+        self.global_seconds = global_seconds if global_seconds is not None else config.SCAN_GLOBAL_SECONDS
+        self.warning_seconds = warning_seconds if warning_seconds is not None else config.SCAN_WARNING_SECONDS
+        self.lock = threading.Lock()
+        self.owners = {}          # {order_id: camera_id} của các đơn đang ghi
+        self.last_seen = {}       # {camera_id: (order_id, thời điểm thấy gần nhất)}
+        self.last_accepted = {}   # {order_id: (camera_id, thời điểm)} - lượt được chuyển cho GUI gần nhất
+        self.last_warned = {}     # {(camera_id, order_id): thời điểm cảnh báo}
+        self.suppressed = {}      # {camera_id: Counter(lý do)}
+
+    def _suppress(self, camera_id, reason):
+        self.suppressed.setdefault(camera_id, Counter())[reason] += 1
+        return None
+
+    def accept(self, camera_id, order_id):
+        """
+        Gọi từ luồng camera cho mỗi mã vận đơn giải mã được.
+        Trả về FORWARD / WARN_DUPLICATE / WARN_OTHER_CAMERA, hoặc None nếu lượt quét bị bỏ qua.
+        """
+        now = time.monotonic()
+        with self.lock:
+            previous = self.last_seen.get(camera_id)
+            if previous and previous[0] == order_id and now - previous[1] < self.repeat_seconds:
+                if self.owners.get(order_id) == camera_id:
+                    self.last_seen[camera_id] = (order_id, now)
+                return self._suppress(camera_id, SUPPRESSED_REPEAT)
+            self.last_seen[camera_id] = (order_id, now)
+
+            owner = self.owners.get(order_id)
+            if owner == camera_id:
+                return self._suppress(camera_id, SUPPRESSED_RECORDING)
+
+            accepted = self.last_accepted.get(order_id)
+            if accepted and accepted[0] != camera_id and now - accepted[1] < self.global_seconds:
+                return self._suppress(camera_id, SUPPRESSED_OTHER_CAMERA)
+
+            if owner is not None or order_id in video_catalog.known_orders:
+                warned_at = self.last_warned.get((camera_id, order_id))
+                if warned_at is not None and now - warned_at < self.warning_seconds:
+                    return self._suppress(camera_id, SUPPRESSED_WARNING)
+                self.last_warned[(camera_id, order_id)] = now
+                return WARN_OTHER_CAMERA if owner is not None else WARN_DUPLICATE
+
+            self.last_accepted[order_id] = (camera_id, now)
+            self._forget_expired(now)
+            return FORWARD
+
+    def _forget_expired(self, now):
+        """Bỏ các mốc đã hết hạn để các bảng không lớn dần theo số đơn trong ngày."""
+        horizon = max(self.repeat_seconds, self.global_seconds, self.warning_seconds)
+        if len(self.last_accepted) > 256:
+            self.last_accepted = {k: v for k, v in self.last_accepted.items() if now - v[1] < horizon}
+        if len(self.last_warned) > 256:
+            self.last_warned = {k: t for k, t in self.last_warned.items() if now - t < horizon}
+
+    # --- Bảng đơn đang ghi (gọi khi bắt đầu/kết thúc ghi) ---
+
+    def claim(self, order_id, camera_id):
+        with self.lock:
+            self.owners[order_id] = camera_id
+
+    def release(self, order_id):
+        with self.lock:
+            self.owners.pop(order_id, None)
+
+    def owner_of(self, order_id):
+        with self.lock:
+            return self.owners.get(order_id)
+
+    # --- Thống kê ---
+
+    def suppressed_counts(self):
+        """{camera_id: {lý do: số lượt bỏ qua}}"""
+        with self.lock:
+            return {camera_id: dict(counter) for camera_id, counter in self.suppressed.items()}
+
+    def total_suppressed(self):
+        with self.lock:
+            return sum(sum(counter.values()) for counter in self.suppressed.values())
@@ -0,0 +1,215 @@
+# search_index.py
+# Chỉ mục tìm kiếm trong bộ nhớ cho tab Tra cứu (tìm ngay khi đang gõ).
+#
+# Dựng từ chỉ mục SQLite (video_index), gồm:
+# - Mã đơn: danh sách đã sắp xếp -> tìm theo tiền tố bằng bisect (tương đương duyệt trie);
+#   danh sách mã viết ngược đã sắp xếp -> tìm theo hậu tố (nhân viên thường chỉ nhớ vài số cuối);
+#   từ khóa đủ dài còn được tìm như chuỗi con ở bất kỳ vị trí nào trong mã, qua chỉ mục n-gram
+#   (mỗi n ký tự liên tiếp -> danh sách mã chứa nó; dựng khi có truy vấn chuỗi con đầu tiên).
+# - Từ khóa phụ: từ khóa ngắn của đơn vị vận chuyển ("spx", "j&t"... theo luật QR trong qr_parser
+#   khớp với mã đơn - không dùng tên mô tả của luật vì chứa số và từ chung), tên camera
+#   và ngày ghi ("2025-12-11", "11/12/2025", "11/12"), tìm theo tiền tố trên danh sách đã sắp xếp;
+#   chỉ mục ngược {từ khóa: [mã]} cho biết ngay các đơn của từng từ khóa khớp.
+#
+# Nhiều từ khóa cách nhau bởi dấu cách: video phải khớp mọi từ khóa ("spx 11/12 2211").
+# Xếp hạng: trùng khớp > tiền tố > hậu tố > chuỗi con > từ khóa phụ; cùng điểm thì video mới hơn trước.
+# Chỉ mục tự dựng lại khi video_index có thay đổi (so sánh generation); từ khóa phụ của từng đơn
+# (đơn vị vận chuyển, ngày) được giữ lại giữa các lần dựng nên dựng lại chủ yếu là sắp xếp.
+
+import re
+import sys
+import bisect
+import logging
+import datetime
+import threading
+from . import video_index, qr_parser
+
+log = logging.getLogger(__name__)
+
+# Từ khóa ngắn hơn mức này chỉ tìm theo tiền tố/hậu tố (chuỗi con quá ngắn khớp gần như mọi mã).
+# Cũng là độ dài n-gram của chỉ mục chuỗi con.
+MIN_SUBSTRING_LENGTH = 3
+
+# Số kết quả tối đa của một truy vấn
+MAX_RESULTS = 500
+
+_SCORE_EXACT = 100
+_SCORE_PREFIX = 60
+_SCORE_SUFFIX = 50
+_SCORE_SUBSTRING = 30
+_SCORE_TOKEN = 20
+_SCORE_TOKEN_PREFIX = 10
+
+_TOKEN_RE = re.compile(r"[^\s(),]+")
+
+
+def _tokenize(text):
+    return [sys.intern(token) for token in _TOKEN_RE.findall(text.lower())] if text else []
+
+
+def _date_tokens(start_time):
+    try:
+        start = datetime.datetime.fromisoformat(start_time)
+    except (TypeError, ValueError):
+        return []
+    return [sys.intern(token) for token in (f"{start:%Y-%m-%d}", f"{start:%d/%m/%Y}", f"{start:%d/%m}")]
+
+
+def _prefix_range(sorted_keys, prefix):
+    """Các phần tử của danh sách đã sắp xếp bắt đầu bằng prefix."""
+    low = bisect.bisect_left(sorted_keys, prefix)
+    high = bisect.bisect_left(sorted_keys, prefix + "\uffff", low)
+    return sorted_keys[low:high]
+
+
+class _Snapshot:
+    """Dữ liệu của một lần dựng; chỉ đọc sau khi dựng xong nên các luồng tìm kiếm dùng chung không cần khóa."""
+
+    def __init__(self, generation, keys, reversed_keys, token_keys, order_ids, start_times):
+        self.generation = generation
+        self.keys = keys                    # mã đơn viết hoa, đã sắp xếp
+        self.reversed_keys = reversed_keys  # mã đơn viết hoa viết ngược, đã sắp xếp
+        self.token_keys = token_keys        # {từ khóa phụ: [mã viết hoa]} (chỉ mục ngược)
+        self.tokens = sorted(token_keys)    # các từ khóa phụ khác nhau, đã sắp xếp
+        self.order_ids = order_ids          # {mã viết hoa: mã đơn gốc}
+        self.start_times = start_times      # {mã viết hoa: start_time}
+        self.grams = None                   # {n-gram: [vị trí trong keys]}, dựng khi cần
+
+    def _gram_index(self):
+        grams = self.grams
+        if grams is None:
+            n = MIN_SUBSTRING_LENGTH
+            grams = {}
+            for position, key in enumerate(self.keys):
+                for gram in {key[i:i + n] for i in range(len(key) - n + 1)}:
+                    grams.setdefault(gram, []).append(position)
+            self.grams = grams
+        return grams
+
+    def substring_matches(self, upper):
+        """Các mã chứa chuỗi upper (len >= MIN_SUBSTRING_LENGTH): lấy danh sách n-gram ngắn nhất rồi kiểm tra lại."""
+        grams = self._gram_index()
+        n = MIN_SUBSTRING_LENGTH
+        postings = [grams.get(upper[i:i + n]) for i in range(len(upper) - n + 1)]
+        if not all(postings):
+            return []
+        candidates = min(postings, key=len)
+        return [self.keys[position] for position in candidates if upper in self.keys[position]]
+
+
+class SearchIndex:
+    def __init__(self):
+        self.build_lock = threading.Lock()
+        self.snapshot = _Snapshot(None, [], [], {}, {}, {})
+        # {order_id: (camera_name, start_time, từ khóa phụ)} - giữ lại giữa các lần dựng
+        self.fields = {}
+
+    def _build(self, generation, rows):
+        fields = {}
+        token_keys = {}
+        order_ids = {}
+        start_times = {}
+        for order_id, camera_name, start_time in rows:
+            cached = self.fields.get(order_id)
+            if cached and cached[0] == camera_name and cached[1] == start_time:
+                tokens = cached[2]
+            else:
+                tokens = set(_tokenize(camera_name))
+                tokens.update(_tokenize(qr_parser.carrier_key_of(order_id)))
+                tokens.update(_date_tokens(start_time))
+                tokens = frozenset(tokens)
+            fields[order_id] = (camera_name, start_time, tokens)
+
+            key = order_id.upper()
+            order_ids[key] = order_id
+            start_times[key] = start_time or ""
+            for token in tokens:
+                token_keys.setdefault(token, []).append(key)
+
+        self.fields = fields
+        self.snapshot = _Snapshot(
+            generation,
+            sorted(order_ids),
+            sorted(key[::-1] for key in order_ids),
+            token_keys,
+            order_ids,
+            start_times
+        )
+
+    def ensure_fresh(self):
+        """Dựng lại nếu chỉ mục video đã thay đổi kể từ lần dựng trước."""
+        index = video_index.get_index()
+        if index.generation == self.snapshot.generation:
+            return
+        with self.build_lock:
+            if index.generation == self.snapshot.generation:
+                return
+            generation, rows = index.search_fields()
+            self._build(generation, rows)
+
+    @staticmethod
+    def _match_term(snapshot, term):
+        """{mã viết hoa: điểm} của các đơn khớp một từ khóa."""
+        upper, lower = term.upper(), term.lower()
+        scores = {}
+
+        def hit(key, score):
+            if score > scores.get(key, 0):
+                scores[key] = score
+
+        for key in _prefix_range(snapshot.keys, upper):
+            hit(key, _SCORE_EXACT if key == upper else _SCORE_PREFIX)
+        for reversed_key in _prefix_range(snapshot.reversed_keys, upper[::-1]):
+            hit(reversed_key[::-1], _SCORE_SUFFIX)
+        if len(upper) >= MIN_SUBSTRING_LENGTH:
+            for key in snapshot.substring_matches(upper):
+                hit(key, _SCORE_SUBSTRING)
+        for token in _prefix_range(snapshot.tokens, lower):
+            score = _SCORE_TOKEN if token == lower else _SCORE_TOKEN_PREFIX
+            for key in snapshot.token_keys[token]:
+                hit(key, score)
+        return scores
+
+    def search(self, query, limit=MAX_RESULTS):
+        """Danh sách mã đơn khớp query, đã xếp hạng (tốt nhất trước), tối đa limit mã."""
+        terms = query.split()
+        if not terms:
+            return []
+        self.ensure_fresh()
+        snapshot = self.snapshot
+
+        scores = None
+        for term in terms:
+            term_scores = self._match_term(snapshot, term)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {key: score + term_scores[key] for key, score in scores.items() if key in term_scores}
+            if not scores:
+                return []
+
+        # Sắp xếp ổn định hai lượt: mới nhất trước, rồi theo điểm
+        ranked = sorted(scores, key=lambda key: snapshot.start_times[key], reverse=True)
+        ranked.sort(key=lambda key: scores[key], reverse=True)
+        return [snapshot.order_ids[key] for key in ranked[:limit]]
+
+
+_index = SearchIndex()
+
+
+def search(query, limit=MAX_RESULTS):
+    return _index.search(query, limit)
+
+
+def warm_up():
+    """Dựng chỉ mục ở luồng nền (sau khi đồng bộ chỉ mục video) để lần gõ tìm kiếm đầu tiên không phải chờ."""
+    def _run():
+        try:
+            _index.ensure_fresh()
+        except Exception as e:
+            log.error("[TRA CỨU] Không thể dựng chỉ mục tìm kiếm: %s", e)
+    threading.Thread(target=_run, daemon=True).start()
+
+
+def is_exact_match(query, order_id):
+    return query.strip().upper() == order_id.upper()
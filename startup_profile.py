@@ -0,0 +1,133 @@
+# startup_profile.py
+# Đo thời gian khởi động.
+#
+# - mark(tên): ghi một mốc (cửa sổ đăng nhập, cửa sổ chính, hình preview đầu tiên), tính từ lúc
+#   main_app bắt đầu nạp (module này được import đầu tiên), và in "[STARTUP] tên: x.xxxs".
+# - Chạy trực tiếp để đo: thời gian import (python -X importtime) của phần cần cho cửa sổ đăng nhập và
+#   của toàn bộ ứng dụng, rồi chạy ứng dụng ở chế độ đo (PACKINGAPP_STARTUP_BENCHMARK=1): ứng dụng tự
+#   đóng sau cửa sổ đăng nhập (nếu chưa đăng nhập) hoặc sau hình preview đầu tiên.
+#
+#     python -m PackingApp.startup_profile
+#     python -m PackingApp.startup_profile --imports-only --top 20
+
+import os
+import sys
+import time
+
+_START = time.perf_counter()
+
+# Chế độ đo: ứng dụng tự đóng sau mốc cuối có thể đo được
+BENCHMARK = os.getenv('PACKINGAPP_STARTUP_BENCHMARK', 'false').lower() in ('1', 'true')
+
+# Các mốc theo thứ tự
+MARK_LOGIN_WINDOW = "login_window"
+MARK_MAIN_WINDOW = "main_window"
+MARK_FIRST_PREVIEW = "first_preview"
+
+_marks = {}
+
+
+def mark(name):
+    """Ghi mốc name (chỉ lần đầu). Trả về True nếu đây là lần đầu."""
+    if name in _marks:
+        return False
+    elapsed = time.perf_counter() - _START
+    _marks[name] = elapsed
+    print(f"[STARTUP] {name}: {elapsed:.3f}s")
+    return True
+
+
+def marks():
+    return dict(_marks)
+
+
+# ----------------------------------------------------
+# ĐO TỪ DÒNG LỆNH
+# ----------------------------------------------------
+
+PACKAGE = __package__ or "PackingApp"
+
+# Các thư viện nặng cần theo dõi riêng trong báo cáo import
+HEAVY_MODULES = ("customtkinter", "PIL", "cv2", "numpy", "requests", "pyttsx3", "qreader", "torch")
+
+
+def _project_root():
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(stderr):
+    """{module: (self_us, cumulative_us)} từ đầu ra của python -X importtime."""
+    result = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            result[name.strip()] = (int(self_us), int(cumulative_us))
+        except ValueError:
+            continue
+    return result
+
+
+def measure_imports(module):
+    """Thời gian import (giây) của module trong một tiến trình mới, kèm bảng chi tiết."""
+    import subprocess
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=_project_root(), capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "import lỗi")
+    table = parse_importtime(completed.stderr)
+    total = table.get(module, (0, 0))[1] / 1e6
+    return total, table
+
+
+def run_app(timeout):
+    """Chạy ứng dụng ở chế độ đo, trả về {mốc: giây}."""
+    import subprocess
+    env = dict(os.environ, PACKINGAPP_STARTUP_BENCHMARK="1")
+    completed = subprocess.run(
+        [sys.executable, "-m", f"{PACKAGE}.main_app"],
+        cwd=_project_root(), env=env, capture_output=True, text=True, encoding="utf-8",
+        errors="replace", timeout=timeout
+    )
+    result = {}
+    for line in completed.stdout.splitlines():
+        if line.startswith("[STARTUP] "):
+            name, _, seconds = line[len("[STARTUP] "):].partition(": ")
+            result[name] = float(seconds.rstrip("s"))
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Đo thời gian khởi động PackingApp.")
+    parser.add_argument("--imports-only", action="store_true", help="Chỉ đo thời gian import, không chạy ứng dụng")
+    parser.add_argument("--top", type=int, default=10, help="Số module import chậm nhất cần liệt kê")
+    parser.add_argument("--timeout", type=float, default=120, help="Thời gian chờ tối đa khi chạy ứng dụng (giây)")
+    args = parser.parse_args()
+
+    for label, module in (("Cửa sổ đăng nhập", f"{PACKAGE}.login_window"), ("Toàn bộ ứng dụng", f"{PACKAGE}.main_app")):
+        try:
+            total, table = measure_imports(module)
+        except RuntimeError as e:
+            print(f"[STARTUP] Không thể import {module}: {e}")
+            continue
+        print(f"\n[STARTUP] {label} ({module}): import {total:.3f}s")
+        heavy = [(name, table[name][1] / 1e6) for name in HEAVY_MODULES if name in table]
+        if heavy:
+            print("  Thư viện nặng: " + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in heavy))
+        for name, (self_us, _) in sorted(table.items(), key=lambda item: item[1][0], reverse=True)[:args.top]:
+            print(f"  {self_us / 1e3:8.1f} ms  {name}")
+
+    if not args.imports_only:
+        print("\n[STARTUP] Chạy ứng dụng ở chế độ đo...")
+        try:
+            measured = run_app(args.timeout)
+        except Exception as e:
+            print(f"[STARTUP] Lỗi khi chạy ứng dụng: {e}")
+            measured = {}
+        for name in (MARK_LOGIN_WINDOW, MARK_MAIN_WINDOW, MARK_FIRST_PREVIEW):
+            print(f"  {name:<15} {measured[name]:.3f}s" if name in measured else f"  {name:<15} -")
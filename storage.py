@@ -0,0 +1,260 @@
+# storage.py
+# Bố cục lưu trữ phân vùng theo ngày và camera:
+#     Video/YYYY/MM/DD/<camera>/<order>.avi      (hoặc <order>.m3u + <order>.parts/)
+#     Metadata/YYYY/MM/DD/journal.jsonl           (nhật ký ngày, xem metadata_journal.py)
+#
+# File metadata riêng Metadata/YYYY/MM/DD/<camera>/<order>.json (metadata_path) chỉ được ghi khi
+# xuất (python -m PackingApp.metadata_journal) hoặc khi bật METADATA_PER_ORDER_JSON; kho cũ vẫn đọc được.
+#
+# Mỗi thư mục chỉ chứa video của một ngày/một camera nên listdir, kiểm tra tồn tại và
+# dọn dẹp theo ngày (xóa nguyên thư mục ngày) đều nhanh. Việc tìm video theo mã đơn
+# đi qua chỉ mục (video_index) vì vị trí file phụ thuộc ngày ghi.
+#
+# Đường dẫn video được lưu trong chỉ mục dưới dạng đường dẫn tương đối so với Video/,
+# luôn dùng dấu '/' (ví dụ "2025/12/11/Webcam/SPX123.avi"). File cũ nằm phẳng trong
+# Video/ vẫn đọc được bình thường (đường dẫn tương đối chỉ là tên file).
+#
+# Chuyển kho cũ (phẳng) sang bố cục mới - chạy từ thư mục chứa PackingApp:
+#     python -m PackingApp.storage            # di chuyển
+#     python -m PackingApp.storage --dry-run  # chỉ liệt kê
+
+import os
+import re
+import json
+import datetime
+from . import utils, config
+
+# Tên thư mục cho video không rõ camera
+UNKNOWN_CAMERA_DIR = "Khac"
+
+_INVALID_PATH_CHARS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+_DAY_PARTITION = re.compile(r'^\d{4}/\d{2}/\d{2}$')
+
+
+def camera_dir_name(camera_name):
+    """Tên thư mục an toàn (Windows) cho một camera."""
+    name = _INVALID_PATH_CHARS.sub('_', str(camera_name or '')).strip(' .')
+    return name or UNKNOWN_CAMERA_DIR
+
+
+def partition_dir(start_time, camera_name):
+    """Thư mục tương đối ('YYYY/MM/DD/<camera>') của một bản ghi, hoặc '' nếu dùng bố cục phẳng."""
+    if not config.STORAGE_PARTITIONED:
+        return ''
+    return f"{start_time:%Y/%m/%d}/{camera_dir_name(camera_name)}"
+
+
+def join_relative(rel_dir, name):
+    return f"{rel_dir}/{name}" if rel_dir else name
+
+
+def order_id_of(rel_file):
+    """'2025/12/11/Webcam/SPX123.avi' -> 'SPX123'."""
+    return os.path.splitext(rel_file.rsplit('/', 1)[-1])[0]
+
+
+def _absolute(root, rel_path):
+    return os.path.join(root, *rel_path.split('/')) if rel_path else root
+
+
+def video_path(rel_file):
+    """Đường dẫn tuyệt đối của video từ đường dẫn tương đối trong chỉ mục."""
+    return _absolute(utils.OUTPUT_DIR, rel_file)
+
+
+def parts_dir_path(rel_file):
+    """Thư mục <order>.parts đi kèm playlist .m3u."""
+    return os.path.splitext(video_path(rel_file))[0] + utils.PARTS_DIR_SUFFIX
+
+
+def parts_size(rel_file):
+    """Tổng dung lượng các đoạn của một playlist (0 nếu không phải playlist)."""
+    if not rel_file.endswith(utils.PLAYLIST_EXTENSION):
+        return 0
+    total = 0
+    try:
+        with os.scandir(parts_dir_path(rel_file)) as it:
+            for entry in it:
+                if entry.is_file():
+                    total += entry.stat().st_size
+    except FileNotFoundError:
+        pass
+    return total
+
+
+def segment_paths(rel_file):
+    """Các file video thực tế theo thứ tự phát: danh sách đoạn của playlist .m3u, hoặc chính file đó."""
+    path = video_path(rel_file)
+    if not rel_file.endswith(utils.PLAYLIST_EXTENSION):
+        return [path]
+    base_dir = os.path.dirname(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        return [
+            os.path.join(base_dir, *line.strip().split('/'))
+            for line in f if line.strip() and not line.startswith('#')
+        ]
+
+
+def metadata_path(rel_file):
+    """Metadata nằm ở cùng thư mục phân vùng với video, bên dưới Metadata/."""
+    rel_dir = rel_file.rsplit('/', 1)[0] if '/' in rel_file else ''
+    return os.path.join(_absolute(utils.METADATA_DIR, rel_dir), f"{order_id_of(rel_file)}.json")
+
+
+def is_skipped_dir(name):
+    """Thư mục không duyệt khi quét: bản ghi đang quay và các thư mục đoạn của playlist."""
+    return name == os.path.basename(utils.RECORDING_DIR) or name.endswith(utils.PARTS_DIR_SUFFIX)
+
+
+def _walk_files(root, accept):
+    """Duyệt đệ quy root, trả về (đường dẫn tương đối, os.stat_result) cho mỗi file được chấp nhận."""
+    stack = ['']
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            with os.scandir(_absolute(root, rel_dir)) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        if not is_skipped_dir(entry.name):
+                            stack.append(join_relative(rel_dir, entry.name))
+                    elif entry.is_file() and accept(entry.name):
+                        yield join_relative(rel_dir, entry.name), entry.stat()
+        except FileNotFoundError:
+            continue
+
+
+def iter_video_files():
+    return _walk_files(utils.OUTPUT_DIR, lambda name: name.lower().endswith(utils.VIDEO_EXTENSIONS))
+
+
+def iter_metadata_files():
+    return _walk_files(utils.METADATA_DIR, lambda name: name.endswith('.json'))
+
+
+def video_on_disk(order_id):
+    """
+    Đơn đã có video trên ổ đĩa (file phẳng, thư mục đang ghi hoặc trong bất kỳ thư mục ngày/camera nào).
+    Chậm hơn tra chỉ mục (stat theo số ngày x số camera) - chỉ dùng khi danh mục trong bộ nhớ chưa sẵn sàng.
+    """
+    if os.path.isdir(os.path.join(utils.RECORDING_DIR, order_id)):
+        return True
+    names = [f"{order_id}{ext}" for ext in utils.VIDEO_EXTENSIONS]
+    if any(os.path.exists(os.path.join(utils.OUTPUT_DIR, name)) for name in names):
+        return True
+    for _, rel_dir in iter_day_partitions(utils.OUTPUT_DIR):
+        day_path = _absolute(utils.OUTPUT_DIR, rel_dir)
+        try:
+            with os.scandir(day_path) as it:
+                camera_dirs = [entry.path for entry in it if entry.is_dir()]
+        except FileNotFoundError:
+            continue
+        for camera_dir in camera_dirs:
+            if any(os.path.exists(os.path.join(camera_dir, name)) for name in names):
+                return True
+    return False
+
+
+def iter_day_partitions(root):
+    """Trả về (date, đường dẫn tương đối 'YYYY/MM/DD') cho các thư mục ngày trong root, cũ nhất trước."""
+    for year in sorted(_list_dirs(root)):
+        for month in sorted(_list_dirs(os.path.join(root, year))):
+            for day in sorted(_list_dirs(os.path.join(root, year, month))):
+                rel_dir = f"{year}/{month}/{day}"
+                if not _DAY_PARTITION.match(rel_dir):
+                    continue
+                try:
+                    yield datetime.date(int(year), int(month), int(day)), rel_dir
+                except ValueError:
+                    continue
+
+
+def _list_dirs(path):
+    try:
+        with os.scandir(path) as it:
+            return [e.name for e in it if e.is_dir() and e.name.isdigit()]
+    except FileNotFoundError:
+        return []
+
+
+def remove_empty_parents(root, rel_dir):
+    """Xóa các thư mục cha rỗng (tháng, năm) sau khi xóa một thư mục ngày."""
+    parts = rel_dir.split('/')
+    while parts:
+        path = _absolute(root, '/'.join(parts))
+        try:
+            os.rmdir(path)
+        except OSError:
+            break
+        parts.pop()
+
+
+# ----------------------------------------------------
+# CHUYỂN KHO CŨ SANG BỐ CỤC PHÂN VÙNG
+# ----------------------------------------------------
+
+def _flat_recording_info(order_id, video_file_path):
+    """Lấy (start_time, camera_name) của một video phẳng từ metadata, hoặc mtime của file."""
+    metadata_file = os.path.join(utils.METADATA_DIR, f"{order_id}.json")
+    if os.path.exists(metadata_file):
+        try:
+            with open(metadata_file, 'r') as f:
+                metadata = json.load(f)
+            return datetime.datetime.fromisoformat(metadata["start_time"]), metadata.get("camera_name")
+        except Exception as e:
+            print(f"[MIGRATE] Metadata của {order_id} không đọc được, dùng thời gian file: {e}")
+    return datetime.datetime.fromtimestamp(os.path.getmtime(video_file_path)), None
+
+
+def migrate_flat_archive(dry_run=False):
+    """
+    Di chuyển video/metadata nằm phẳng trong Video/ và Metadata/ vào thư mục phân vùng.
+    Chỉ đổi tên (os.replace), không sao chép. Trả về số video đã (hoặc sẽ) di chuyển.
+    """
+    moved = 0
+    with os.scandir(utils.OUTPUT_DIR) as it:
+        flat_videos = [e.name for e in it if e.is_file() and e.name.lower().endswith(utils.VIDEO_EXTENSIONS)]
+
+    for file_name in sorted(flat_videos):
+        order_id = os.path.splitext(file_name)[0]
+        source = os.path.join(utils.OUTPUT_DIR, file_name)
+        try:
+            start_time, camera_name = _flat_recording_info(order_id, source)
+            target_dir = f"{start_time:%Y/%m/%d}/{camera_dir_name(camera_name)}"
+            target_rel = join_relative(target_dir, file_name)
+            print(f"[MIGRATE] {file_name} -> {target_rel}")
+            if dry_run:
+                moved += 1
+                continue
+
+            os.makedirs(_absolute(utils.OUTPUT_DIR, target_dir), exist_ok=True)
+            os.makedirs(_absolute(utils.METADATA_DIR, target_dir), exist_ok=True)
+
+            # Playlist và thư mục đoạn đi cùng nhau để đường dẫn tương đối trong .m3u vẫn đúng
+            parts_dir = os.path.join(utils.OUTPUT_DIR, order_id + utils.PARTS_DIR_SUFFIX)
+            if os.path.isdir(parts_dir):
+                os.replace(parts_dir, parts_dir_path(target_rel))
+            os.replace(source, video_path(target_rel))
+
+            metadata_file = os.path.join(utils.METADATA_DIR, f"{order_id}.json")
+            if os.path.exists(metadata_file):
+                os.replace(metadata_file, metadata_path(target_rel))
+            moved += 1
+        except Exception as e:
+            print(f"[MIGRATE] Lỗi khi di chuyển {file_name}: {e}")
+    return moved
+
+
+if __name__ == "__main__":
+    import argparse
+    from . import video_index
+
+    parser = argparse.ArgumentParser(description="Chuyển kho Video/Metadata phẳng sang bố cục phân vùng theo ngày.")
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ liệt kê, không di chuyển file")
+    args = parser.parse_args()
+
+    count = migrate_flat_archive(dry_run=args.dry_run)
+    if args.dry_run:
+        print(f"[MIGRATE] Sẽ di chuyển {count} video.")
+    else:
+        added, removed = video_index.get_index().sync_with_disk()
+        print(f"[MIGRATE] Đã di chuyển {count} video. Chỉ mục: cập nhật {added}, xóa {removed} mục.")
@@ -0,0 +1,205 @@
+# thumbnails.py
+# Ảnh xem trước (dải vài khung hình thu nhỏ) và chỉ mục tua cho từng video, tạo ở luồng nền
+# sau khi kết thúc ghi hình. Lưu trong Thumbnails/ với cùng đường dẫn tương đối như Video/:
+#     Thumbnails/YYYY/MM/DD/<camera>/<order>.jpg          - dải ảnh xem trước
+#     Thumbnails/YYYY/MM/DD/<camera>/<order>.index.json   - chỉ mục tua
+#
+# Chỉ mục tua ánh xạ thời gian -> (đoạn, số khung hình). OpenCV không cho biết khung nào là
+# keyframe, nhưng mỗi đoạn của bản ghi SEGMENTED là một file riêng bắt đầu bằng keyframe,
+# nên tua tới phút thứ N chỉ cần mở đúng đoạn chứa nó thay vì giải mã từ đầu video.
+
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from . import utils, config, storage
+
+log = logging.getLogger(__name__)
+
+# Số khung hình trong dải xem trước và kích thước mỗi khung
+THUMBNAIL_COUNT = 4
+THUMBNAIL_SIZE = (80, 45)
+THUMBNAIL_JPEG_QUALITY = 70
+
+# Nghỉ giữa hai video khi tạo hàng loạt, để không tranh CPU/ổ đĩa với các luồng ghi hình
+_WORKER_PAUSE_SECONDS = 0.2
+
+_queue = queue.LifoQueue()
+_pending = set()
+# Video không tạo được ảnh (file hỏng, chưa có khung hình): không thử lại trong phiên này
+_failed = set()
+_pending_lock = threading.Lock()
+_worker = None
+
+
+def _cache_base(rel_file):
+    return os.path.join(utils.THUMBNAIL_DIR, *os.path.splitext(rel_file)[0].split('/'))
+
+
+def strip_path(rel_file):
+    return _cache_base(rel_file) + ".jpg"
+
+
+def index_path(rel_file):
+    return _cache_base(rel_file) + ".index.json"
+
+
+# ----------------------------------------------------
+# CHỈ MỤC TUA
+# ----------------------------------------------------
+
+def build_seek_index(rel_file):
+    """
+    Đọc số khung hình và FPS của từng đoạn (chỉ đọc header, không giải mã).
+    Trả về {"duration": giây, "segments": [{"path", "start", "frames", "fps"}]}.
+    """
+    import cv2  # nạp khi cần (utils import module này cho cả cửa sổ đăng nhập)
+    segments = []
+    offset = 0.0
+    for path in storage.segment_paths(rel_file):
+        cap = cv2.VideoCapture(path)
+        try:
+            frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+            fps = cap.get(cv2.CAP_PROP_FPS) or config.FPS
+        finally:
+            cap.release()
+        segments.append({
+            "path": os.path.relpath(path, utils.OUTPUT_DIR).replace(os.sep, '/'),
+            "start": round(offset, 3),
+            "frames": frames,
+            "fps": fps
+        })
+        offset += frames / fps if fps else 0
+    return {"duration": round(offset, 3), "segments": segments}
+
+
+def load_seek_index(rel_file):
+    """Chỉ mục tua đã lưu, hoặc tạo mới (không lưu) nếu chưa có."""
+    try:
+        with open(index_path(rel_file), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return build_seek_index(rel_file)
+
+
+def locate(seek_index, seconds):
+    """Trả về (đường dẫn tuyệt đối của đoạn, số khung hình trong đoạn) cho thời điểm seconds."""
+    segments = seek_index["segments"]
+    if not segments:
+        return None, 0
+    chosen = segments[0]
+    for segment in segments:
+        if segment["start"] <= seconds:
+            chosen = segment
+        else:
+            break
+    frame = int((seconds - chosen["start"]) * chosen["fps"])
+    frame = min(max(frame, 0), max(chosen["frames"] - 1, 0))
+    return storage.video_path(chosen["path"]), frame
+
+
+# ----------------------------------------------------
+# DẢI ẢNH XEM TRƯỚC
+# ----------------------------------------------------
+
+def _grab_frames(seek_index, times):
+    """Đọc một khung hình tại mỗi thời điểm, giữ nguyên VideoCapture khi các mốc nằm cùng đoạn."""
+    import cv2
+    frames = []
+    cap, cap_path = None, None
+    try:
+        for seconds in times:
+            path, frame_number = locate(seek_index, seconds)
+            if path is None:
+                break
+            if path != cap_path:
+                if cap is not None:
+                    cap.release()
+                cap, cap_path = cv2.VideoCapture(path), path
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+            ok, frame = cap.read()
+            if ok and frame is not None:
+                frames.append(cv2.resize(frame, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA))
+    finally:
+        if cap is not None:
+            cap.release()
+    return frames
+
+
+def generate(rel_file):
+    """Tạo chỉ mục tua và dải ảnh xem trước cho một video. Trả về True nếu thành công."""
+    import cv2
+    seek_index = build_seek_index(rel_file)
+    duration = seek_index["duration"]
+    times = [duration * (i + 0.5) / THUMBNAIL_COUNT for i in range(THUMBNAIL_COUNT)]
+    frames = _grab_frames(seek_index, times)
+    if not frames:
+        return False
+    seek_index["thumbnail_times"] = times[:len(frames)]
+
+    base = _cache_base(rel_file)
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    tmp_strip = base + ".tmp.jpg"
+    cv2.imwrite(tmp_strip, cv2.hconcat(frames), [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_JPEG_QUALITY])
+    os.replace(tmp_strip, strip_path(rel_file))
+
+    tmp_index = index_path(rel_file) + ".tmp"
+    with open(tmp_index, 'w') as f:
+        json.dump(seek_index, f)
+    os.replace(tmp_index, index_path(rel_file))
+    return True
+
+
+def remove(rel_file):
+    """Xóa ảnh xem trước và chỉ mục tua của một video (khi video bị xóa)."""
+    for path in (strip_path(rel_file), index_path(rel_file)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    if '/' in rel_file:
+        storage.remove_empty_parents(utils.THUMBNAIL_DIR, rel_file.rsplit('/', 1)[0])
+
+
+# ----------------------------------------------------
+# LUỒNG NỀN
+# ----------------------------------------------------
+
+def schedule(app, rel_file, on_done=None):
+    """
+    Đưa một video vào hàng đợi tạo ảnh xem trước (bỏ qua nếu đã có trong hàng đợi).
+    Hàng đợi LIFO: video vừa ghi/vừa cuộn tới được xử lý trước. on_done chạy trên luồng GUI.
+    """
+    global _worker
+    with _pending_lock:
+        if rel_file in _pending or rel_file in _failed:
+            return
+        _pending.add(rel_file)
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_worker_loop, args=(app,), daemon=True)
+            _worker.start()
+    _queue.put((rel_file, on_done))
+
+
+def _worker_loop(app):
+    while app.is_running:
+        try:
+            rel_file, on_done = _queue.get(timeout=1)
+        except queue.Empty:
+            continue
+        ok = False
+        try:
+            ok = os.path.exists(storage.video_path(rel_file)) and generate(rel_file)
+            if ok and on_done and app.is_running:
+                app.after(0, on_done)
+        except Exception as e:
+            log.warning("[THUMBNAIL] Không thể tạo ảnh xem trước cho %s: %s", rel_file, e)
+        finally:
+            if not ok:
+                with _pending_lock:
+                    _failed.add(rel_file)
+            with _pending_lock:
+                _pending.discard(rel_file)
+        time.sleep(_WORKER_PAUSE_SECONDS)
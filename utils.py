@@ -3,12 +3,18 @@
 import os
 import customtkinter as ctk
 import subprocess
+import shutil
 import sys
 import time
+import threading
 import json
+import logging
+from collections import OrderedDict
 from datetime import datetime, timedelta
-import cv2 # Giữ lại cv2 để dùng cho resize_frame
 import re
+from . import video_index, video_catalog, storage, metadata_journal, thumbnails, search_index, qr_parser
+
+log = logging.getLogger(__name__)
 
 # Số ngày giữ lại file tối đa
 DAYS_TO_KEEP = 30
@@ -17,6 +23,23 @@ OUTPUT_DIR = os.path.join(os.getcwd(), 'Video')
 METADATA_DIR = os.path.join(os.getcwd(), 'Metadata')
 AUDIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "audio_files")
 CAMERA_SETTINGS_FILE = os.path.join(os.getcwd(), 'camera_settings.json')
+# Chỉ mục SQLite của video/metadata (đặt ngoài Metadata/ để không bị dọn dẹp theo ngày)
+VIDEO_INDEX_FILE = os.path.join(os.getcwd(), 'video_index.db')
+# Ảnh xem trước và chỉ mục tua của từng video (cùng bố cục phân vùng với Video/)
+THUMBNAIL_DIR = os.path.join(os.getcwd(), 'Thumbnails')
+# Luật nhận dạng mã vận đơn từ QR (nếu có, thay cho QR_CODE_PARSERS bên dưới)
+QR_RULES_FILE = os.path.join(os.getcwd(), 'qr_rules.json')
+
+# Thư mục chứa các bản ghi đang quay dở (đoạn video + metadata tiến trình).
+# Chỉ những đơn chưa hoàn tất mới nằm ở đây, nên việc khôi phục khi khởi động rất nhanh.
+RECORDING_DIR = os.path.join(OUTPUT_DIR, '.recording')
+RECORDING_METADATA_DIR = os.path.join(METADATA_DIR, '.recording')
+
+# Đuôi file được coi là video trong danh sách tra cứu
+# (.m3u là playlist ghép các đoạn của một đơn ghi ở chế độ SEGMENTED)
+PLAYLIST_EXTENSION = '.m3u'
+PARTS_DIR_SUFFIX = '.parts'
+VIDEO_EXTENSIONS = ('.avi', '.mp4', '.mov', '.mkv', PLAYLIST_EXTENSION)
 
 # Kích thước frame camera
 FRAME_WIDTH = 640
@@ -48,6 +71,20 @@ COLOR_GRAY_ACCENT = "#A9A9A9"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(METADATA_DIR, exist_ok=True)
 
+def video_exists(order_id):
+    """
+    Kiểm tra đơn hàng đã có video (đã hoàn tất hoặc đang ghi dở) hay chưa.
+    Tra tập mã đơn trong bộ nhớ (video_catalog.known_orders) nên không đọc ổ đĩa,
+    áp dụng cho mọi đuôi file và mọi thư mục phân vùng.
+    Trong lúc danh mục thư mục chưa quét xong lần đầu (ngay sau khi khởi động, camera đã chạy),
+    tập này có thể thiếu: tra thêm chỉ mục và ổ đĩa để không ghi đè video đã có.
+    """
+    if order_id in video_catalog.known_orders:
+        return True
+    if not video_catalog.known_orders.ready.is_set():
+        return video_index.get_index().get(order_id) is not None or storage.video_on_disk(order_id)
+    return False
+
 # ----------------------------------------------------
 # A0. QUẢN LÝ CẤU HÌNH CAMERA (MỚI)
 # ----------------------------------------------------
@@ -77,7 +114,7 @@ def load_camera_settings():
                     settings[key] = value
             return settings
     except Exception as e:
-        print(f"[CONFIG ERROR] Lỗi đọc file cấu hình camera: {e}")
+        log.error("[CONFIG ERROR] Lỗi đọc file cấu hình camera: %s", e)
         return default_settings
 
 def save_camera_settings(settings):
@@ -99,12 +136,64 @@ def open_file_or_dir(path):
         else:
             subprocess.Popen(["xdg-open", path])
     except Exception as e:
-        print(f"Lỗi khi mở đường dẫn {path}: {e}")
+        log.error("Lỗi khi mở đường dẫn %s: %s", path, e)
 
 def resize_frame(frame, width, height):
     """Resizes a frame to a specific width and height."""
+    import cv2  # nạp khi cần: cửa sổ đăng nhập dùng utils nhưng không cần OpenCV
     return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
 
+# ----------------------------------------------------
+# B0. TÁC VỤ NỀN CHO TAB TRA CỨU
+# ----------------------------------------------------
+# Mọi truy vấn chỉ mục/quét thư mục của tab Tra cứu chạy ở luồng nền để không làm đứng
+# luồng Tk (và preview camera) khi ổ lưu trữ chậm (ví dụ ổ mạng NAS).
+# Chỉ một tác vụ được coi là "hiện hành": tác vụ mới sẽ hủy tác vụ cũ.
+
+_listing_job_lock = threading.Lock()
+_listing_job_cancel = None
+
+def run_listing_job(app_instance, work):
+    """
+    Chạy work(cancel_event, post) ở luồng nền và hủy tác vụ trước đó (nếu còn chạy).
+    post(fn, *args) đưa fn về luồng GUI; kết quả của tác vụ đã bị hủy sẽ bị bỏ qua.
+    """
+    global _listing_job_cancel
+    cancel_event = threading.Event()
+    with _listing_job_lock:
+        if _listing_job_cancel is not None:
+            _listing_job_cancel.set()
+        _listing_job_cancel = cancel_event
+
+    def post(fn, *args):
+        if cancel_event.is_set():
+            return
+        def _run_if_current():
+            if not cancel_event.is_set():
+                fn(*args)
+        app_instance.after(0, _run_if_current)
+
+    def _run():
+        try:
+            work(cancel_event, post)
+        except Exception as e:
+            log.error("[TRA CỨU] Lỗi tác vụ nền: %s", e)
+            post(_show_list_error, app_instance, e)
+
+    threading.Thread(target=_run, daemon=True).start()
+    return cancel_event
+
+def fetch_index_page(offset, limit, order_by="file_mtime", descending=True):
+    """Lấy một trang video từ chỉ mục, đã sắp xếp theo cột yêu cầu."""
+    return video_index.get_index().query(order_by=order_by, descending=descending, limit=limit, offset=offset)
+
+def _show_list_error(app_instance, error):
+    if hasattr(app_instance, 'video_list'):
+        app_instance.video_list.show_message(f"[LỖI HỆ THỐNG] Không thể đọc danh sách video: {error}",
+                                             COLOR_RED_EXIT)
+    else:
+        log.error("Lỗi khi hiển thị danh sách file: %s", error)
+
 # ----------------------------------------------------
 # B. HÀM TRA CỨU VIDEO (CẬP NHẬT)
 # ----------------------------------------------------
@@ -112,6 +201,7 @@ def resize_frame(frame, width, height):
 def search_video(app_instance, create_buttons_func):
     """Tìm kiếm file video theo Mã Đơn Hàng và kiểm tra trạng thái ghi hình."""
     order_id = app_instance.search_entry.get().strip()
+    app_instance.last_search_query = order_id
     
     if not order_id:
         app_instance.result_label.configure(
@@ -122,17 +212,24 @@ def search_video(app_instance, create_buttons_func):
         display_file_list(app_instance, create_buttons_func)
         return
 
-    found_file = None
-    
-    # 1. Quét thư mục để tìm file khớp
-    for f in os.listdir(OUTPUT_DIR):
-        file_path = os.path.join(OUTPUT_DIR, f)
-        if os.path.isfile(file_path) and f.startswith(order_id) and f.lower().endswith(('.avi', '.mp4', '.mov', '.mkv')):
-             found_file = f
-             break
+    app_instance.result_label.configure(text=f"Đang tìm '{order_id}'...", text_color="#666")
 
+    def work(cancel_event, post):
+        # Tìm trên chỉ mục trong bộ nhớ (tiền tố, hậu tố, chuỗi con), đã xếp hạng
+        order_ids = search_index.search(order_id)
+        # Chỉ mở ngay khi kết quả rõ ràng: trùng khớp mã đơn hoặc chỉ có một video
+        found_file = None
+        if order_ids and (len(order_ids) == 1 or search_index.is_exact_match(order_id, order_ids[0])):
+            row = video_index.get_index().get(order_ids[0])
+            found_file = row["file_name"] if row else None
+        post(_show_search_result, app_instance, order_id, found_file, order_ids, create_buttons_func)
+
+    run_listing_job(app_instance, work)
+
+def _show_search_result(app_instance, order_id, found_file, order_ids, create_buttons_func):
+    """Hiển thị kết quả tra cứu (chạy trên luồng GUI)."""
     if found_file:
-        file_path = os.path.join(OUTPUT_DIR, found_file)
+        file_path = storage.video_path(found_file)
         
         # BƯỚC MỚI: KIỂM TRA BẮT BUỘC NẾU FILE ĐANG GHI
         current_recording = getattr(app_instance, 'current_recording_filename', None)
@@ -153,18 +250,94 @@ def search_video(app_instance, create_buttons_func):
                 text_color=COLOR_GREEN_SUCCESS, 
                 font=ctk.CTkFont(family=FONT_FAMILY_SYSTEM, size=FONT_SIZE_SUCCESS, weight="bold")
             )
-            open_file_or_dir(file_path)
+            # Mở trong trình xem nhúng của tab Tra cứu nếu có, nếu không dùng trình phát của hệ điều hành
+            player = getattr(app_instance, 'preview_player', None)
+            if player is not None:
+                player.open(found_file)
+            else:
+                open_file_or_dir(file_path)
+
+    elif order_ids:
+        # Nhiều video khớp: để người dùng chọn trong danh sách bên dưới
+        app_instance.result_label.configure(
+            text=f"Có {len(order_ids)} video khớp với '{order_id}'. Chọn video cần xem trong danh sách bên dưới.", 
+            text_color=COLOR_BLUE_ACTION,
+            font=ctk.CTkFont(family=FONT_FAMILY_SYSTEM, size=FONT_SIZE_NORMAL, weight="normal")
+        )
         
     else:
         # Trường hợp không tìm thấy file
         app_instance.result_label.configure(
-            text=f"[LỖI] Không tìm thấy video nào bắt đầu bằng mã đơn hàng '{order_id}'.\nKiểm tra lại Mã Đơn Hàng.", 
+            text=f"[LỖI] Không tìm thấy video nào khớp với mã đơn hàng '{order_id}'.\nKiểm tra lại Mã Đơn Hàng.", 
             text_color=COLOR_RED_EXIT,
             font=ctk.CTkFont(family=FONT_FAMILY_SYSTEM, size=FONT_SIZE_NORMAL, weight="normal")
         )
-        
-    # Luôn hiển thị danh sách file sau khi tra cứu
-    display_file_list(app_instance, create_buttons_func)
+
+    # Danh sách bên dưới chỉ gồm các video khớp, theo thứ tự xếp hạng
+    create_buttons_func(app_instance, len(order_ids), make_search_page(order_ids))
+
+# Chờ người dùng ngừng gõ bao lâu (ms) rồi mới tìm, để không truy vấn sau mỗi phím
+SEARCH_DEBOUNCE_MS = 250
+
+def schedule_incremental_search(app_instance, create_buttons_func):
+    """Gọi mỗi khi nội dung ô tìm kiếm thay đổi; chỉ tìm khi người dùng đã ngừng gõ SEARCH_DEBOUNCE_MS."""
+    pending = getattr(app_instance, 'search_after_id', None)
+    if pending is not None:
+        app_instance.after_cancel(pending)
+    app_instance.search_after_id = app_instance.after(
+        SEARCH_DEBOUNCE_MS, lambda: incremental_search(app_instance, create_buttons_func)
+    )
+
+def incremental_search(app_instance, create_buttons_func, force=False):
+    """Lọc danh sách video theo nội dung ô tìm kiếm (không mở video). Bỏ qua nếu nội dung không đổi."""
+    app_instance.search_after_id = None
+    query = app_instance.search_entry.get().strip()
+    if not force and query == getattr(app_instance, 'last_search_query', ''):
+        return
+    app_instance.last_search_query = query
+
+    if not query:
+        app_instance.result_label.configure(text="Kết quả sẽ hiển thị ở đây.", text_color="#666")
+        display_file_list(app_instance, create_buttons_func)
+        return
+
+    def work(cancel_event, post):
+        order_ids = search_index.search(query)
+        post(_show_incremental_result, app_instance, query, order_ids, create_buttons_func)
+
+    run_listing_job(app_instance, work)
+
+def _show_incremental_result(app_instance, query, order_ids, create_buttons_func):
+    if order_ids:
+        text, color = f"Có {len(order_ids)} video khớp với '{query}'.", "#666"
+    else:
+        text, color = f"Không có video nào khớp với '{query}'.", COLOR_ORANGE_ACCENT
+    app_instance.result_label.configure(
+        text=text, text_color=color,
+        font=ctk.CTkFont(family=FONT_FAMILY_SYSTEM, size=FONT_SIZE_NORMAL, weight="normal")
+    )
+    create_buttons_func(app_instance, len(order_ids), make_search_page(order_ids))
+
+def make_search_page(order_ids):
+    """
+    Nguồn dữ liệu phân trang cho kết quả tìm kiếm. Sắp xếp mặc định (file_mtime) giữ thứ tự xếp hạng;
+    khi người dùng bấm sắp xếp theo cột khác, kết quả (tối đa search_index.MAX_RESULTS) được sắp lại.
+    """
+    def fetch_page(offset, limit, order_by="file_mtime", descending=True):
+        index = video_index.get_index()
+        if order_by == "file_mtime":
+            return index.get_many(order_ids[offset:offset + limit])
+        rows = index.get_many(order_ids)
+        rows.sort(key=lambda row: (row.get(order_by) is not None, row.get(order_by)), reverse=descending)
+        return rows[offset:offset + limit]
+    return fetch_page
+
+def refresh_current_list(app_instance, create_buttons_func):
+    """Vẽ lại danh sách đang xem: kết quả tìm kiếm nếu ô tìm kiếm có nội dung, nếu không là toàn bộ video."""
+    if getattr(app_instance, 'last_search_query', ''):
+        incremental_search(app_instance, create_buttons_func, force=True)
+    else:
+        display_file_list(app_instance, create_buttons_func)
 
 # ----------------------------------------------------
 # C. HÀM HIỂN THỊ DANH SÁCH FILE (MỚI)
@@ -172,46 +345,40 @@ def search_video(app_instance, create_buttons_func):
 
 def display_file_list(app_instance, create_buttons_func):
     """
-    Lấy danh sách file đang tồn tại, sắp xếp theo thời gian sửa đổi, 
-    và truyền cho hàm tạo nút trong GUI.
+    Hiển thị danh sách video dạng phân trang trên chỉ mục.
+    Đếm tổng số video ở luồng nền; GUI chỉ truy vấn những dòng đang hiển thị (LIMIT/OFFSET)
+    nên mở tab luôn nhanh, bất kể kho video lớn đến đâu.
     """
-    try:
-        # Lấy danh sách tất cả các file .avi đang tồn tại
-        files = []
-        for f in os.listdir(OUTPUT_DIR):
-            file_path = os.path.join(OUTPUT_DIR, f)
-            
-            # Lọc: chỉ giữ file VÀ phải tồn tại và là video
-            if os.path.isfile(file_path) and f.lower().endswith(('.avi', '.mp4', '.mov', '.mkv')): 
-                files.append((f, os.path.getmtime(file_path)))
-        
-        # Sắp xếp giảm dần theo thời gian (mới nhất lên đầu)
-        files.sort(key=lambda x: x[1], reverse=True)
-        
-        file_list = [f[0] for f in files]
-        
-        # KHÔNG GIỚI HẠN SỐ LƯỢNG FILE NỮA (Sử dụng Scrollbar của Frame)
-        display_files = file_list 
+    def work(cancel_event, post):
+        total = video_index.get_index().count()
+        post(create_buttons_func, app_instance, total, fetch_index_page)
 
-        # GỌI HÀM TẠO NÚT TỪ GUI
-        create_buttons_func(app_instance, display_files)
+    run_listing_job(app_instance, work)
 
-    except Exception as e:
-        # Xử lý lỗi nếu không thể đọc thư mục
-        if hasattr(app_instance, 'list_container_frame'):
-            error_message = f"[LỖI HỆ THỐNG] Không thể đọc thư mục: {e}"
-            # Xóa các widget cũ
-            for widget in app_instance.list_container_frame.winfo_children():
-                widget.destroy()
-            ctk.CTkLabel(app_instance.list_container_frame, text=error_message, 
-                         text_color=COLOR_RED_EXIT).pack(padx=10, pady=10)
-        else:
-            print(f"Lỗi khi hiển thị danh sách file: {e}")
+def refresh_file_list(app_instance, create_buttons_func):
+    """
+    Quét lại Video/ và Metadata/ ở luồng nền để cập nhật chỉ mục.
+    Danh sách trên giao diện được cập nhật dần sau mỗi lô; tác vụ bị hủy nếu người dùng tìm kiếm mới.
+    """
+    def work(cancel_event, post):
+        index = video_index.get_index()
+
+        def on_chunk(processed):
+            post(create_buttons_func, app_instance, index.count(), fetch_index_page)
+
+        result = index.sync_with_disk(on_chunk=on_chunk, cancel_event=cancel_event)
+        if result is None:
+            return
+        added, removed = result
+        log.info("[INDEX] Đồng bộ xong: cập nhật %d, xóa %d mục.", added, removed)
+        post(create_buttons_func, app_instance, index.count(), fetch_index_page)
+
+    return run_listing_job(app_instance, work)
 
 def delete_video(app_instance, file_name, create_buttons_func):
     """Xóa file video và file metadata tương ứng, sau đó cập nhật danh sách."""
     
-    video_file_path = os.path.join(OUTPUT_DIR, file_name)
+    video_file_path = storage.video_path(file_name)
     video_deleted = False
     
     # BƯỚC 1: Xóa file video
@@ -219,7 +386,11 @@ def delete_video(app_instance, file_name, create_buttons_func):
         if os.path.exists(video_file_path):
             os.remove(video_file_path)
             video_deleted = True
-            print(f"Đã xóa file video: {video_file_path}")
+            log.info("Đã xóa file video: %s", video_file_path)
+            # Playlist (.m3u) đi kèm thư mục chứa các đoạn video
+            parts_dir = storage.parts_dir_path(file_name)
+            if os.path.isdir(parts_dir):
+                shutil.rmtree(parts_dir, ignore_errors=True)
         else:
             app_instance.result_label.configure(
                 text=f"[CẢNH BÁO] Không tìm thấy file: {file_name} để xóa.", 
@@ -230,22 +401,25 @@ def delete_video(app_instance, file_name, create_buttons_func):
             text=f"[LỖI] Không thể xóa video {file_name}: {e}", 
             text_color=COLOR_RED_EXIT
         )
-        print(f"Lỗi khi xóa file video: {e}")
+        log.error("Lỗi khi xóa file video: %s", e)
         # Dừng lại nếu không xóa được video
-        display_file_list(app_instance, create_buttons_func)
+        refresh_current_list(app_instance, create_buttons_func)
         return
 
     # BƯỚC 2: Nếu xóa video thành công, tiến hành xóa file metadata
     if video_deleted:
         try:
-            # Lấy tên file không có đuôi (ví dụ: 'SPX123' từ 'SPX123.mp4')
-            base_name = os.path.splitext(file_name)[0]
-            metadata_file_name = f"{base_name}.json"
-            metadata_file_path = os.path.join(METADATA_DIR, metadata_file_name)
+            # Lấy mã đơn (ví dụ: 'SPX123' từ '2025/12/11/Webcam/SPX123.mp4')
+            base_name = storage.order_id_of(file_name)
+            metadata_file_path = storage.metadata_path(file_name)
             
-            if os.path.exists(metadata_file_path):
-                os.remove(metadata_file_path)
-                print(f"Đã xóa file metadata: {metadata_file_path}")
+            # Metadata trong nhật ký ngày được giữ nguyên (chỉ ghi nối thêm) và hết hạn cùng thư mục ngày;
+            # chỉ xóa file JSON riêng nếu có (kho cũ hoặc đã xuất)
+            has_journal_entry = bool(metadata_journal.lookup(file_name)[0])
+            if os.path.exists(metadata_file_path) or has_journal_entry:
+                if os.path.exists(metadata_file_path):
+                    os.remove(metadata_file_path)
+                    log.info("Đã xóa file metadata: %s", metadata_file_path)
                 # Cập nhật thông báo thành công cho cả 2 file
                 app_instance.result_label.configure(
                     text=f"Đã xóa video: {base_name} thành công.", 
@@ -266,22 +440,63 @@ def delete_video(app_instance, file_name, create_buttons_func):
                 text=f"[LỖI] Đã xóa video, nhưng không thể xóa metadata: {e}", 
                 text_color=COLOR_RED_EXIT
             )
-            print(f"Lỗi khi xóa file metadata: {e}")
+            log.error("Lỗi khi xóa file metadata: %s", e)
+
+    if video_deleted:
+        thumbnails.remove(file_name)
+        invalidate_metadata_cache(storage.order_id_of(file_name))
+        video_index.get_index().remove(storage.order_id_of(file_name))
+        video_catalog.known_orders.discard(storage.order_id_of(file_name))
 
     # BƯỚC 3: Cập nhật lại danh sách file trên giao diện
-    display_file_list(app_instance, create_buttons_func)
+    refresh_current_list(app_instance, create_buttons_func)
+
+
+# Bộ nhớ đệm LRU cho metadata đã định dạng: {order_id: (chữ ký, dữ liệu hiển thị)}.
+# Chữ ký gồm đường dẫn và mtime của video/metadata, nên file thay đổi sẽ tự động được đọc lại.
+METADATA_CACHE_SIZE = 4096
+_metadata_cache = OrderedDict()
+_metadata_cache_lock = threading.Lock()
+
+def _cached_metadata(order_id, signature, load):
+    """Trả về metadata đã định dạng từ bộ nhớ đệm, hoặc gọi load() rồi định dạng nếu chữ ký đã đổi."""
+    with _metadata_cache_lock:
+        entry = _metadata_cache.get(order_id)
+        if entry is not None and entry[0] == signature:
+            _metadata_cache.move_to_end(order_id)
+            return entry[1]
+    formatted = format_video_metadata(load())
+    with _metadata_cache_lock:
+        _metadata_cache[order_id] = (signature, formatted)
+        _metadata_cache.move_to_end(order_id)
+        while len(_metadata_cache) > METADATA_CACHE_SIZE:
+            _metadata_cache.popitem(last=False)
+    return formatted
+
+def invalidate_metadata_cache(order_id=None):
+    """Xóa một đơn (hoặc toàn bộ nếu order_id là None) khỏi bộ nhớ đệm metadata."""
+    with _metadata_cache_lock:
+        if order_id is None:
+            _metadata_cache.clear()
+        else:
+            _metadata_cache.pop(order_id, None)
 
+def format_index_record(record):
+    """Metadata hiển thị cho một dòng của chỉ mục (dùng bộ nhớ đệm, không đọc ổ đĩa)."""
+    signature = (record["file_name"], record.get("file_mtime"), record.get("metadata_mtime"))
+    return _cached_metadata(record["order_id"], signature, lambda: record)
 
 def get_video_metadata(file_name):
     """
     Đọc file metadata (.json) tương ứng để lấy thông tin chi tiết về video
     và chuyển đổi định dạng thời gian sang chuỗi hiển thị.
+    Kết quả được giữ trong bộ nhớ đệm theo mtime nên vẽ lại danh sách không đọc lại file.
     """
     
     # 1. Xác định đường dẫn file metadata
-    # Lấy tên file không có đuôi (Ví dụ: SPXVN05353157345C)
-    base_name = os.path.splitext(file_name)[0]
-    metadata_file_path = os.path.join(METADATA_DIR, f"{base_name}.json")
+    # Lấy mã đơn (Ví dụ: SPXVN05353157345C); metadata nằm cùng thư mục phân vùng với video
+    base_name = storage.order_id_of(file_name)
+    metadata_file_path = storage.metadata_path(file_name)
     
     # Dữ liệu mặc định nếu không tìm thấy file
     default_data = {
@@ -290,18 +505,46 @@ def get_video_metadata(file_name):
         "duration": "00:00:00"
     }
 
-    if not os.path.exists(metadata_file_path):
+    try:
+        # 2. Lấy metadata từ chỉ mục (không cần mở file); nếu video chưa có trong chỉ mục thì đọc
+        # nhật ký ngày, cuối cùng mới tới file JSON riêng của kho cũ
+        record = video_index.get_index().get(base_name)
+        if record is not None:
+            return format_index_record(record)
+
+        metadata, journal_position = metadata_journal.lookup(file_name)
+        if metadata:
+            return _cached_metadata(base_name, (file_name, "journal", journal_position), lambda: metadata)
+
+        if not os.path.exists(metadata_file_path):
+            return default_data
+
+        def _load_json():
+            with open(metadata_file_path, 'r') as f:
+                return json.load(f)
+        return _cached_metadata(base_name, (file_name, os.path.getmtime(metadata_file_path)), _load_json)
+
+    except Exception as e:
+        log.error("[LỖI] Không thể đọc/xử lý metadata từ file JSON: %s. Lỗi: %s", metadata_file_path, e)
         return default_data
 
-    try:
-        # 2. Đọc file JSON
-        with open(metadata_file_path, 'r') as f:
-            metadata = json.load(f)
 
+def format_video_metadata(metadata):
+    """
+    Chuyển metadata thô (từ file JSON hoặc một dòng của chỉ mục) sang chuỗi hiển thị
+    cho bảng danh sách video.
+    """
+    default_data = {
+        "start_time": "N/A",
+        "end_time": "N/A",
+        "duration": "00:00:00"
+    }
+
+    try:
         # 3. Chuyển đổi thời gian từ chuỗi ISO sang đối tượng datetime
         start_time_iso = metadata.get("start_time")
         end_time_iso = metadata.get("end_time")
-        duration_sec = metadata.get("duration_seconds", 0)
+        duration_sec = metadata.get("duration_seconds") or 0
         
         # Kiểm tra dữ liệu thời gian có hợp lệ không
         # if not start_time_iso or not end_time_iso:
@@ -315,11 +558,8 @@ def get_video_metadata(file_name):
              start_dt = datetime.fromisoformat(start_time_iso)
              end_dt = datetime.fromisoformat(end_time_iso)
         except ValueError:
-             print(f"[LỖI FORMAT] Chuỗi thời gian không phải ISO 8601: {start_time_iso} hoặc {end_time_iso}")
+             log.warning("[LỖI FORMAT] Chuỗi thời gian không phải ISO 8601: %s hoặc %s", start_time_iso, end_time_iso)
              return default_data
-
-        start_dt = datetime.fromisoformat(start_time_iso)
-        end_dt = datetime.fromisoformat(end_time_iso)
         
         # 4. Định dạng lại chuỗi thời gian cho giao diện (HH:MM:SS dd/mm/YYYY)
         start_formatted = start_dt.strftime("%H:%M:%S %d/%m/%Y")
@@ -346,7 +586,7 @@ def get_video_metadata(file_name):
         }
 
     except Exception as e:
-        print(f"[LỖI] Không thể đọc/xử lý metadata từ file JSON: {metadata_file_path}. Lỗi: {e}")
+        log.error("[LỖI] Không thể xử lý metadata: %s. Lỗi: %s", metadata, e)
         return default_data
 
 # ==============================================================================
@@ -356,47 +596,56 @@ def get_video_metadata(file_name):
 # từ các định dạng QR Code khác nhau của các đơn vị vận chuyển.
 #
 # CÁCH THÊM MỘT ĐƠN VỊ VẬN CHUYỂN MỚI:
-# 1. Thêm một dictionary mới vào danh sách `QR_CODE_PARSERS`.
+# 1. Thêm một dictionary mới vào danh sách `QR_CODE_PARSERS`, hoặc (không cần sửa code)
+#    sửa file qr_rules.json - tạo bằng: python -m PackingApp.qr_parser --export-rules
 # 2. 'name': Tên của đơn vị vận chuyển (để nhận biết).
 # 3. 'pattern': Một biểu thức chính quy (regex) để khớp với dữ liệu từ mã QR.
 #    - `^`: Bắt đầu chuỗi.
 #    - `$`: Kết thúc chuỗi.
 #    - `()`: Một "capturing group" để lấy ra chính xác phần mã vận đơn.
 #    - `[A-Z0-9]+`: Một hoặc nhiều ký tự chữ hoa hoặc số.
-# 4. 'extractor': Một hàm lambda để lấy ra mã vận đơn từ kết quả regex.
-#    - `m.group(1)`: Lấy nội dung của capturing group đầu tiên.
-#    - `m.group(0)`: Lấy toàn bộ chuỗi khớp với pattern.
+# 4. 'group': Số thứ tự nhóm chứa mã vận đơn.
+#    - `1`: Lấy nội dung của capturing group đầu tiên.
+#    - `0`: Lấy toàn bộ chuỗi khớp với pattern.
+# 5. 'key' (tùy chọn): Từ khóa ngắn để tìm đơn theo đơn vị vận chuyển trong tab Tra cứu ('' = không có).
+# Các luật được thử theo đúng thứ tự trong danh sách; qr_parser ghép tất cả thành một biểu thức.
 
 QR_CODE_PARSERS = [
     {
         'name': 'SPX Express',
-        'pattern': re.compile(r'^(SPX[A-Z0-9]+)$'),
-        'extractor': lambda m: m.group(1)
+        'pattern': r'^(SPX[A-Z0-9]+)$',
+        'group': 1,
+        'key': 'spx'
     },
     {
         'name': 'J&T Express (Mã vận đơn 12 chữ số)',
-        'pattern': re.compile(r'^(\d{12})$'),
-        'extractor': lambda m: m.group(1)
+        'pattern': r'^(\d{12})$',
+        'group': 1,
+        'key': 'j&t'
     },
     {
         'name': 'Giao Hang Nhanh (GHN)',
-        'pattern': re.compile(r'^(SGN|HAN|DAD|TH)[A-Z0-9]+$'),
-        'extractor': lambda m: m.group(0) # Lấy toàn bộ mã
+        'pattern': r'^(SGN|HAN|DAD|TH)[A-Z0-9]+$',
+        'group': 0, # Lấy toàn bộ mã
+        'key': 'ghn'
     },
     {
         'name': 'Viettel Post',
-        'pattern': re.compile(r'^(\d{10,15})$'), # Thường là một chuỗi số dài
-        'extractor': lambda m: m.group(1)
+        'pattern': r'^(\d{10,15})$', # Thường là một chuỗi số dài
+        'group': 1,
+        'key': 'viettelpost'
     },
     {
         'name': 'TikTok Shop (URL)',
-        'pattern': re.compile(r'https://track\.tiktokshop\.com/.*[?&]order_id=([A-Z0-9_]+)'),
-        'extractor': lambda m: m.group(1) # Chỉ lấy giá trị của order_id
+        'pattern': r'https://track\.tiktokshop\.com/.*[?&]order_id=([A-Z0-9_]+)',
+        'group': 1, # Chỉ lấy giá trị của order_id
+        'key': 'tiktok'
     },
     {
         'name': 'Mã vận đơn chung (Alphanumeric, ít nhất 8 ký tự)',
-        'pattern': re.compile(r'^([A-Z0-9]{8,})$'),
-        'extractor': lambda m: m.group(1)
+        'pattern': r'^([A-Z0-9]{8,})$',
+        'group': 1,
+        'key': ''
     }
 ]
 
@@ -411,18 +660,4 @@ def parse_qr_code_data(data):
         str or None: Trả về mã vận đơn đã được làm sạch nếu tìm thấy,
                      nếu không thì trả về None.
     """
-    if not data:
-        return None
-
-    # Lần lượt thử từng "luật" trong bộ phân tích
-    for parser in QR_CODE_PARSERS:
-        match = parser['pattern'].search(data)
-        if match:
-            # Nếu khớp, sử dụng extractor để lấy mã vận đơn
-            order_id = parser['extractor'](match)
-            print(f"[QR PARSER] Đã nhận dạng '{data}' là của '{parser['name']}'. Mã vận đơn: {order_id}")
-            return order_id
-
-    # Nếu không có luật nào khớp
-    print(f"[QR PARSER] Không nhận dạng được định dạng QR: '{data}'")
-    return None
+    return qr_parser.parse(data)[1]
@@ -0,0 +1,305 @@
+# video_catalog.py
+# Danh mục video trong bộ nhớ, được giữ cập nhật bằng cách theo dõi (polling) thư mục
+# Video/ và Metadata/. Chỉ những thay đổi (thêm, xóa, đổi tên, metadata mới) mới được
+# ghi vào chỉ mục và đẩy sang tab Tra cứu, thay vì quét lại toàn bộ mỗi lần làm mới.
+#
+# Dùng polling thay vì inotify/ReadDirectoryChangesW để không cần thêm thư viện ngoài.
+# Với bố cục phân vùng (Video/YYYY/MM/DD/<camera>/), mỗi thư mục được stat() riêng;
+# chỉ thư mục có mtime đổi (có file/thư mục con được tạo/xóa/đổi tên) mới được liệt kê lại.
+# Số thư mục tỉ lệ với số ngày x số camera được giữ lại nên mỗi chu kỳ vẫn rất nhẹ.
+# Nhật ký metadata ngày (journal.jsonl) được ghi nối nên không làm đổi mtime thư mục: mỗi chu kỳ
+# stat() riêng từng nhật ký (một file mỗi ngày) và chỉ đọc phần ghi nối thêm; đơn nào có dòng mới
+# (vị trí dòng đổi) mới được báo là metadata_changed, không phải cả ngày.
+
+import os
+import time
+import logging
+import threading
+from . import utils, video_index, storage, metadata_journal
+
+log = logging.getLogger(__name__)
+
+# Chu kỳ kiểm tra thư mục (giây)
+CATALOG_POLL_SECONDS = 2.0
+
+
+def _dir_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+class _DirectoryTree:
+    """
+    Theo dõi đệ quy một thư mục gốc.
+    dirs: {rel_dir: (mtime, {tên file: (mtime, size)}, {tên thư mục con})}
+    """
+
+    def __init__(self, root, accept):
+        self.root = root
+        self.accept = accept
+        self.dirs = {}
+
+    def _abs(self, rel_dir):
+        return os.path.join(self.root, *rel_dir.split('/')) if rel_dir else self.root
+
+    def _list(self, rel_dir):
+        files, subdirs = {}, set()
+        try:
+            with os.scandir(self._abs(rel_dir)) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        if not storage.is_skipped_dir(entry.name):
+                            subdirs.add(entry.name)
+                    elif entry.is_file() and self.accept(entry.name):
+                        stat = entry.stat()
+                        files[entry.name] = (stat.st_mtime, stat.st_size)
+        except FileNotFoundError:
+            pass
+        return files, subdirs
+
+    def _rescan(self, rel_dir, mtime, added, removed):
+        if mtime is None:
+            self._drop(rel_dir, removed)
+            return
+        _, old_files, old_subdirs = self.dirs.get(rel_dir, (None, {}, set()))
+        # mtime được đọc TRƯỚC khi liệt kê để thay đổi xảy ra trong lúc quét được bắt ở chu kỳ sau
+        files, subdirs = self._list(rel_dir)
+        self.dirs[rel_dir] = (mtime, files, subdirs)
+
+        for name, signature in files.items():
+            if old_files.get(name) != signature:
+                added[storage.join_relative(rel_dir, name)] = signature
+        for name, signature in old_files.items():
+            if name not in files:
+                removed[storage.join_relative(rel_dir, name)] = signature
+        for name in subdirs - old_subdirs:
+            child = storage.join_relative(rel_dir, name)
+            self._rescan(child, _dir_mtime(self._abs(child)), added, removed)
+        for name in old_subdirs - subdirs:
+            self._drop(storage.join_relative(rel_dir, name), removed)
+
+    def _drop(self, rel_dir, removed):
+        entry = self.dirs.pop(rel_dir, None)
+        if entry is None:
+            return
+        _, files, subdirs = entry
+        for name, signature in files.items():
+            removed[storage.join_relative(rel_dir, name)] = signature
+        for name in subdirs:
+            self._drop(storage.join_relative(rel_dir, name), removed)
+
+    def load(self):
+        """Quét toàn bộ cây, trả về {rel_file: (mtime, size)}."""
+        self.dirs = {}
+        added = {}
+        self._rescan('', _dir_mtime(self.root), added, {})
+        return added
+
+    def poll(self):
+        """Trả về (added, removed) dạng {rel_file: (mtime, size)} kể từ lần trước."""
+        added, removed = {}, {}
+        if not self.dirs:
+            self._rescan('', _dir_mtime(self.root), added, removed)
+            return added, removed
+        for rel_dir in list(self.dirs):
+            entry = self.dirs.get(rel_dir)
+            if entry is None:
+                continue  # Đã bị xóa cùng thư mục cha trong vòng lặp này
+            mtime = _dir_mtime(self._abs(rel_dir))
+            if mtime != entry[0]:
+                self._rescan(rel_dir, mtime, added, removed)
+        return added, removed
+
+
+class VideoCatalog:
+    """
+    Ảnh chụp trong bộ nhớ của Video/ và Metadata/ (kể cả các thư mục phân vùng).
+    poll() trả về các thay đổi kể từ lần trước dưới dạng dict:
+        {"added": [file_name], "removed": [order_id], "renamed": [(old_order_id, new_file_name)],
+         "metadata_changed": [order_id]}
+    file_name là đường dẫn tương đối so với Video/.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.videos = {}
+        self.video_tree = _DirectoryTree(utils.OUTPUT_DIR, lambda name: name.lower().endswith(utils.VIDEO_EXTENSIONS))
+        self.metadata_tree = _DirectoryTree(utils.METADATA_DIR, lambda name: name.endswith(('.json', '.jsonl')))
+        # {rel_file nhật ký: (chữ ký metadata_journal.signature, {order_id: vị trí dòng})} ở lần đọc trước
+        self.journals = {}
+
+    def _journal_changes(self, rel_file):
+        """Các đơn có dòng mới trong nhật ký rel_file kể từ lần đọc trước."""
+        path = os.path.join(utils.METADATA_DIR, *rel_file.split('/'))
+        old_signature, old_positions = self.journals.get(rel_file, (None, {}))
+        current = metadata_journal.signature(path)
+        if current is None:
+            self.journals.pop(rel_file, None)
+            return set()
+        if current == old_signature:
+            return set()
+        positions = {order_id: position for order_id, (position, _) in metadata_journal.read_journal(path).items()}
+        self.journals[rel_file] = (current, positions)
+        return {order_id for order_id, position in positions.items() if old_positions.get(order_id) != position}
+
+    def load(self):
+        """Chụp trạng thái ban đầu (gọi một lần khi khởi động)."""
+        files = self.video_tree.load()
+        for rel_file in self.metadata_tree.load():
+            if rel_file.endswith('.jsonl'):
+                self._journal_changes(rel_file)
+        videos = {storage.order_id_of(f): (f, mtime, size) for f, (mtime, size) in files.items()}
+        with self.lock:
+            self.videos = videos
+
+    def order_ids(self):
+        with self.lock:
+            return set(self.videos)
+
+    def poll(self):
+        diff = {"added": [], "removed": [], "renamed": [], "metadata_changed": []}
+
+        added_files, removed_files = self.video_tree.poll()
+        if added_files or removed_files:
+            added = {storage.order_id_of(f): (f, *sig) for f, sig in added_files.items()}
+            removed = {storage.order_id_of(f): (f, *sig) for f, sig in removed_files.items()}
+            # Đổi tên/di chuyển: file biến mất và file mới xuất hiện có cùng mtime + kích thước
+            by_signature = {(v[1], v[2]): o for o, v in removed.items()}
+            for order_id, (file_name, mtime, size) in list(added.items()):
+                old_order_id = by_signature.pop((mtime, size), None)
+                if old_order_id is not None:
+                    diff["renamed"].append((old_order_id, file_name))
+                    del added[order_id]
+                    del removed[old_order_id]
+
+            with self.lock:
+                for order_id in removed:
+                    self.videos.pop(order_id, None)
+                for old_order_id, file_name in diff["renamed"]:
+                    self.videos.pop(old_order_id, None)
+                    self.videos[storage.order_id_of(file_name)] = (file_name, *added_files[file_name])
+                self.videos.update(added)
+
+            diff["added"] = [v[0] for v in added.values()]
+            diff["removed"] = list(removed)
+
+        changed_metadata, removed_metadata = self.metadata_tree.poll()
+        for rel_file in removed_metadata:
+            self.journals.pop(rel_file, None)
+        changed_orders = {storage.order_id_of(f) for f in changed_metadata if not f.endswith('.jsonl')}
+        for rel_file in set(self.journals) | {f for f in changed_metadata if f.endswith('.jsonl')}:
+            changed_orders |= self._journal_changes(rel_file)
+        if changed_orders:
+            with self.lock:
+                known_videos = set(self.videos)
+            already_handled = {storage.order_id_of(f) for f in diff["added"]}
+            diff["metadata_changed"] = sorted((changed_orders & known_videos) - already_handled)
+        return diff
+
+
+class KnownOrders:
+    """
+    Tập mã đơn đã có video (kể cả đang ghi) trong bộ nhớ, để kiểm tra trùng đơn khi quét
+    trong O(1), không chạm ổ đĩa. Nạp từ chỉ mục khi khởi động, bổ sung từ danh mục thư mục,
+    cập nhật khi bắt đầu ghi, khi xóa video và theo mỗi thay đổi mà CatalogWatcher phát hiện.
+    Mã đơn không phụ thuộc đuôi file hay thư mục phân vùng nên mọi định dạng đều được tính.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.order_ids = set()
+        # Được set khi danh mục thư mục đã quét xong lần đầu; trước đó tập này có thể thiếu
+        # (chỉ mục rỗng ở lần chạy đầu sau khi nâng cấp, hoặc chưa đồng bộ với ổ đĩa)
+        self.ready = threading.Event()
+
+    def load(self, order_ids):
+        order_ids = set(order_ids)
+        with self.lock:
+            self.order_ids = order_ids
+
+    def update(self, order_ids):
+        with self.lock:
+            self.order_ids.update(order_ids)
+
+    def add(self, order_id):
+        with self.lock:
+            self.order_ids.add(order_id)
+
+    def discard(self, order_id):
+        with self.lock:
+            self.order_ids.discard(order_id)
+
+    def __contains__(self, order_id):
+        return order_id in self.order_ids
+
+    def __len__(self):
+        return len(self.order_ids)
+
+    def apply_diff(self, diff):
+        with self.lock:
+            for order_id in diff["removed"]:
+                self.order_ids.discard(order_id)
+            for old_order_id, file_name in diff["renamed"]:
+                self.order_ids.discard(old_order_id)
+                self.order_ids.add(storage.order_id_of(file_name))
+            for file_name in diff["added"]:
+                self.order_ids.add(storage.order_id_of(file_name))
+
+
+# Dùng chung cho toàn ứng dụng (utils.video_exists)
+known_orders = KnownOrders()
+
+
+def has_changes(diff):
+    return any(diff.values())
+
+
+def apply_to_index(diff):
+    """Ghi các thay đổi vào chỉ mục SQLite (chi phí tỉ lệ với số thay đổi)."""
+    index = video_index.get_index()
+    removed = list(diff["removed"]) + [old for old, _ in diff["renamed"]]
+    if removed:
+        index.remove_many(removed)
+    file_names = list(diff["added"]) + [new for _, new in diff["renamed"]]
+    if diff["metadata_changed"]:
+        rows = [index.get(order_id) for order_id in diff["metadata_changed"]]
+        file_names.extend(row["file_name"] for row in rows if row)
+    if file_names:
+        index.refresh_files(file_names)
+
+
+class CatalogWatcher:
+    """Luồng nền theo dõi thư mục và gọi on_change(diff) khi có thay đổi."""
+
+    def __init__(self, app, on_change=None, poll_seconds=CATALOG_POLL_SECONDS):
+        self.app = app
+        self.on_change = on_change
+        self.poll_seconds = poll_seconds
+        self.catalog = VideoCatalog()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            self.catalog.load()
+            known_orders.update(self.catalog.order_ids())
+            known_orders.ready.set()
+        except Exception as e:
+            log.error("[CATALOG] Không thể quét thư mục ban đầu: %s", e)
+        while self.app.is_running:
+            time.sleep(self.poll_seconds)
+            try:
+                diff = self.catalog.poll()
+                if not has_changes(diff):
+                    continue
+                apply_to_index(diff)
+                known_orders.apply_diff(diff)
+                if self.on_change:
+                    self.on_change(diff)
+            except Exception as e:
+                log.warning("[CATALOG] Lỗi khi theo dõi thư mục: %s", e)
@@ -0,0 +1,368 @@
+# video_index.py
+# Chỉ mục SQLite (chế độ WAL) cho video và metadata, dùng cho tra cứu nhanh.
+#
+# - Cập nhật ngay khi một bản ghi kết thúc (_stop_recording_for_camera) hoặc bị xóa.
+# - Khi khởi động, đồng bộ tăng dần với thư mục Video/ và Metadata/:
+#   metadata đọc từ nhật ký ngày (metadata_journal), mỗi ngày một file; chỉ những dòng
+#   mới hoặc đã thay đổi (so sánh mtime/size) mới được ghi lại.
+# - metadata_mtime: mtime của file JSON riêng (kho cũ), hoặc vị trí dòng của đơn trong nhật ký ngày -
+#   ghi nối đơn khác vào nhật ký không làm các dòng cũ của ngày đó bị coi là đã thay đổi.
+# - Tra cứu theo tiền tố mã đơn, khoảng thời gian và camera mà không cần listdir.
+# - file_name là đường dẫn tương đối so với Video/ (xem storage.py), ví dụ "2025/12/11/Webcam/SPX123.avi".
+
+import os
+import json
+import logging
+import sqlite3
+import threading
+from . import utils, storage, metadata_journal
+
+log = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    order_id TEXT PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    camera_name TEXT,
+    camera_id TEXT,
+    start_time TEXT,
+    end_time TEXT,
+    duration_seconds REAL,
+    file_mtime REAL,
+    file_size INTEGER,
+    metadata_mtime REAL,
+    disk_size INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_videos_file_mtime ON videos(file_mtime);
+CREATE INDEX IF NOT EXISTS idx_videos_start_time ON videos(start_time);
+CREATE INDEX IF NOT EXISTS idx_videos_camera ON videos(camera_name);
+CREATE INDEX IF NOT EXISTS idx_videos_file_name ON videos(file_name);
+"""
+
+_COLUMNS = ("order_id", "file_name", "camera_name", "camera_id", "start_time", "end_time",
+            "duration_seconds", "file_mtime", "file_size", "metadata_mtime", "disk_size")
+
+# Số dòng ghi vào chỉ mục mỗi lô khi đồng bộ với ổ đĩa
+SYNC_CHUNK_SIZE = 500
+
+# Các cột cho phép sắp xếp (tránh ghép chuỗi SQL tùy ý)
+SORTABLE_COLUMNS = ("file_mtime", "start_time", "order_id", "duration_seconds", "camera_name")
+
+
+def _order_id_from_file_name(file_name):
+    return storage.order_id_of(file_name)
+
+
+def _read_metadata_file(file_name):
+    """
+    Đọc metadata đi kèm video file_name: ưu tiên nhật ký ngày, sau đó file <order>.json riêng
+    (kho cũ hoặc bố cục phẳng). Trả về (metadata, vị trí dòng trong nhật ký hoặc mtime file JSON)
+    hoặc ({}, None).
+    """
+    metadata, mtime = metadata_journal.lookup(file_name)
+    if metadata:
+        return metadata, mtime
+    metadata_path = storage.metadata_path(file_name)
+    try:
+        mtime = os.path.getmtime(metadata_path)
+        with open(metadata_path, 'r') as f:
+            return json.load(f), mtime
+    except FileNotFoundError:
+        return {}, None
+    except Exception as e:
+        log.warning("[INDEX] Không thể đọc metadata %s: %s", metadata_path, e)
+        return {}, None
+
+
+class VideoIndex:
+    """Bảng videos trong SQLite. Dùng chung một kết nối cho mọi luồng, bảo vệ bằng lock."""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or utils.VIDEO_INDEX_FILE
+        self.lock = threading.Lock()
+        self.is_synced = False
+        # Tăng sau mỗi lần ghi: bộ nhớ đệm dựng từ chỉ mục (search_index) so sánh để biết cần dựng lại
+        self.generation = 0
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(_SCHEMA)
+            # Chỉ mục tạo bởi phiên bản cũ chưa có cột disk_size
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(videos)")}
+            if "disk_size" not in columns:
+                self.conn.execute("ALTER TABLE videos ADD COLUMN disk_size INTEGER")
+            self.conn.commit()
+
+    # ------------------------------------------------------------------
+    # Ghi
+    # ------------------------------------------------------------------
+
+    def _upsert_rows(self, rows):
+        placeholders = ", ".join("?" for _ in _COLUMNS)
+        with self.lock:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO videos ({', '.join(_COLUMNS)}) VALUES ({placeholders})",
+                [tuple(row.get(col) for col in _COLUMNS) for row in rows]
+            )
+            self.conn.commit()
+            self.generation += 1
+
+    def _build_row(self, file_name, metadata, file_mtime, file_size, metadata_mtime):
+        camera_id = metadata.get("camera_id")
+        return {
+            "order_id": _order_id_from_file_name(file_name),
+            "file_name": file_name,
+            "camera_name": metadata.get("camera_name"),
+            "camera_id": str(camera_id) if camera_id is not None else None,
+            "start_time": metadata.get("start_time"),
+            "end_time": metadata.get("end_time"),
+            "duration_seconds": metadata.get("duration_seconds"),
+            "file_mtime": file_mtime,
+            "file_size": file_size,
+            "metadata_mtime": metadata_mtime,
+            # Dung lượng thực trên đĩa: playlist .m3u cộng cả thư mục đoạn đi kèm
+            "disk_size": file_size + storage.parts_size(file_name)
+        }
+
+    def add_recording(self, metadata):
+        """
+        Thêm/cập nhật một bản ghi vừa kết thúc (metadata đã được ghi ra Metadata/).
+        Trả về False nếu file video không tồn tại.
+        """
+        file_name = metadata.get("file_name")
+        if not file_name:
+            return False
+        try:
+            stat = os.stat(storage.video_path(file_name))
+            _, metadata_mtime = _read_metadata_file(file_name)
+        except OSError as e:
+            log.warning("[INDEX] Bỏ qua %s: %s", file_name, e)
+            return False
+        self._upsert_rows([self._build_row(file_name, metadata, stat.st_mtime, stat.st_size, metadata_mtime)])
+        return True
+
+    def refresh_files(self, file_names):
+        """Đọc lại stat và metadata của một số video cụ thể (ví dụ các file vừa thay đổi trên ổ đĩa)."""
+        rows = []
+        for file_name in file_names:
+            try:
+                stat = os.stat(storage.video_path(file_name))
+            except OSError:
+                continue
+            metadata, metadata_mtime = _read_metadata_file(file_name)
+            rows.append(self._build_row(file_name, metadata, stat.st_mtime, stat.st_size, metadata_mtime))
+        if rows:
+            self._upsert_rows(rows)
+
+    def remove(self, order_id):
+        self.remove_many([order_id])
+
+    def remove_many(self, order_ids):
+        with self.lock:
+            self.conn.executemany("DELETE FROM videos WHERE order_id = ?", [(o,) for o in order_ids])
+            self.conn.commit()
+            self.generation += 1
+
+    # ------------------------------------------------------------------
+    # Đọc
+    # ------------------------------------------------------------------
+
+    def _where(self, prefix=None, start=None, end=None, camera=None):
+        clauses, params = [], []
+        if prefix:
+            # Dùng khoảng [prefix, prefix + U+FFFF) để SQLite tận dụng chỉ mục khóa chính
+            clauses.append("order_id >= ? AND order_id < ?")
+            params.extend([prefix, prefix + "\uffff"])
+        if start:
+            clauses.append("start_time >= ?")
+            params.append(start.isoformat() if hasattr(start, "isoformat") else start)
+        if end:
+            clauses.append("start_time < ?")
+            params.append(end.isoformat() if hasattr(end, "isoformat") else end)
+        if camera:
+            clauses.append("camera_name = ?")
+            params.append(camera)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def query(self, prefix=None, start=None, end=None, camera=None,
+              order_by="file_mtime", descending=True, limit=None, offset=0):
+        """
+        Tra cứu video. start/end là datetime (hoặc chuỗi ISO) lọc theo start_time.
+        Trả về danh sách dict, mặc định mới nhất lên đầu.
+        """
+        if order_by not in SORTABLE_COLUMNS:
+            order_by = "file_mtime"
+        where, params = self._where(prefix, start, end, camera)
+        sql = f"SELECT * FROM videos{where} ORDER BY {order_by} {'DESC' if descending else 'ASC'}, order_id"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([int(limit), int(offset)])
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def count(self, prefix=None, start=None, end=None, camera=None):
+        where, params = self._where(prefix, start, end, camera)
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM videos{where}", params).fetchone()[0]
+
+    def get(self, order_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM videos WHERE order_id = ?", (order_id,)).fetchone()
+        return dict(row) if row else None
+
+    def get_many(self, order_ids):
+        """Các dòng của những mã đơn cho trước, theo đúng thứ tự order_ids (bỏ qua mã không còn)."""
+        if not order_ids:
+            return []
+        placeholders = ", ".join("?" for _ in order_ids)
+        with self.lock:
+            rows = {
+                row["order_id"]: dict(row) for row in
+                self.conn.execute(f"SELECT * FROM videos WHERE order_id IN ({placeholders})", list(order_ids))
+            }
+        return [rows[order_id] for order_id in order_ids if order_id in rows]
+
+    def oldest(self, limit, before_mtime=None):
+        """Các video cũ nhất (theo file_mtime tăng dần), tùy chọn chỉ lấy video cũ hơn before_mtime."""
+        sql = "SELECT * FROM videos"
+        params = []
+        if before_mtime is not None:
+            sql += " WHERE file_mtime < ?"
+            params.append(before_mtime)
+        sql += " ORDER BY file_mtime ASC, order_id LIMIT ?"
+        params.append(int(limit))
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def partition_rows(self, rel_dir):
+        """Các dòng nằm trong thư mục phân vùng rel_dir (ví dụ "2025/11/01")."""
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(
+                "SELECT * FROM videos WHERE file_name >= ? AND file_name < ?",
+                (f"{rel_dir}/", f"{rel_dir}/\uffff")
+            )]
+
+    def total_size(self):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COALESCE(SUM(COALESCE(disk_size, file_size)), 0) FROM videos"
+            ).fetchone()[0]
+
+    def order_ids(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT order_id FROM videos")]
+
+    def search_fields(self):
+        """(generation, [(order_id, camera_name, start_time)]) - dữ liệu để dựng chỉ mục tìm kiếm."""
+        with self.lock:
+            # Đọc dạng tuple (không qua sqlite3.Row) vì kết quả có thể gồm toàn bộ kho
+            cursor = self.conn.cursor()
+            cursor.row_factory = None
+            return self.generation, cursor.execute("SELECT order_id, camera_name, start_time FROM videos").fetchall()
+
+    def camera_names(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT DISTINCT camera_name FROM videos WHERE camera_name IS NOT NULL ORDER BY camera_name"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    # ------------------------------------------------------------------
+    # Đồng bộ với ổ đĩa
+    # ------------------------------------------------------------------
+
+    def sync_with_disk(self, chunk_size=SYNC_CHUNK_SIZE, on_chunk=None, cancel_event=None):
+        """
+        Đồng bộ tăng dần chỉ mục với Video/ và Metadata/ (duyệt cả các thư mục phân vùng).
+        Chỉ đọc JSON cho video mới/đã thay đổi hoặc metadata đã thay đổi; xóa dòng của file không còn.
+        Các dòng thay đổi được ghi theo từng lô chunk_size; sau mỗi lô gọi on_chunk(số dòng đã ghi)
+        để giao diện cập nhật dần. Nếu cancel_event được set, dừng sau lô hiện tại và trả về None.
+        Trả về (số dòng thêm/cập nhật, số dòng xóa).
+        """
+        with self.lock:
+            known = {
+                row["order_id"]: row for row in
+                self.conn.execute("SELECT order_id, file_name, file_mtime, file_size, metadata_mtime, disk_size FROM videos")
+            }
+
+        # Khóa: đường dẫn tương đối bỏ phần mở rộng ("2025/12/11/Webcam/SPX123")
+        # Nhật ký ngày: mỗi ngày chỉ mở một file; file JSON riêng (kho cũ) chỉ dùng khi không có trong nhật ký
+        journal_records = {}
+        for _, journal_file in metadata_journal.iter_journals():
+            for position, metadata in metadata_journal.read_journal(journal_file).values():
+                journal_records[os.path.splitext(metadata["file_name"])[0]] = (metadata, position)
+        metadata_mtimes = {
+            rel_path[:-5]: stat.st_mtime for rel_path, stat in storage.iter_metadata_files()
+        }
+
+        changed_rows = []
+        changed_count = 0
+        seen = set()
+        for file_name, stat in storage.iter_video_files():
+            if cancel_event is not None and cancel_event.is_set():
+                if changed_rows:
+                    self._upsert_rows(changed_rows)
+                return None
+            order_id = _order_id_from_file_name(file_name)
+            seen.add(order_id)
+            key = os.path.splitext(file_name)[0]
+            journal_metadata, metadata_mtime = journal_records.get(key, (None, metadata_mtimes.get(key)))
+            old = known.get(order_id)
+            if (old and old["file_name"] == file_name and old["file_mtime"] == stat.st_mtime
+                    and old["file_size"] == stat.st_size and old["metadata_mtime"] == metadata_mtime
+                    and old["disk_size"] is not None):
+                continue
+            if journal_metadata:
+                metadata = journal_metadata
+            else:
+                metadata, metadata_mtime = _read_metadata_file(file_name) if metadata_mtime else ({}, None)
+            changed_rows.append(self._build_row(file_name, metadata, stat.st_mtime, stat.st_size, metadata_mtime))
+            if len(changed_rows) >= chunk_size:
+                self._upsert_rows(changed_rows)
+                changed_count += len(changed_rows)
+                changed_rows = []
+                if on_chunk:
+                    on_chunk(changed_count)
+
+        removed = [order_id for order_id in known if order_id not in seen]
+        if changed_rows:
+            self._upsert_rows(changed_rows)
+            changed_count += len(changed_rows)
+        if removed:
+            self.remove_many(removed)
+        self.is_synced = True
+        return changed_count, len(removed)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Trả về chỉ mục dùng chung cho toàn ứng dụng (tạo khi dùng lần đầu)."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = VideoIndex()
+        return _index
+
+
+def start_sync_thread(app, on_done=None):
+    """Đồng bộ chỉ mục với ổ đĩa ở luồng nền, sau đó gọi on_done trên luồng GUI."""
+    def _run():
+        try:
+            added, removed = get_index().sync_with_disk()
+            log.info("[INDEX] Đồng bộ xong: cập nhật %d, xóa %d mục.", added, removed)
+        except Exception as e:
+            log.error("[INDEX] Lỗi khi đồng bộ chỉ mục: %s", e)
+            return
+        if on_done and app.is_running:
+            app.after(0, on_done)
+    threading.Thread(target=_run, daemon=True).start()
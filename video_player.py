@@ -0,0 +1,171 @@
+# video_player.py
+# Bộ giải mã cho trình xem video nhúng trong tab Tra cứu.
+#
+# - Giải mã ở luồng nền; giao diện chỉ lấy khung hình mới nhất (không hàng đợi, không tồn đọng).
+# - Tua dùng chỉ mục tua (thumbnails.load_seek_index): mở đúng đoạn chứa thời điểm cần tới,
+#   không giải mã từ đầu video. Chỉ mục được nạp (hoặc dựng, mở từng đoạn bằng cv2 nếu chưa có
+#   trong bộ nhớ đệm) ở luồng giải mã; giao diện chỉ cho tua sau khi ready được set.
+# - Khung hình được thu nhỏ về kích thước khung hiển thị TRƯỚC khi đổi màu BGR->RGB và tạo
+#   ảnh PIL, nên chi phí chuyển đổi tỉ lệ với kích thước widget chứ không phải độ phân giải gốc.
+
+import time
+import threading
+import cv2
+from PIL import Image
+from . import config, storage, thumbnails
+
+
+class PreviewDecoder:
+    """Giải mã một video (file đơn hoặc playlist nhiều đoạn) cho trình xem nhúng."""
+
+    def __init__(self, rel_file, target_size=(640, 360)):
+        self.rel_file = rel_file
+        # Nạp ở luồng giải mã (_run); duration = 0 cho tới khi ready được set
+        self.seek_index = None
+        self.duration = 0.0
+        self.ready = threading.Event()
+        self.target_size = target_size
+
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = False
+        self.paused = False
+        self.seek_request = 0.0
+
+        # Khung hình mới nhất đã sẵn sàng hiển thị
+        self.frame_image = None
+        self.frame_serial = 0
+        self.position = 0.0
+
+        self.cap = None
+        self.segment_number = -1
+        self.frame_number = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    # --- Điều khiển (gọi từ luồng GUI) ---
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+        self.wake.set()
+
+    def seek(self, seconds):
+        """Tua tới thời điểm seconds. Nhiều lệnh liên tiếp (kéo thanh trượt) chỉ thực hiện lệnh cuối."""
+        with self.lock:
+            self.seek_request = min(max(float(seconds), 0.0), self.duration)
+        self.wake.set()
+
+    def set_paused(self, paused):
+        self.paused = paused
+        self.wake.set()
+
+    def latest_frame(self):
+        """Trả về (serial, ảnh PIL, vị trí giây) của khung hình mới nhất."""
+        with self.lock:
+            return self.frame_serial, self.frame_image, self.position
+
+    # --- Luồng giải mã ---
+
+    def _open_segment(self, segment_number, frame_number):
+        segments = self.seek_index["segments"]
+        if segment_number != self.segment_number or self.cap is None:
+            if self.cap is not None:
+                self.cap.release()
+            self.cap = cv2.VideoCapture(storage.video_path(segments[segment_number]["path"]))
+            self.segment_number = segment_number
+            self.frame_number = 0
+        if frame_number != self.frame_number:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+            self.frame_number = frame_number
+
+    def _do_seek(self, seconds):
+        segments = self.seek_index["segments"]
+        segment_number = 0
+        for i, segment in enumerate(segments):
+            if segment["start"] <= seconds:
+                segment_number = i
+            else:
+                break
+        segment = segments[segment_number]
+        frame_number = int((seconds - segment["start"]) * segment["fps"])
+        frame_number = min(max(frame_number, 0), max(segment["frames"] - 1, 0))
+        self._open_segment(segment_number, frame_number)
+
+    def _read_frame(self):
+        """Đọc khung tiếp theo, tự chuyển sang đoạn kế khi hết đoạn. Trả về khung hoặc None khi hết video."""
+        segments = self.seek_index["segments"]
+        while self.cap is not None:
+            ok, frame = self.cap.read()
+            if ok and frame is not None:
+                self.frame_number += 1
+                return frame
+            if self.segment_number + 1 >= len(segments):
+                return None
+            self._open_segment(self.segment_number + 1, 0)
+        return None
+
+    def _publish(self, frame):
+        segment = self.seek_index["segments"][self.segment_number]
+        position = segment["start"] + max(self.frame_number - 1, 0) / (segment["fps"] or config.FPS)
+
+        # Thu nhỏ giữ tỉ lệ về khung hiển thị trước khi chuyển màu/tạo ảnh
+        h, w = frame.shape[:2]
+        target_w, target_h = self.target_size
+        scale = min(target_w / w, target_h / h)
+        size = (max(1, int(w * scale)), max(1, int(h * scale)))
+        if size != (w, h):
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+        with self.lock:
+            self.frame_image = image
+            self.frame_serial += 1
+            self.position = position
+
+    def _run(self):
+        try:
+            self.seek_index = thumbnails.load_seek_index(self.rel_file)
+            self.duration = self.seek_index["duration"]
+            self.ready.set()
+            if not self.seek_index["segments"]:
+                return
+            next_frame_at = time.monotonic()
+            while not self.stopped:
+                with self.lock:
+                    seek_to, self.seek_request = self.seek_request, None
+                if seek_to is not None:
+                    self._do_seek(seek_to)
+                    frame = self._read_frame()
+                    if frame is not None:
+                        self._publish(frame)
+                    next_frame_at = time.monotonic()
+                    continue
+
+                if self.paused:
+                    self.wake.wait(0.2)
+                    self.wake.clear()
+                    continue
+
+                frame = self._read_frame()
+                if frame is None:
+                    # Hết video: dừng ở khung cuối
+                    self.paused = True
+                    continue
+                self._publish(frame)
+
+                fps = self.seek_index["segments"][self.segment_number]["fps"] or config.FPS
+                next_frame_at += 1 / fps
+                delay = next_frame_at - time.monotonic()
+                if delay > 0:
+                    self.wake.wait(delay)
+                    self.wake.clear()
+                else:
+                    # Không kịp tốc độ gốc: không cố đuổi theo (tránh dồn khung)
+                    next_frame_at = time.monotonic()
+        except Exception as e:
+            print(f"[PLAYER] Lỗi khi giải mã {self.rel_file}: {e}")
+        finally:
+            if self.cap is not None:
+                self.cap.release()